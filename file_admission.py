@@ -0,0 +1,100 @@
+import threading
+from typing import Dict, Optional
+
+"""
+* AdmissionControl membatasi jumlah request yang sedang dilayani plus
+yang menunggu worker; request di atas batas itu langsung dijawab
+BUSY dengan petunjuk retry_after, bukan ditumpuk di antrean executor
+
+* command berat (UPLOAD, MUPLOAD) punya batas konkurensi sendiri yang lebih
+kecil, sehingga beberapa upload besar tidak menghabiskan semua worker
+dan LIST/GET yang murah tetap terlayani
+
+* retry_after diperkirakan dari rata-rata waktu layanan (EWMA) dan
+panjang antrean saat ini
+"""
+
+BUSY = 'BUSY'
+HEAVY_COMMANDS = ('UPLOAD', 'UPLOAD_AT', 'MUPLOAD', 'DELTA')
+
+MIN_RETRY_AFTER = 0.05
+MAX_RETRY_AFTER = 5.0
+# bobot sampel baru pada rata-rata waktu layanan
+EWMA_WEIGHT = 0.2
+
+
+class AdmissionControl:
+    def __init__(self, max_inflight: int, max_queued: int, max_uploads: Optional[int] = None,
+                 semaphore=threading.BoundedSemaphore):
+        self.max_inflight = max(1, max_inflight)
+        self.max_queued = max(0, max_queued)
+        self.max_uploads = max_uploads
+        self._uploads = semaphore(max_uploads) if max_uploads else None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._service_time = {'default': 0.0, 'upload': 0.0}
+        self.shed = 0
+
+    @property
+    def pending(self) -> int:
+        return self._pending
+
+    def try_admit(self) -> bool:
+        """Reserve a slot for one request; False when in-flight + queued is full."""
+        with self._lock:
+            if self._pending >= self.max_inflight + self.max_queued:
+                self.shed += 1
+                return False
+            self._pending += 1
+            return True
+
+    def done(self, duration: float = None) -> None:
+        with self._lock:
+            self._pending -= 1
+            if duration is not None:
+                self._observe('default', duration)
+
+    def enter(self, command: str) -> bool:
+        """Per-command limit, checked once the request header is known."""
+        if command not in HEAVY_COMMANDS or self._uploads is None:
+            return True
+        if self._uploads.acquire(False):
+            return True
+        with self._lock:
+            self.shed += 1
+        return False
+
+    def leave(self, command: str, duration: float = None) -> None:
+        if command not in HEAVY_COMMANDS or self._uploads is None:
+            return
+        self._uploads.release()
+        if duration is not None:
+            with self._lock:
+                self._observe('upload', duration)
+
+    def _observe(self, kind: str, duration: float) -> None:
+        # Caller holds the lock.
+        average = self._service_time[kind]
+        self._service_time[kind] = duration if not average else average + EWMA_WEIGHT * (duration - average)
+
+    def retry_after(self, command: str = None) -> float:
+        """Rough time until a slot frees up: queue ahead of us x mean service time."""
+        with self._lock:
+            if command in HEAVY_COMMANDS and self._uploads is not None:
+                estimate = self._service_time['upload']
+            else:
+                waiting = max(0, self._pending - self.max_inflight) + 1
+                estimate = waiting * self._service_time['default'] / self.max_inflight
+        return round(min(MAX_RETRY_AFTER, max(MIN_RETRY_AFTER, estimate)), 3)
+
+    def busy_response(self, command: str = None) -> Dict:
+        return {'status': BUSY, 'data': 'Server busy, retry later', 'retry_after': self.retry_after(command)}
+
+    def stats(self) -> Dict:
+        return {
+            'pending': self._pending,
+            'max_inflight': self.max_inflight,
+            'max_queued': self.max_queued,
+            'max_uploads': self.max_uploads,
+            'shed': self.shed,
+        }
@@ -0,0 +1,209 @@
+import argparse
+import itertools
+import os
+import shlex
+import signal
+import socket
+import subprocess
+import sys
+import time
+
+from file_client_cli import FileClient
+from file_trace import percentile
+
+"""
+* file_benchmark menjalankan matriks stress test tanpa input():
+operasi x ukuran file x client worker x server worker x executor
+
+* untuk setiap konfigurasi server, FileServer dijalankan sebagai
+subprocess di loopback lalu dihentikan lagi; jumlah server worker
+yang dicatat adalah yang benar-benar dipakai saat start; opsi server
+lainnya (admission, trace, cache) diteruskan lewat --server-arg
+
+* setiap sel dipanaskan dulu (putaran warm-up tidak dicatat), lalu
+diulang beberapa kali dan ditulis sebagai satu baris CSV dengan
+p50/p95/p99 latensi, throughput agregat dan waktu wall clock
+"""
+
+SERVER_SCRIPT = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'file_server.py')
+STARTUP_TIMEOUT = 15.0
+SHUTDOWN_TIMEOUT = 10.0
+
+
+class LocalServer:
+    """FileServer di subprocess pada loopback, hidup selama blok with."""
+
+    def __init__(self, worker_type, workers, host='127.0.0.1', port=6677, log_path='benchmark_server.log',
+                 extra_args=(), cwd=None):
+        self.worker_type = worker_type
+        self.workers = workers
+        self.host = host
+        self.port = port
+        self.log_path = log_path
+        self.extra_args = list(extra_args)
+        # server_files relatif ke cwd: beberapa server lokal butuh direktori sendiri
+        self.cwd = cwd
+        self.proc = None
+
+    def __enter__(self):
+        log = open(self.log_path, 'a')
+        try:
+            self.proc = subprocess.Popen(
+                [sys.executable, SERVER_SCRIPT, '--worker-type', self.worker_type,
+                 '--workers', str(self.workers), '--host', self.host, '--port', str(self.port)] + self.extra_args,
+                stdout=log, stderr=subprocess.STDOUT, cwd=self.cwd)
+        finally:
+            log.close()
+        try:
+            self._wait_ready()
+        except Exception:
+            self.stop()
+            raise
+        return self
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def _wait_ready(self):
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            if self.proc.poll() is not None:
+                raise RuntimeError(f"Server exited with code {self.proc.returncode}, see {self.log_path}")
+            try:
+                socket.create_connection((self.host, self.port), timeout=0.5).close()
+                return
+            except OSError:
+                time.sleep(0.1)
+        raise RuntimeError(f"Server did not start within {STARTUP_TIMEOUT} s")
+
+    def stop(self):
+        if self.proc is None or self.proc.poll() is not None:
+            return
+        # SIGINT = Ctrl-C: server menutup worker dan mencatat statistik akhir
+        self.proc.send_signal(signal.SIGINT)
+        try:
+            self.proc.wait(SHUTDOWN_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            self.proc.kill()
+            self.proc.wait()
+
+
+class BenchmarkRunner:
+    def __init__(self, operations, sizes, client_workers, server_workers, executors, runs=3, warmup=1,
+                 host='127.0.0.1', port=6677, csv_filename='stress_test_matrix.csv', compression=None,
+                 dedup=False, server_args=(), delta=False, cache_mb=0):
+        self.operations = operations
+        self.sizes = sizes
+        self.client_workers = client_workers
+        self.server_workers = server_workers
+        self.executors = executors
+        self.runs = runs
+        self.warmup = warmup
+        self.host = host
+        self.port = port
+        self.csv_filename = csv_filename
+        self.compression = compression
+        self.dedup = dedup
+        self.delta = delta
+        self.cache_mb = cache_mb
+        self.server_args = server_args
+
+    def run(self):
+        for executor, server_workers in itertools.product(self.executors, self.server_workers):
+            with LocalServer(executor, server_workers, self.host, self.port, extra_args=self.server_args):
+                # every measured run repeats the same file: dedup and delta would turn an
+                # upload into a hash or a near-empty DELTA, the download cache a download
+                # into NOT_MODIFIED plus a local copy
+                client = FileClient(self.host, self.port, dedup=self.dedup, compression=self.compression,
+                                    csv_filename=self.csv_filename, delta=self.delta, cache_mb=self.cache_mb)
+                try:
+                    for operation in self.operations:
+                        # LIST tidak bergantung pada ukuran file
+                        sizes = self.sizes if operation != 'list' else [0]
+                        for size_mb, client_workers in itertools.product(sizes, self.client_workers):
+                            self._run_cell(client, operation, size_mb, client_workers, executor, server_workers)
+                finally:
+                    client.close()
+
+    def _prepare_items(self, client, operation, size_mb, workers):
+        if operation == 'list':
+            return [None] * workers
+        filepath = client.generate_dummy_file(size_mb)
+        if filepath is None:
+            raise RuntimeError(f"Cannot create {size_mb} MB dummy file")
+        if operation == 'upload':
+            return [filepath] * workers
+        # download: pastikan file-nya ada di server
+        if client.upload_file(filepath)['status'] != 'OK':
+            raise RuntimeError(f"Cannot seed {os.path.basename(filepath)} on the server")
+        return [os.path.basename(filepath)] * workers
+
+    def _run_cell(self, client, operation, size_mb, client_workers, executor, server_workers):
+        # server asyncio tetap diuji dengan client berbasis thread
+        client_executor = 'process' if executor == 'process' else 'thread'
+        items = self._prepare_items(client, operation, size_mb, client_workers)
+
+        for _ in range(self.warmup):
+            client._reset_stats()
+            client.run_operation(operation, items, client_executor, client_workers)
+
+        client._reset_stats()
+        client.operation_stats.update({
+            'operation': operation,
+            'file_size_mb': size_mb,
+            'client_pool_size': client_workers,
+            'server_pool_size': server_workers,
+            'executor_type': executor,
+        })
+        for _ in range(self.runs):
+            client.run_operation(operation, items, client_executor, client_workers)
+        client._save_to_csv()
+
+        stats = client.operation_stats
+        durations = stats['durations']
+        aggregate = stats['bytes'] / stats['wall_time'] if stats['wall_time'] > 0 else 0
+        print(f"{operation:8} {size_mb:>5} MB  client={client_workers:<3} server={server_workers:<3} "
+              f"{executor:8} ok={stats['success_count']:<4} fail={stats['fail_count']:<3} "
+              f"p50={percentile(durations, 50):.4f}s p95={percentile(durations, 95):.4f}s "
+              f"p99={percentile(durations, 99):.4f}s agg={aggregate / (1024*1024):.2f} MB/s "
+              f"wall={stats['wall_time'] / max(stats['runs'], 1):.3f}s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Run the stress test matrix against a local FileServer')
+    parser.add_argument('--operations', nargs='+', choices=['upload', 'download', 'list'],
+                        default=['upload', 'download'], help='Operations to measure')
+    parser.add_argument('--sizes', nargs='+', type=int, default=[10, 50, 100],
+                        help='File sizes in MB')
+    parser.add_argument('--client-workers', nargs='+', type=int, default=[1, 5, 50],
+                        help='Client worker pool sizes')
+    parser.add_argument('--server-workers', nargs='+', type=int, default=[1, 5, 50],
+                        help='Server worker pool sizes')
+    parser.add_argument('--executors', nargs='+', choices=['thread', 'process', 'asyncio'],
+                        default=['thread', 'process'],
+                        help='Executor type, used for both the server workers and the client pool')
+    parser.add_argument('--runs', type=int, default=3, help='Measured runs per cell')
+    parser.add_argument('--warmup', type=int, default=1, help='Unrecorded warm-up runs per cell')
+    parser.add_argument('--host', default='127.0.0.1', help='Loopback address for the local server')
+    parser.add_argument('--port', type=int, default=6677, help='Port for the local server')
+    parser.add_argument('--csv', default='stress_test_matrix.csv', help='Output CSV file')
+    parser.add_argument('--compression', choices=['zlib'], default=None, help='Offer per-chunk compression')
+    parser.add_argument('--dedup', action='store_true',
+                        help='Allow hash-first deduplicated uploads (measures dedup, not transfer)')
+    parser.add_argument('--delta', action='store_true',
+                        help='Allow delta uploads of files the server already has (measures delta, not transfer)')
+    parser.add_argument('--cache-mb', type=int, default=0,
+                        help='Client download cache size; 0 = off (a cache measures local copies, not transfer)')
+    parser.add_argument('--server-arg', action='append', default=[], metavar='ARGS',
+                        help='Extra file_server.py options, repeatable; use the = form, '
+                             'e.g. --server-arg="--max-queued 64" --server-arg=--trace-file=trace.jsonl')
+
+    args = parser.parse_args()
+    if min(args.client_workers + args.server_workers) < 1 or args.runs < 1:
+        parser.error('worker counts and --runs must be at least 1')
+
+    BenchmarkRunner(args.operations, args.sizes, args.client_workers, args.server_workers, args.executors,
+                    runs=args.runs, warmup=args.warmup, host=args.host, port=args.port,
+                    csv_filename=args.csv, compression=args.compression, dedup=args.dedup,
+                    delta=args.delta, cache_mb=args.cache_mb,
+                    server_args=[token for arg in args.server_arg for token in shlex.split(arg)]).run()
@@ -0,0 +1,106 @@
+import os
+import threading
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, Tuple
+
+"""
+* ContentCache menyimpan isi file (dan respon yang sudah di-encode)
+yang sering diminta, dibatasi total ukurannya dengan kebijakan LRU
+
+* entry dikunci dengan (path, jenis) dan divalidasi dengan
+(mtime, size, inode) sehingga file yang berubah di disk tidak
+pernah terlayani dari cache lama
+
+* beberapa miss bersamaan untuk entry yang sama digabung menjadi
+satu kali baca dari disk
+"""
+
+
+def file_validator(path: str) -> Tuple[int, int, int]:
+    st = os.stat(path)
+    return st.st_mtime_ns, st.st_size, st.st_ino
+
+
+class ContentCache:
+    def __init__(self, max_bytes: int = 256*1024*1024, max_entry_bytes: int = None):
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes if max_entry_bytes is not None else max_bytes // 4
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._lock = threading.Lock()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+
+    def get(self, path: str, kind: str, loader: Callable[[], bytes]):
+        """Return the cached value for (path, kind), calling loader() on a miss."""
+        key = (path, kind)
+        validator = file_validator(path)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] == validator:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[1]
+
+            pending = self._inflight.get(key)
+            if pending is not None and pending[0] == validator:
+                self.coalesced += 1
+                future = pending[1]
+                owner = False
+            else:
+                self.misses += 1
+                future = Future()
+                self._inflight[key] = (validator, future)
+                owner = True
+
+        if not owner:
+            return future.result()
+
+        try:
+            value = loader()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                if self._inflight.get(key, (None, None))[1] is future:
+                    del self._inflight[key]
+        future.set_result(value)
+        self._store(key, validator, value)
+        return value
+
+    def _store(self, key: Hashable, validator: Tuple[int, int, int], value) -> None:
+        size = len(value)
+        if size > self.max_entry_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= len(old[1])
+            self._entries[key] = (validator, value)
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self.current_bytes -= len(evicted)
+                self.evictions += 1
+
+    def invalidate(self, path: str) -> None:
+        with self._lock:
+            for key in [key for key in self._entries if key[0] == path]:
+                self.current_bytes -= len(self._entries.pop(key)[1])
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'coalesced': self.coalesced,
+                'evictions': self.evictions,
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+            }
@@ -1,6 +1,8 @@
 import socket
 import os
+import io
 import base64
+import hashlib
 import logging
 import json
 from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
@@ -8,13 +10,151 @@ import time
 import statistics
 import csv
 from datetime import datetime
+from collections import deque
+import threading
+import random
+import mmap
+
+import file_delta
+import file_wire
+from file_download_cache import DownloadCache
+from file_trace import percentile
+
+RETRY_DELAY = 0.5
+# backoff saat server menjawab BUSY: retry_after dari server + jitter acak
+# hingga BUSY_BASE_DELAY * 2^percobaan (maksimal BUSY_MAX_DELAY)
+BUSY_BASE_DELAY = 0.1
+BUSY_MAX_DELAY = 5.0
+# banyak file kecil digabung jadi satu MGET/MUPLOAD per worker: minimal
+# BATCH_MIN_FILES file, masing-masing paling besar BATCH_SMALL_FILE byte
+BATCH_MIN_FILES = 4
+BATCH_SMALL_FILE = 1024*1024
+BATCH_MAX_FILES = 256
+# upload delta (rsync) untuk file yang sudah ada di server, mulai ukuran ini;
+# delta dibatalkan bila literalnya melebihi DELTA_MAX_LITERAL dari ukuran file
+DELTA_MIN_SIZE = 1024*1024
+DELTA_MAX_LITERAL = 0.5
+# UPLOAD_HASH 'pending': isi yang sama sedang diunggah client lain; tunggu
+# selama upload itu masih maju, dan kirim sendiri bila sudah sekian detik
+# tanpa progress. Jeda antar tanya berlipat dua hingga COALESCE_MAX_DELAY
+COALESCE_WAIT = 30.0
+COALESCE_MAX_DELAY = 1.0
+CSV_COLUMNS = [
+    'Timestamp',
+    'Operation',
+    'File Size (MB)',
+    'Client Workers',
+    'Server Workers',
+    'Executor Type',
+    'Success Count',
+    'Fail Count',
+    'Total Time (s)',
+    'Avg Throughput (bytes/s)',
+    'Compression',
+    'Avg Wire Throughput (bytes/s)',
+    'Runs',
+    'p50 Latency (s)',
+    'p95 Latency (s)',
+    'p99 Latency (s)',
+    'Aggregate Throughput (bytes/s)',
+    'Wall Time (s)',
+    'Server Success',
+    'Server Fail',
+]
+
+
+class ServerBusy(Exception):
+    """Server menolak request karena penuh; response berisi retry_after."""
+
+    def __init__(self, response):
+        super().__init__(response.get('data', 'Server busy'))
+        self.response = response
+        self.retry_after = response.get('retry_after') or 0
+
+
+class PooledConnection:
+    def __init__(self, sock, server_info):
+        self.sock = sock
+        self.max_requests = server_info.get('max_requests') or float('inf')
+        self.idle_timeout = server_info.get('idle_timeout')
+        self.served = 0
+        self.answered = 0
+        self.closing = False
+        self.last_used = time.monotonic()
+
+    @property
+    def remaining(self):
+        return self.max_requests - self.served
+
+    def expired(self, now):
+        # sisakan margin supaya tidak balapan dengan idle timeout server
+        return self.idle_timeout is not None and now - self.last_used >= self.idle_timeout * 0.8
+
+    def close(self):
+        try:
+            self.sock.close()
+        except OSError:
+            pass
+
+
+class ConnectionPool:
+    """Pool koneksi biner keep-alive yang aman dipakai bersama oleh banyak thread."""
+
+    def __init__(self, connect, max_idle=16):
+        self._connect = connect
+        self._idle = deque()
+        self._lock = threading.Lock()
+        self.max_idle = max_idle
+
+    def acquire(self):
+        """Kembalikan (koneksi, reused); koneksi hangat dipakai lebih dulu."""
+        now = time.monotonic()
+        with self._lock:
+            while self._idle:
+                conn = self._idle.pop()
+                if not conn.expired(now):
+                    return conn, True
+                conn.close()
+        return PooledConnection(*self._connect()), False
+
+    def release(self, conn):
+        if conn.closing or conn.remaining <= 0:
+            conn.close()
+            return
+        conn.last_used = time.monotonic()
+        with self._lock:
+            if len(self._idle) < self.max_idle:
+                self._idle.append(conn)
+                return
+        conn.close()
+
+    def close(self):
+        with self._lock:
+            while self._idle:
+                self._idle.pop().close()
+
 
 class FileClient:
-    def __init__(self, server_host='172.16.16.101', server_port=6677):
+    def __init__(self, server_host='172.16.16.101', server_port=6677, protocol='binary', max_retries=3,
+                 segment_size=8*1024*1024, segment_workers=1, dedup=True, compression=None,
+                 csv_filename='stress_test_results.csv', busy_retries=8, batch=True,
+                 delta=True, cache_mb=256):
         self.server_host = server_host
         self.server_port = server_port
+        self.protocol = protocol
+        self.max_retries = max_retries
+        self.busy_retries = busy_retries
+        self.segment_size = segment_size
+        self.segment_workers = segment_workers
+        self.dedup = dedup
+        self.compression = compression
+        self.batch = batch
+        self.delta = delta
+        self._digests = {}
+        self._remote_sizes = {}
+        self.server_info = None
         self.operation_stats = {}
-        self.csv_filename = 'stress_test_results.csv'
+        self.csv_filename = csv_filename
         self._reset_stats()
         self._init_csv()
 
@@ -28,23 +168,47 @@ class FileClient:
 
         os.makedirs('downloaded_files', exist_ok=True)
         os.makedirs('upload_files', exist_ok=True)
+        self.download_cache = (DownloadCache(os.path.join('downloaded_files', '.cache'), cache_mb * 1024 * 1024)
+                               if cache_mb else None)
+        self._pool = ConnectionPool(self._open_binary)
+
+    def __getstate__(self):
+        # ProcessPoolExecutor mem-pickle FileClient; socket di pool tidak ikut
+        state = self.__dict__.copy()
+        del state['_pool']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._pool = ConnectionPool(self._open_binary)
+
+    def close(self):
+        self._pool.close()
+        if self.download_cache is not None:
+            self.download_cache.close()
+
+    def set_compression(self, codec):
+        """Ganti codec yang ditawarkan; koneksi lama dinegosiasikan ulang."""
+        if codec != self.compression:
+            self.compression = codec
+            self._pool.close()
         
     def _init_csv(self):
         if not os.path.exists(self.csv_filename):
+            with open(self.csv_filename, 'w', newline='') as f:
+                csv.writer(f).writerow(CSV_COLUMNS)
+            return
+
+        # file dari versi lama: tambahkan kolom baru, baris lama dibiarkan kosong
+        with open(self.csv_filename, newline='') as f:
+            rows = list(csv.reader(f))
+        header = rows[0] if rows else []
+        if header != CSV_COLUMNS and header == CSV_COLUMNS[:len(header)]:
             with open(self.csv_filename, 'w', newline='') as f:
                 writer = csv.writer(f)
-                writer.writerow([
-                    'Timestamp',
-                    'Operation',
-                    'File Size (MB)',
-                    'Client Workers',
-                    'Server Workers',
-                    'Executor Type',
-                    'Success Count',
-                    'Fail Count',
-                    'Total Time (s)',
-                    'Avg Throughput (bytes/s)'
-                ])
+                writer.writerow(CSV_COLUMNS)
+                for row in rows[1:]:
+                    writer.writerow(row + [''] * (len(CSV_COLUMNS) - len(row)))
 
     def _reset_stats(self):
         self.operation_stats = {
@@ -57,11 +221,19 @@ class FileClient:
             'fail_count': 0,
             'durations': [],
             'throughputs': [],
-            'results': []
+            'wire_throughputs': [],
+            'results': [],
+            'runs': 0,
+            'wall_time': 0.0,
+            'bytes': 0,
+            # hasil yang dicatat server selama putaran (None = tidak tersedia)
+            'server_success': None,
+            'server_fail': None
         }
 
     def _save_to_csv(self):
         stats = self.operation_stats
+        runs = max(stats['runs'], 1)
         with open(self.csv_filename, 'a', newline='') as f:
             writer = csv.writer(f)
             writer.writerow([
@@ -74,8 +246,18 @@ class FileClient:
                 stats['executor_type'],
                 stats['success_count'],
                 stats['fail_count'],
-                sum(stats['durations']) if stats['durations'] else 0,
-                statistics.mean(stats['throughputs']) if stats['throughputs'] else 0
+                sum(stats['durations']) / runs if stats['durations'] else 0,
+                statistics.mean(stats['throughputs']) if stats['throughputs'] else 0,
+                self._codec() or 'none',
+                statistics.mean(stats['wire_throughputs']) if stats['wire_throughputs'] else 0,
+                runs,
+                percentile(stats['durations'], 50),
+                percentile(stats['durations'], 95),
+                percentile(stats['durations'], 99),
+                stats['bytes'] / stats['wall_time'] if stats['wall_time'] > 0 else 0,
+                stats['wall_time'] / runs,
+                '' if stats['server_success'] is None else stats['server_success'],
+                '' if stats['server_fail'] is None else stats['server_fail']
             ])
 
     def _display_results(self):
@@ -99,19 +281,43 @@ class FileClient:
         print(f"4. Jumlah server worker pool: {stats['server_pool_size']}")
         
         if stats['durations']:
-            total_time = sum(stats['durations'])
+            total_time = sum(stats['durations']) / max(stats['runs'], 1)
             avg_throughput = statistics.mean(stats['throughputs'])
             print(f"5. Waktu total per client: {total_time:.4f} detik")
+            print(f"   Latensi p50/p95/p99: {percentile(stats['durations'], 50):.4f} / "
+                  f"{percentile(stats['durations'], 95):.4f} / {percentile(stats['durations'], 99):.4f} detik")
             print(f"6. Throughput per client: {avg_throughput:.2f} bytes/detik")
+            if stats['wall_time'] > 0:
+                print(f"   Throughput agregat: {stats['bytes'] / stats['wall_time']:.2f} bytes/detik"
+                      f" (wall clock {stats['wall_time']:.4f} detik)")
+            if self._codec() and stats['wire_throughputs']:
+                avg_wire = statistics.mean(stats['wire_throughputs'])
+                ratio = avg_wire / avg_throughput if avg_throughput else 0
+                print(f"   Throughput jaringan ({self._codec()}): {avg_wire:.2f} bytes/detik"
+                      f" ({ratio:.0%} dari ukuran asli)")
         else:
             print("5. Waktu total per client: N/A")
             print("6. Throughput per client: N/A")
             
         print(f"7. Client workers - Sukses: {stats['success_count']}, Gagal: {stats['fail_count']}")
-        print(f"8. Server workers - Sukses: {stats['success_count']}, Gagal: {stats['fail_count']}")
+        if stats['server_success'] is not None:
+            print(f"8. Server workers - Sukses: {stats['server_success']}, Gagal: {stats['server_fail']}")
+        else:
+            print("8. Server workers - Sukses: N/A, Gagal: N/A")
         print("="*30)
 
+    def _busy_delay(self, attempt, retry_after):
+        # jitter supaya klien yang ditolak bersamaan tidak kembali bersamaan pula
+        return retry_after + random.uniform(0, min(BUSY_MAX_DELAY, BUSY_BASE_DELAY * 2 ** attempt))
+
     def send_command(self, command_str=""):
+        for attempt in range(self.busy_retries + 1):
+            response = self._send_command_once(command_str)
+            if response.get('status') != 'BUSY' or attempt == self.busy_retries:
+                return response
+            time.sleep(self._busy_delay(attempt, response.get('retry_after') or 0))
+
+    def _send_command_once(self, command_str):
         sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
         sock.settimeout(300)
 
@@ -140,36 +346,600 @@ class FileClient:
         finally:
             sock.close()
 
-    def list_files(self):
-        response = self.send_command("LIST")
-        if response and response.get('status') == 'OK':
-            files = response.get('data', [])
-            if files:
-                print("\nDaftar File:")
-                for i, filename in enumerate(files, 1):
-                    print(f"{i}. {filename}")
+    def _open_binary(self):
+        # Timeout pendek hanya untuk handshake pertama (mendeteksi server lama);
+        # setelah server terbukti paham protokol biner, server yang sibuk ditunggu.
+        timeout = 300 if self.server_info is not None else 5
+        sock = socket.create_connection((self.server_host, self.server_port), timeout=timeout)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        try:
+            sock.sendall(file_wire.MAGIC)
+            hello = {'version': file_wire.PROTOCOL_VERSION}
+            if self.compression:
+                hello['codecs'] = [self.compression]
+            file_wire.send_json(sock, file_wire.OP_HELLO, hello)
+            opcode, _, _, payload = file_wire.recv_frame(sock)
+            response = file_wire.decode_json(payload)
+            if response.get('status') == 'BUSY':
+                raise ServerBusy(response)
+            if opcode != file_wire.OP_OK:
+                raise file_wire.ProtocolError(response.get('data', 'HELLO rejected'))
+            sock.settimeout(300)
+            self.server_info = response.get('data') or {}
+            return sock, self.server_info
+        except Exception:
+            sock.close()
+            raise
+
+    def _codec(self):
+        """Codec hasil negosiasi HELLO, atau None bila kompresi tidak dipakai."""
+        if not self.compression or not self.server_info:
+            return None
+        return self.server_info.get('codec')
+
+    def _get_flags(self):
+        return file_wire.FLAG_CHUNKED if self._codec() else 0
+
+    def _request(self, exchange, retry_stale=True):
+        """
+        Jalankan exchange(conn) di koneksi dari pool. Koneksi hangat yang ternyata
+        sudah ditutup server dicoba ulang sekali di koneksi baru (kecuali
+        retry_stale=False, untuk transfer yang melanjutkan sendiri). None berarti
+        server hanya paham protokol teks. Jawaban BUSY diulang dengan backoff;
+        bila tetap BUSY, ServerBusy diteruskan ke pemanggil.
+        """
+        for attempt in range(self.busy_retries + 1):
+            try:
+                return self._request_once(exchange, retry_stale)
+            except ServerBusy as e:
+                if attempt == self.busy_retries:
+                    raise
+                time.sleep(self._busy_delay(attempt, e.retry_after))
+
+    def _request_once(self, exchange, retry_stale):
+        for attempt in range(2):
+            try:
+                conn, reused = self._pool.acquire()
+            except (socket.timeout, file_wire.ProtocolError) as e:
+                if self.server_info is not None:
+                    raise
+                # server lama tidak mengenal MAGIC: turun ke protokol teks
+                self.logger.warning(f"Negosiasi protokol biner gagal ({e}), memakai protokol teks")
+                self.protocol = 'text'
+                return None
+            conn.answered = 0
+            try:
+                result = exchange(conn)
+            except (file_wire.ConnectionClosed, ConnectionError):
+                conn.close()
+                if retry_stale and reused and attempt == 0 and not conn.answered:
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+            self._pool.release(conn)
+            return result
+
+    def _read_response(self, conn, save_path=None, progress=None, truncate=True):
+        opcode, flags, _, size = file_wire.recv_header(conn.sock)
+        conn.answered += 1
+        if flags & file_wire.FLAG_CLOSE:
+            conn.closing = True
+        if flags & file_wire.FLAG_JSON:
+            return self._json_response(conn, size)
+        status = 'OK' if opcode == file_wire.OP_OK else 'ERROR'
+        etag = None
+        if flags & file_wire.FLAG_ETAG:
+            etag, prefix = file_wire.recv_etag(conn.sock)
+            size -= prefix
+        offset, total = 0, size
+        if flags & file_wire.FLAG_RANGE:
+            offset, total = file_wire.RANGE.unpack(file_wire.recv_exact(conn.sock, file_wire.RANGE.size))
+            size -= file_wire.RANGE.size
+        if progress is not None:
+            progress['total'] = total
+        chunked = flags & file_wire.FLAG_CHUNKED
+        if save_path is None:
+            if not chunked:
+                return {'status': status, 'content': file_wire.recv_exact(conn.sock, size), 'wire_bytes': size,
+                        'etag': etag}
+            buf = io.BytesIO()
+            wire = file_wire.recv_chunks_to_file(conn.sock, buf, size)
+            return {'status': status, 'content': buf.getvalue(), 'wire_bytes': wire, 'etag': etag}
+        # body langsung ditulis ke disk per chunk; truncate=False untuk segmen
+        # yang ditulis di tempatnya pada file yang sudah dialokasikan
+        with open(save_path, 'wb' if truncate and not offset else 'r+b') as f:
+            if offset:
+                f.seek(offset)
+            if truncate and offset:
+                f.truncate()
+            if chunked:
+                wire = file_wire.recv_chunks_to_file(conn.sock, f, size)
             else:
-                print("Tidak ada file di server.")
-            return files
-        else:
-            print("Gagal mendapatkan daftar file.")
+                file_wire.recv_to_file(conn.sock, f, size)
+                wire = size
+        return {'status': status, 'file_size': total, 'wire_bytes': wire, 'etag': etag}
+
+    def _json_response(self, conn, size):
+        response = file_wire.decode_json(file_wire.recv_exact(conn.sock, size))
+        if response.get('status') == 'BUSY':
+            # koneksi ditutup oleh _request: respon pipeline berikutnya belum terbaca
+            raise ServerBusy(response)
+        return response
+
+    def send_pipeline(self, requests):
+        """
+        Kirim beberapa request biner (command, name, payload, save_path) tanpa
+        menunggu respon masing-masing, lalu baca semua respon berurutan.
+        """
+        responses = []
+        while len(responses) < len(requests):
+            pending = requests[len(responses):]
+
+            def exchange(conn):
+                batch = pending[:max(1, min(len(pending), conn.remaining))]
+                for command, name, payload, _ in batch:
+                    flags = self._get_flags() if command == 'GET' else 0
+                    file_wire.send_frame(conn.sock, file_wire.OPCODES[command], name, payload, flags)
+                    conn.served += 1
+                results = []
+                for _, _, _, save_path in batch:
+                    results.append(self._read_response(conn, save_path))
+                    if conn.closing:
+                        break
+                return results
+
+            try:
+                results = self._request(exchange)
+            except ServerBusy as e:
+                results = [e.response] * len(pending)
+            except Exception as e:
+                results = [{'status': 'ERROR', 'data': str(e)}] * len(pending)
+            if results is None:
+                return None
+            responses.extend(results)
+        return responses
+
+    def send_frame_command(self, command, name='', payload=b''):
+        """Kirim satu request biner; respon file dikembalikan di key 'content'."""
+        responses = self.send_pipeline([(command, name, payload, None)])
+        return responses[0] if responses is not None else None
+
+    def _download_binary(self, filename, save_path, if_none_match=None):
+        """
+        GET ber-range; bila koneksi putus di tengah, lanjutkan dari byte yang
+        sudah tertulis. Dengan if_none_match (string, '' = tanpa syarat) respon
+        membawa etag, dan validator yang masih cocok dijawab NOT_MODIFIED.
+        """
+        progress = {'offset': 0, 'total': None}
+
+        def exchange(conn):
+            payload = file_wire.RANGE.pack(progress['offset'], 0)
+            flags = self._get_flags()
+            if if_none_match is not None:
+                flags |= file_wire.FLAG_ETAG
+                # a resumed transfer is already committed to the new content
+                if not progress['offset']:
+                    payload += if_none_match.encode('utf-8')
+            file_wire.send_frame(conn.sock, file_wire.OP_GET, filename, payload, flags)
+            conn.served += 1
+            return self._read_response(conn, save_path, progress)
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._request(exchange, retry_stale=False)
+            except ServerBusy as e:
+                return e.response
+            except (OSError, file_wire.ProtocolError) as e:
+                if attempt == self.max_retries:
+                    return {'status': 'ERROR', 'data': str(e)}
+                if progress['total'] is not None:
+                    progress['offset'] = os.path.getsize(save_path)
+                    self.logger.warning(f"Download {filename} terputus di byte {progress['offset']}, melanjutkan")
+                time.sleep(RETRY_DELAY * attempt)
+
+    def _fetch_segment(self, filename, save_path, offset, length, progress=None):
+        def exchange(conn):
+            file_wire.send_frame(conn.sock, file_wire.OP_GET, filename, file_wire.RANGE.pack(offset, length),
+                                 self._get_flags())
+            conn.served += 1
+            return self._read_response(conn, save_path, progress, truncate=False)
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                return self._request(exchange)
+            except ServerBusy as e:
+                return e.response
+            except (OSError, file_wire.ProtocolError) as e:
+                if attempt == self.max_retries:
+                    return {'status': 'ERROR', 'data': str(e)}
+                time.sleep(RETRY_DELAY * attempt)
+
+    def download_segmented(self, filename, save_path, segment_size=None, concurrency=None):
+        """
+        Unduh satu file sebagai beberapa range yang diambil paralel lewat koneksi
+        terpisah dan ditulis langsung ke posisinya, lalu cocokkan SHA-256-nya.
+        """
+        segment_size = segment_size or self.segment_size
+        concurrency = concurrency or self.segment_workers
+
+        # segmen pertama sekaligus memberi tahu ukuran total file
+        open(save_path, 'wb').close()
+        progress = {'total': None}
+        first = self._fetch_segment(filename, save_path, 0, segment_size, progress)
+        if first is None or first.get('status') != 'OK':
+            os.remove(save_path)
+            return first
+        total = progress['total']
+        if total <= segment_size:
+            return first
+
+        with open(save_path, 'r+b') as f:
+            f.truncate(total)
+        offsets = range(segment_size, total, segment_size)
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            results = list(executor.map(
+                lambda offset: self._fetch_segment(filename, save_path, offset, segment_size), offsets))
+        failed = [r for r in results if r is None or r.get('status') != 'OK']
+        if failed:
+            return failed[0] or {'status': 'ERROR', 'data': 'Segment download failed'}
+        wire_bytes = first['wire_bytes'] + sum(r['wire_bytes'] for r in results)
+
+        expected = self.send_frame_command('CHECKSUM', filename)
+        if not expected or expected.get('status') != 'OK':
+            return expected or {'status': 'ERROR', 'data': 'Checksum unavailable'}
+        digest = hashlib.sha256()
+        with open(save_path, 'rb') as f:
+            for chunk in iter(lambda: f.read(1024*1024), b''):
+                digest.update(chunk)
+        if digest.hexdigest() != expected['sha256']:
+            return {'status': 'ERROR', 'data': f'Checksum mismatch for {filename}'}
+        return {'status': 'OK', 'file_size': total, 'segments': len(offsets) + 1, 'wire_bytes': wire_bytes}
+
+    def download_many(self, filenames, worker_id=None):
+        """Unduh banyak file lewat satu koneksi keep-alive dengan pipelining."""
+        requests = []
+        for filename in filenames:
+            save_filename = f"{worker_id}_{filename}" if worker_id is not None else filename
+            requests.append(('GET', filename, b'', os.path.join('downloaded_files', save_filename)))
+        return self.send_pipeline(requests)
+
+    def _read_batch(self, conn, worker_id=None):
+        opcode, flags, _, size = file_wire.recv_header(conn.sock)
+        conn.answered += 1
+        if flags & file_wire.FLAG_CLOSE:
+            conn.closing = True
+        if flags & file_wire.FLAG_JSON:
+            return self._json_response(conn, size)
+        entries = []
+        while size:
+            status, name, length = file_wire.recv_entry(conn.sock)
+            size -= file_wire.ENTRY.size + len(name.encode('utf-8')) + length
+            if status != file_wire.ENTRY_OK:
+                message = file_wire.recv_exact(conn.sock, length).decode('utf-8')
+                entries.append({'name': name, 'status': 'ERROR', 'data': message})
+                continue
+            save_filename = f"{worker_id}_{name}" if worker_id is not None else name
+            with open(os.path.join('downloaded_files', os.path.basename(save_filename)), 'wb') as f:
+                file_wire.recv_to_file(conn.sock, f, length)
+            entries.append({'name': name, 'status': 'OK', 'file_size': length})
+        return {'status': 'OK' if opcode == file_wire.OP_OK else 'ERROR', 'data': entries}
+
+    def download_batch(self, filenames, worker_id=None):
+        """
+        Unduh banyak file dengan satu request MGET; data berisi status per
+        file. None bila server hanya paham protokol teks.
+        """
+        def exchange(conn):
+            file_wire.send_json(conn.sock, file_wire.OP_MGET, list(filenames))
+            conn.served += 1
+            return self._read_batch(conn, worker_id)
+
+        try:
+            return self._request(exchange)
+        except ServerBusy as e:
+            return e.response
+        except (OSError, file_wire.ProtocolError) as e:
+            return {'status': 'ERROR', 'data': str(e)}
+
+    def upload_batch(self, filepaths):
+        """
+        Unggah banyak file dengan satu request MUPLOAD (tanpa kompresi dan
+        tanpa hash-first); data berisi status per file.
+        """
+        def exchange(conn):
+            # the frame length is fixed by the sizes taken here
+            files = [(path, os.path.basename(path), os.path.getsize(path)) for path in filepaths]
+            total = sum(file_wire.ENTRY.size + len(name.encode('utf-8')) + size for _, name, size in files)
+            conn.sock.sendall(file_wire.pack_header(file_wire.OP_MUPLOAD, b'', total))
+            conn.served += 1
+            for path, name, size in files:
+                conn.sock.sendall(file_wire.pack_entry(name, size))
+                with open(path, 'rb') as f:
+                    if size and conn.sock.sendfile(f, 0, size) != size:
+                        raise file_wire.ProtocolError(f'File {name} changed during upload')
+            return self._read_response(conn)
+
+        try:
+            return self._request(exchange)
+        except ServerBusy as e:
+            return e.response
+        except (OSError, file_wire.ProtocolError) as e:
+            return {'status': 'ERROR', 'data': str(e)}
+
+    def _upload_committed(self, name, upload_id):
+        response = self.send_frame_command('UPLOAD_STATUS', name, upload_id)
+        return response['committed'] if response and response.get('status') == 'OK' else None
+
+    def _file_digest(self, filepath):
+        """SHA-256 file lokal, diingat selama file tidak berubah."""
+        st = os.stat(filepath)
+        key = (os.path.abspath(filepath), st.st_mtime_ns, st.st_size)
+        digest = self._digests.get(key)
+        if digest is None:
+            h = hashlib.sha256()
+            with open(filepath, 'rb') as f:
+                for chunk in iter(lambda: f.read(1024*1024), b''):
+                    h.update(chunk)
+            digest = self._digests[key] = h.hexdigest()
+        return digest
+
+    def _upload_hash(self, send):
+        """
+        UPLOAD_HASH lewat send(); selama server menjawab 'pending' (isi yang
+        sama sedang diunggah worker lain) tanya lagi, sehingga upload kembar
+        cukup di-link ke hasilnya dan isinya hanya ditulis sekali. Menyerah
+        hanya bila upload itu COALESCE_WAIT detik tanpa progress.
+        """
+        started = time.monotonic()
+        delay = None
+        while True:
+            response = send()
+            if not response or not response.get('pending'):
+                return response
+            # server lama tidak mengirim idle: batasi total waktu tunggu
+            idle = response.get('idle', time.monotonic() - started)
+            if idle >= COALESCE_WAIT:
+                return response
+            retry_after = response.get('retry_after', BUSY_BASE_DELAY)
+            delay = retry_after if delay is None else min(max(delay * 2, retry_after), COALESCE_MAX_DELAY)
+            time.sleep(delay)
+
+    def _upload_binary(self, filepath, digest=None):
+        """UPLOAD_AT yang bisa dilanjutkan dari ukuran yang sudah di-commit server."""
+        name = os.path.basename(filepath)
+        upload_id = os.urandom(16)
+        total = os.path.getsize(filepath)
+        offset = 0
+
+        if digest is not None:
+            # hash dulu: isi yang sudah ada di server tidak perlu dikirim ulang
+            response = self._upload_hash(lambda: self.send_frame_command(
+                'UPLOAD_HASH', name, file_wire.UPLOAD_HASH.pack(bytes.fromhex(digest), total)))
+            if response is None or response.get('dedup'):
+                return response
+
+        if self.delta and total >= DELTA_MIN_SIZE:
+            response = self._upload_delta(filepath, digest or self._file_digest(filepath))
+            if response is not None:
+                return response
+
+        sent = {'wire_bytes': 0}
+
+        def exchange(conn):
+            count = total - offset
+            codec = self._codec()
+            flags = file_wire.FLAG_CHUNKED if codec else 0
+            with open(filepath, 'rb') as f:
+                conn.sock.sendall(file_wire.pack_header(file_wire.OP_UPLOAD_AT, name.encode('utf-8'),
+                                                        file_wire.UPLOAD_AT.size + count, flags)
+                                  + file_wire.UPLOAD_AT.pack(offset, total, upload_id))
+                conn.served += 1
+                if codec:
+                    f.seek(offset)
+                    encoder = file_wire.ChunkEncoder(codec)
+                    try:
+                        file_wire.send_chunks(conn.sock, f, count, encoder)
+                    finally:
+                        sent['wire_bytes'] += encoder.wire_bytes
+                elif count:
+                    conn.sock.sendfile(f, offset, count)
+                    sent['wire_bytes'] += count
+            return self._read_response(conn)
+
+        for attempt in range(self.max_retries + 1):
+            try:
+                response = self._request(exchange, retry_stale=False)
+                if response is not None:
+                    response['wire_bytes'] = sent['wire_bytes']
+                return response
+            except ServerBusy as e:
+                return e.response
+            except (OSError, file_wire.ProtocolError) as e:
+                if attempt == self.max_retries:
+                    return {'status': 'ERROR', 'data': str(e)}
+                time.sleep(RETRY_DELAY * attempt)
+                committed = self._upload_committed(name, upload_id)
+                if committed is not None:
+                    offset = committed
+                self.logger.warning(f"Upload {name} terputus, melanjutkan dari byte {offset}")
+
+    def _upload_delta(self, filepath, digest):
+        """
+        Upload rsync: ambil signature blok salinan server, lalu kirim hanya
+        literal plus referensi blok. None bila server belum punya file ini,
+        delta tidak menghemat cukup banyak, atau server menolak hasilnya;
+        pemanggil lalu mengunggah file utuh.
+        """
+        name = os.path.basename(filepath)
+        response = self.send_frame_command('SIGNATURE', name)
+        if not response or response.get('status') != 'OK':
+            return None
+        total = os.path.getsize(filepath)
+        try:
+            block_size, base_size, blocks = file_delta.parse_signature(response['content'])
+            with open(filepath, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                plan = file_delta.compute_delta(data, block_size, blocks, base_size,
+                                                int(total * DELTA_MAX_LITERAL))
+        except (OSError, ValueError) as e:
+            self.logger.warning(f"Delta {name} gagal dihitung ({e}), mengunggah utuh")
+            return None
+        if plan is None:
+            return None
+
+        def exchange(conn):
+            header = (file_wire.pack_header(file_wire.OP_DELTA, name.encode('utf-8'), plan.payload_len())
+                      + file_wire.DELTA.pack(bytes.fromhex(digest), total, block_size))
+            conn.served += 1
+            pending = bytearray(header)
+            with open(filepath, 'rb') as f:
+                for kind, start, length in plan.ops:
+                    if kind == file_wire.DELTA_COPY:
+                        pending += file_wire.DELTA_OP.pack(kind, start, length)
+                        continue
+                    conn.sock.sendall(pending + file_wire.DELTA_OP.pack(kind, 0, length))
+                    pending = bytearray()
+                    if conn.sock.sendfile(f, start, length) != length:
+                        raise file_wire.ProtocolError(f'File {name} changed during upload')
+            if pending:
+                conn.sock.sendall(pending)
+            return self._read_response(conn)
+
+        try:
+            response = self._request(exchange)
+        except ServerBusy as e:
+            return e.response
+        except (OSError, file_wire.ProtocolError) as e:
+            self.logger.warning(f"Upload delta {name} gagal ({e}), mengunggah utuh")
+            return None
+        if not response or response.get('status') != 'OK':
+            return None
+        response['wire_bytes'] = plan.payload_len()
+        return response
+
+    def list_page(self, prefix='', cursor=None, limit=100, sort='name', order='asc', detail=True):
+        """Satu halaman LIST; lanjutkan dengan cursor=response['next_cursor']."""
+        options = {'prefix': prefix, 'cursor': cursor, 'limit': limit, 'sort': sort, 'order': order,
+                   'detail': detail}
+        options = {key: value for key, value in options.items() if value not in ('', None)}
+        response = None
+        if self.protocol == 'binary':
+            response = self.send_frame_command('LIST', '', json.dumps(options).encode('utf-8'))
+        if response is None:
+            response = self.send_command("LIST " + ' '.join(f"{key}={value}" for key, value in options.items()))
+        return response
+
+    def iter_files(self, **options):
+        """Semua entry di server, diambil halaman per halaman."""
+        cursor = None
+        while True:
+            response = self.list_page(cursor=cursor, **options)
+            if not response or response.get('status') != 'OK':
+                raise RuntimeError(response.get('data') if response else 'No response')
+            yield from response.get('data', [])
+            cursor = response.get('next_cursor')
+            if not cursor:
+                return
+
+    def list_files(self, prefix=''):
+        try:
+            entries = list(self.iter_files(prefix=prefix))
+        except Exception as e:
+            print(f"Gagal mendapatkan daftar file: {e}")
             return []
+        if not entries:
+            print("Tidak ada file di server.")
+            return []
+        print("\nDaftar File:")
+        files = []
+        for i, entry in enumerate(entries, 1):
+            if isinstance(entry, dict):  # server lama hanya mengirim nama
+                print(f"{i}. {entry['name']} ({entry['size']/(1024*1024):.2f} MB)")
+                self._remote_sizes[entry['name']] = entry['size']
+                files.append(entry['name'])
+            else:
+                print(f"{i}. {entry}")
+                files.append(entry)
+        return files
+
+    def _cache_key(self, filename):
+        return f"{self.server_host}:{self.server_port}/{filename}"
+
+    def _download_cached(self, filename, save_path, fetch, saved=True):
+        """
+        fetch(etag) dengan validator salinan di cache ('' bila belum ada).
+        NOT_MODIFIED disalin dari cache tanpa transfer (respon ber-'cached');
+        bila fetch sudah menulis save_path (saved), unduhan baru langsung
+        disimpan ke cache.
+        """
+        key = self._cache_key(filename)
+        etag = self.download_cache.lookup(key)
+        response = fetch(etag or '')
+        if response and response.get('status') == file_wire.NOT_MODIFIED:
+            file_size = self.download_cache.restore(key, save_path)
+            if file_size is not None:
+                return {'status': 'OK', 'file_size': file_size, 'wire_bytes': 0, 'cached': True}
+            response = fetch('')  # cached copy vanished meanwhile
+        if saved and response and response.get('status') == 'OK' and response.get('etag'):
+            self.download_cache.store(key, response['etag'], save_path)
+        return response
 
     def download_file(self, filename, worker_id=None):
-        start = time.time()
-        response = self.send_command(f"GET {filename}")
+        start = time.perf_counter()
+        # Save the downloaded file with worker ID if provided
+        save_filename = f"{worker_id}_{filename}" if worker_id is not None else filename
+        save_path = os.path.join('downloaded_files', save_filename)
+
+        if self.protocol == 'binary':
+            if self.segment_workers > 1:
+                response = self.download_segmented(filename, save_path)
+            elif self.download_cache is None:
+                response = self._download_binary(filename, save_path)
+            else:
+                response = self._download_cached(
+                    filename, save_path, lambda etag: self._download_binary(filename, save_path, etag))
+            if response is not None:
+                if response.get('status') != 'OK':
+                    return {'status': 'ERROR', 'error': response.get('data')}
+                duration = time.perf_counter() - start
+                file_size = response['file_size']
+                wire_bytes = response.get('wire_bytes', file_size)
+                return {
+                    'status': 'OK',
+                    'duration': duration,
+                    'throughput': file_size / duration if duration > 0 else 0,
+                    'file_size': file_size,
+                    'wire_bytes': wire_bytes,
+                    'wire_throughput': wire_bytes / duration if duration > 0 else 0,
+                    'cached': bool(response.get('cached'))
+                }
+
+        if self.download_cache is None:
+            response = self.send_command(f"GET {filename}")
+        else:
+            response = self._download_cached(filename, save_path, lambda etag: self.send_command(
+                f"GET {filename} if-none-match {etag}" if etag else f"GET {filename}"), saved=False)
 
+        if response and response.get('cached'):
+            duration = time.perf_counter() - start
+            return {
+                'status': 'OK',
+                'duration': duration,
+                'throughput': response['file_size'] / duration if duration > 0 else 0,
+                'file_size': response['file_size'],
+                'cached': True
+            }
         if response and response.get('status') == 'OK':
             try:
                 file_data = base64.b64decode(response.get('data_file', ''))
-                duration = time.time() - start
+                duration = time.perf_counter() - start
                 file_size = len(file_data)
                 
-                # Save the downloaded file with worker ID if provided
-                save_filename = f"{worker_id}_{filename}" if worker_id is not None else filename
-                save_path = os.path.join('downloaded_files', save_filename)
                 with open(save_path, 'wb') as f:
                     f.write(file_data)
+                if self.download_cache is not None and response.get('etag'):
+                    self.download_cache.store(self._cache_key(filename), response['etag'], save_path)
                 
                 return {
                     'status': 'OK', 
@@ -182,26 +952,67 @@ class FileClient:
         return {'status': 'ERROR'}
 
     def upload_file(self, filepath, worker_id=None):
-        start = time.time()
+        start = time.perf_counter()
         try:
-            with open(filepath, 'rb') as f:
-                content = base64.b64encode(f.read()).decode('ascii')
-            
-            response = self.send_command(f"UPLOAD {os.path.basename(filepath)} {content}")
-            duration = time.time() - start
+            name = os.path.basename(filepath)
             size = os.path.getsize(filepath)
+            digest = self._file_digest(filepath) if self.dedup else None
+            response = None
+            if self.protocol == 'binary':
+                response = self._upload_binary(filepath, digest)
+            if response is None and digest is not None:
+                response = self._upload_hash(lambda: self.send_command(f"UPLOAD_HASH {name} {digest} {size}"))
+                if not response.get('dedup'):
+                    response = None
+            if response is None:
+                with open(filepath, 'rb') as f:
+                    content = base64.b64encode(f.read()).decode('ascii')
+                response = self.send_command(f"UPLOAD {name} {content}")
+            duration = time.perf_counter() - start
             
             if response and response.get('status') == 'OK':
+                # unggahan teks/dedup tidak melewati codec; byte di wire = ukuran asli
+                wire_bytes = response.get('wire_bytes', 0 if response.get('dedup') else size)
                 return {
                     'status': 'OK',
                     'duration': duration,
                     'throughput': size / duration if duration > 0 else 0,
-                    'file_size': size
+                    'file_size': size,
+                    'dedup': bool(response.get('dedup')),
+                    'delta': bool(response.get('delta')),
+                    'wire_bytes': wire_bytes,
+                    'wire_throughput': wire_bytes / duration if duration > 0 else 0
                 }
             return {'status': 'ERROR'}
         except Exception as e:
             return {'status': 'ERROR', 'error': str(e)}
 
+    def server_stats(self):
+        """Snapshot STATS dari server (dict), atau None bila server tidak menyediakannya."""
+        response = None
+        if self.protocol == 'binary':
+            response = self.send_frame_command('STATS')
+        if response is None:
+            response = self.send_command("STATS")
+        if response.get('status') != 'OK':
+            return None
+        return response.get('data')
+
+    def _server_totals(self):
+        try:
+            stats = self.server_stats()
+        except Exception:
+            return None
+        return stats['totals'] if stats else None
+
+    def delete_file(self, filename):
+        response = None
+        if self.protocol == 'binary':
+            response = self.send_frame_command('DELETE', filename)
+        if response is None:
+            response = self.send_command(f"DELETE {filename}")
+        return response
+
     def generate_dummy_file(self, size_mb):
         filename = f"dummy_{size_mb}MB.bin"
         filepath = os.path.join('upload_files', filename)
@@ -218,13 +1029,120 @@ class FileClient:
             print(f"Gagal membuat file dummy: {str(e)}")
             return None
 
+    def _list_timed(self):
+        start = time.perf_counter()
+        try:
+            count = sum(1 for _ in self.iter_files())
+        except Exception as e:
+            return {'status': 'ERROR', 'error': str(e)}
+        return {'status': 'OK', 'duration': time.perf_counter() - start, 'throughput': 0, 'file_size': 0,
+                'entries': count}
+
+    def _batch_task(self, operation, items, worker_id=None):
+        start = time.perf_counter()
+        if operation == 'download':
+            response = self.download_batch(items, worker_id)
+        else:
+            response = self.upload_batch(items)
+        if response is None:
+            # server teks: file satu per satu, dihitung sebagai satu batch
+            results = [dict(self._worker_task(operation, item, worker_id), name=os.path.basename(item))
+                       for item in items]
+            response = {'status': 'OK', 'data': results}
+        if response.get('status') != 'OK':
+            return {'status': 'ERROR', 'error': response.get('data'), 'failed': len(items)}
+        ok = [entry for entry in response['data'] if entry['status'] == 'OK']
+        if operation == 'upload':
+            sizes = dict((os.path.basename(path), os.path.getsize(path)) for path in items)
+            file_size = sum(sizes.get(entry.get('name'), 0) for entry in ok)
+        else:
+            file_size = sum(entry.get('file_size', 0) for entry in ok)
+        duration = time.perf_counter() - start
+        return {
+            'status': 'OK',
+            'duration': duration,
+            'throughput': file_size / duration if duration > 0 else 0,
+            'file_size': file_size,
+            'files': len(ok),
+            'failed': len(items) - len(ok)
+        }
+
+    def _file_size(self, operation, item):
+        if operation == 'upload':
+            return os.path.getsize(item)
+        return self._remote_sizes.get(item)
+
+    def _plan_batches(self, operation, items, workers):
+        """
+        Banyak file kecil: bagi items menjadi satu kelompok per worker (dipecah
+        per BATCH_MAX_FILES) yang masing-masing dikirim sebagai satu MGET/MUPLOAD.
+        Selain itu items dikembalikan apa adanya.
+        """
+        if (not self.batch or self.protocol != 'binary' or self.compression
+                or operation not in ('download', 'upload')):
+            return items
+        per_worker = -(-len(items) // max(1, workers))
+        if per_worker < BATCH_MIN_FILES:
+            return items
+        for item in set(items):
+            size = self._file_size(operation, item)
+            if size is None or size > BATCH_SMALL_FILE:
+                return items
+        step = min(per_worker, BATCH_MAX_FILES)
+        return [items[i:i + step] for i in range(0, len(items), step)]
+
     def _worker_task(self, operation, item, worker_id=None):
+        if isinstance(item, list):
+            return self._batch_task(operation, item, worker_id)
         if operation == 'download':
             return self.download_file(item, worker_id)
         elif operation == 'upload':
             return self.upload_file(item, worker_id)
+        elif operation == 'list':
+            return self._list_timed()
         return {'status': 'ERROR'}
 
+    def run_operation(self, operation, items, worker_type='thread', workers=1):
+        """
+        Jalankan satu putaran tanpa input(): setiap item dikerjakan oleh executor
+        berukuran workers. Hasil ditambahkan ke operation_stats, jadi beberapa
+        putaran berturut-turut terkumpul jadi satu baris CSV.
+        """
+        if worker_type == 'thread':
+            executor = ThreadPoolExecutor(max_workers=workers)
+        else:
+            executor = ProcessPoolExecutor(max_workers=workers)
+
+        stats = self.operation_stats
+        before = self._server_totals()
+        start = time.perf_counter()
+        with executor:
+            futures = [executor.submit(self._worker_task, operation, item, i)
+                      for i, item in enumerate(self._plan_batches(operation, items, workers))]
+            
+            for future in as_completed(futures):
+                result = future.result()
+                stats['results'].append(result)
+                if result['status'] == 'OK':
+                    # satu batch MGET/MUPLOAD menghitung setiap file
+                    stats['success_count'] += result.get('files', 1)
+                    stats['fail_count'] += result.get('failed', 0)
+                    stats['durations'].append(result['duration'])
+                    stats['throughputs'].append(result['throughput'])
+                    stats['bytes'] += result.get('file_size', 0)
+                    if 'wire_throughput' in result:
+                        stats['wire_throughputs'].append(result['wire_throughput'])
+                else:
+                    stats['fail_count'] += result.get('failed', 1)
+        stats['wall_time'] += time.perf_counter() - start
+        stats['runs'] += 1
+        after = self._server_totals() if before is not None else None
+        if after is not None:
+            # selisih total server (MGET/MUPLOAD per file), termasuk request klien lain yang berjalan bersamaan
+            errors = after['errors'] - before['errors']
+            stats['server_success'] = (stats['server_success'] or 0) + after['requests'] - before['requests'] - errors
+            stats['server_fail'] = (stats['server_fail'] or 0) + errors
+
     def perform_operation(self, operation, worker_type='thread', workers=1, server_pool_size=0):
         self._reset_stats()
         self.operation_stats.update({
@@ -269,25 +1187,7 @@ class FileClient:
                 print("Gagal membuat file dummy.")
                 return
 
-        if worker_type == 'thread':
-            executor = ThreadPoolExecutor(max_workers=workers)
-        else:
-            executor = ProcessPoolExecutor(max_workers=workers)
-
-        with executor:
-            futures = [executor.submit(self._worker_task, operation, item, i) 
-                      for i, item in enumerate(items)]
-            
-            for future in as_completed(futures):
-                result = future.result()
-                self.operation_stats['results'].append(result)
-                if result['status'] == 'OK':
-                    self.operation_stats['success_count'] += 1
-                    self.operation_stats['durations'].append(result['duration'])
-                    self.operation_stats['throughputs'].append(result['throughput'])
-                else:
-                    self.operation_stats['fail_count'] += 1
-
+        self.run_operation(operation, items, worker_type, workers)
         self._display_results()
         self._save_to_csv()
 
@@ -312,21 +1212,36 @@ def show_menu():
     print("2. Processes")
     executor = input("Pilih executor (1-2): ").strip()
     worker_type = 'thread' if executor == '1' else 'process'
+
+    segments = 1
+    if operation == 'download':
+        segments = int(input("\nSegmen paralel per file (default 1 = tanpa segmen): ") or 1)
+
+    compression = None
+    if operation in ('download', 'upload'):
+        if input("\nKompresi zlib per chunk? (y/n, default n): ").strip().lower() == 'y':
+            compression = 'zlib'
     
     return {
         'operation': operation,
         'server_pool_size': server_workers,
         'client_pool_size': client_workers,
-        'worker_type': worker_type
+        'worker_type': worker_type,
+        'segments': segments,
+        'compression': compression
     }
 
 if __name__ == '__main__':
-    client = FileClient()
+    # stress test: upload/download ulang file yang sama harus tetap mengirim isinya
+    client = FileClient(dedup=False, delta=False, cache_mb=0)
     
     while True:
         params = show_menu()
         if not params:
             continue
+
+        client.segment_workers = params['segments']
+        client.set_compression(params['compression'])
             
         client.perform_operation(
             operation=params['operation'],
@@ -337,4 +1252,5 @@ if __name__ == '__main__':
         
         if input("\nLanjutkan testing? (y/n): ").lower() != 'y':
             print(f"\nSemua hasil tes telah disimpan di: {client.csv_filename}")
+            client.close()
             break
\ No newline at end of file
@@ -0,0 +1,454 @@
+import argparse
+import base64
+import bisect
+import hashlib
+import heapq
+import os
+import random
+import tempfile
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import ExitStack
+
+from file_benchmark import LocalServer
+from file_client_cli import FileClient
+
+"""
+* file_cluster membagi namespace ke beberapa FileServer (misalnya
+beberapa port di satu mesin): setiap nama file dimiliki node yang
+dipilih consistent hashing, jadi kapasitas tidak lagi terbatas pada
+satu proses dan satu disk
+
+* setiap node ditaruh di ring sebanyak VNODES titik (hash blake2b dari
+"host:port#i"); pemilik sebuah nama adalah node pertama searah jarum
+jam dari hash nama itu, replika adalah node berbeda berikutnya
+
+* ClusterClient adalah FileClient yang mengarahkan GET/UPLOAD/DELETE
+langsung ke node pemilik lewat satu FileClient per node; LIST
+dikirim ke semua node sekaligus lalu hasilnya digabung sesuai urutan
+
+* dengan replikasi N, upload dan delete dikirim ke semua replika,
+sedangkan download memilih replika secara acak dan pindah ke replika
+berikutnya bila gagal
+
+* menambah node hanya memindahkan nama yang pemiliknya berubah (kira-kira
+1/(jumlah node) dari semua file); rebalance membaca isi setiap node,
+menyalin file ke pemilik barunya lalu menghapusnya dari node lama;
+salinannya singgah di direktori sementara, bukan downloaded_files
+
+* dijalankan langsung: serve menyalakan satu FileServer per node di
+direktori masing-masing, rebalance memindahkan file setelah node
+ditambah atau dikosongkan, stress menjalankan operasi lewat cluster
+"""
+
+VNODES = 128
+DEFAULT_ROOT = 'cluster_nodes'
+
+
+def _hash(key):
+    return int.from_bytes(hashlib.blake2b(key.encode('utf-8'), digest_size=8).digest(), 'big')
+
+
+def parse_node(node):
+    """'host:port' -> (host, port)."""
+    host, _, port = node.rpartition(':')
+    return host, int(port)
+
+
+def _entry_name(entry):
+    return entry['name'] if isinstance(entry, dict) else entry  # server lama hanya mengirim nama
+
+
+def _entry_key(entry, sort):
+    # sama dengan SORT_KEYS di file_index, jadi cursor server berlaku di halaman gabungan
+    if sort == 'name' or not isinstance(entry, dict):
+        return (_entry_name(entry),)
+    return (entry[sort], entry['name'])
+
+
+class HashRing:
+    def __init__(self, nodes=(), vnodes=VNODES):
+        self.vnodes = vnodes
+        self.nodes = []
+        self._points = []
+        self._owners = []
+        for node in nodes:
+            self.add(node)
+
+    def add(self, node):
+        if node in self.nodes:
+            return
+        self.nodes.append(node)
+        for i in range(self.vnodes):
+            point = _hash(f'{node}#{i}')
+            j = bisect.bisect(self._points, point)
+            self._points.insert(j, point)
+            self._owners.insert(j, node)
+
+    def remove(self, node):
+        self.nodes.remove(node)
+        kept = [(point, owner) for point, owner in zip(self._points, self._owners) if owner != node]
+        self._points = [point for point, _ in kept]
+        self._owners = [owner for _, owner in kept]
+
+    def owners(self, key, replicas=1):
+        """Node pemilik key lalu replikanya, tanpa node yang sama dua kali."""
+        count = min(replicas, len(self.nodes))
+        found = []
+        start = bisect.bisect(self._points, _hash(key))
+        for step in range(len(self._points)):
+            node = self._owners[(start + step) % len(self._points)]
+            if node not in found:
+                found.append(node)
+                if len(found) == count:
+                    break
+        return found
+
+
+class ClusterClient(FileClient):
+    def __init__(self, nodes, replicas=1, vnodes=VNODES, **options):
+        host, port = parse_node(nodes[0])
+        super().__init__(host, port, **options)
+        self.replicas = replicas
+        self.ring = HashRing(nodes, vnodes)
+        self._options = options
+        self.nodes = {}
+        for node in nodes:
+            self._connect(node)
+
+    def _connect(self, node):
+        host, port = parse_node(node)
+        # cache unduhan dan digest lokal dipakai bersama; kunci cache memuat host:port
+        client = FileClient(host, port, **dict(self._options, cache_mb=0))
+        client.download_cache = self.download_cache
+        client._digests = self._digests
+        client._remote_sizes = self._remote_sizes
+        self.nodes[node] = client
+
+    def close(self):
+        for client in self.nodes.values():
+            client.close()
+        super().close()
+
+    def set_compression(self, codec):
+        for client in self.nodes.values():
+            client.set_compression(codec)
+        super().set_compression(codec)
+
+    def add_node(self, node):
+        """Masukkan node ke ring; file baru pindah ke sana setelah rebalance()."""
+        if node not in self.nodes:
+            self._connect(node)
+        self.ring.add(node)
+
+    def remove_node(self, node):
+        """Keluarkan node dari ring; klien-nya tetap ada agar rebalance() bisa mengosongkannya."""
+        self.ring.remove(node)
+
+    def _fan_out(self, func, nodes=None):
+        """[(node, func(node))] untuk setiap node, dijalankan paralel."""
+        nodes = list(self.ring.nodes if nodes is None else nodes)
+        if len(nodes) <= 1:
+            return [(node, func(node)) for node in nodes]
+        with ThreadPoolExecutor(max_workers=len(nodes)) as pool:
+            return list(zip(nodes, pool.map(func, nodes)))
+
+    def _read_order(self, filename):
+        # replika dimulai dari posisi acak agar pembacaan tersebar
+        owners = self.ring.owners(filename, self.replicas)
+        start = random.randrange(len(owners))
+        return owners[start:] + owners[:start]
+
+    def download_file(self, filename, worker_id=None):
+        result = {'status': 'ERROR'}
+        for node in self._read_order(filename):
+            result = dict(self.nodes[node].download_file(filename, worker_id), node=node)
+            if result['status'] == 'OK':
+                break
+        return result
+
+    def upload_file(self, filepath, worker_id=None):
+        start = time.perf_counter()
+        owners = self.ring.owners(os.path.basename(filepath), self.replicas)
+        results = self._fan_out(lambda node: self.nodes[node].upload_file(filepath, worker_id), owners)
+        failed = [f"{node}: {result.get('error')}" for node, result in results if result['status'] != 'OK']
+        if failed:
+            return {'status': 'ERROR', 'error': '; '.join(failed)}
+        if len(results) == 1:
+            return dict(results[0][1], node=owners[0])
+        # file_size dihitung sekali; wire_bytes menjumlahkan semua replika
+        duration = time.perf_counter() - start
+        result = results[0][1]
+        wire_bytes = sum(r.get('wire_bytes', 0) for _, r in results)
+        return dict(result, duration=duration, throughput=result['file_size'] / duration if duration > 0 else 0,
+                    dedup=all(r.get('dedup') for _, r in results), wire_bytes=wire_bytes,
+                    wire_throughput=wire_bytes / duration if duration > 0 else 0, node=owners[0], replicas=owners)
+
+    def delete_file(self, filename):
+        owners = self.ring.owners(filename, self.replicas)
+        responses = [response for _, response in self._fan_out(lambda node: self.nodes[node].delete_file(filename),
+                                                                 owners)]
+        errors = [response for response in responses if not response or response.get('status') != 'OK']
+        return errors[0] if errors else responses[0]
+
+    def download_batch(self, filenames, worker_id=None):
+        groups = defaultdict(list)
+        for filename in filenames:
+            groups[self._read_order(filename)[0]].append(filename)
+        responses = self._fan_out(lambda node: self.nodes[node].download_batch(groups[node], worker_id), groups)
+        entries = []
+        for _, response in responses:
+            if response is None or response.get('status') != 'OK':
+                return response
+            entries.extend(response['data'])
+        return {'status': 'OK', 'data': entries}
+
+    def upload_batch(self, filepaths):
+        groups = defaultdict(list)
+        primary = {}
+        for path in filepaths:
+            name = os.path.basename(path)
+            owners = self.ring.owners(name, self.replicas)
+            primary[name] = owners[0]
+            for node in owners:
+                groups[node].append(path)
+        responses = self._fan_out(lambda node: self.nodes[node].upload_batch(groups[node]), groups)
+        for _, response in responses:
+            if response is None or response.get('status') != 'OK':
+                return response
+        failed = {entry['name']: f"{node}: {entry.get('data')}" for node, response in responses
+                  for entry in response['data'] if entry['status'] != 'OK'}
+        # satu entry per item, dari pemilik utama; gagal bila salah satu replikanya gagal
+        entries = []
+        for node, response in responses:
+            for entry in response['data']:
+                if primary.get(entry['name']) != node:
+                    continue
+                if entry['name'] in failed:
+                    entry = dict(entry, status='ERROR', data=failed[entry['name']])
+                entries.append(entry)
+        return {'status': 'OK', 'data': entries}
+
+    def list_page(self, prefix='', cursor=None, limit=100, sort='name', order='asc', detail=True):
+        """
+        Satu halaman LIST gabungan semua node. Cursor berisi kunci urutan, jadi
+        berlaku di setiap node; halaman dipotong di akhir halaman penuh yang
+        paling pendek, karena setelah titik itu ada node yang belum terbaca.
+        """
+        # urutan selain nama hanya bisa digabung dengan entry lengkap
+        full = detail or sort != 'name'
+        pages = self._fan_out(lambda node: self.nodes[node].list_page(prefix, cursor, limit, sort, order, full))
+        for _, page in pages:
+            if not page or page.get('status') != 'OK':
+                return page
+        reverse = order == 'desc'
+        bound, next_cursor = None, None
+        for _, page in pages:
+            if page.get('next_cursor') and page['data']:
+                end = _entry_key(page['data'][-1], sort)
+                if bound is None or (end > bound if reverse else end < bound):
+                    bound, next_cursor = end, page['next_cursor']
+        data, seen = [], set()
+        for entry in heapq.merge(*(page['data'] for _, page in pages), key=lambda e: _entry_key(e, sort),
+                                 reverse=reverse):
+            if bound is not None and (_entry_key(entry, sort) < bound if reverse
+                                      else _entry_key(entry, sort) > bound):
+                break
+            name = _entry_name(entry)
+            if name not in seen:  # replika
+                seen.add(name)
+                data.append(entry if detail else name)
+        return {'status': 'OK', 'data': data, 'next_cursor': next_cursor}
+
+    def iter_files(self, **options):
+        # replika dengan mtime berbeda bisa jatuh di dua halaman
+        seen = set()
+        for entry in super().iter_files(**options):
+            name = _entry_name(entry)
+            if name not in seen:
+                seen.add(name)
+                yield entry
+
+    def server_stats(self):
+        """STATS setiap node di 'nodes' dengan totals dijumlahkan; None bila ada node tanpa STATS."""
+        snapshots = dict(self._fan_out(lambda node: self.nodes[node].server_stats()))
+        if any(stats is None for stats in snapshots.values()):
+            return None
+        totals = defaultdict(int)
+        for stats in snapshots.values():
+            for key, value in stats['totals'].items():
+                totals[key] += value
+        return {'nodes': snapshots, 'totals': dict(totals)}
+
+    def _holdings(self):
+        """Nama file -> node yang menyimpannya, untuk semua node yang dikenal klien."""
+        holders = defaultdict(list)
+        listings = self._fan_out(lambda node: [_entry_name(e) for e in self.nodes[node].iter_files(detail=False)],
+                                 self.nodes)
+        for node, names in listings:
+            for name in names:
+                holders[name].append(node)
+        return holders
+
+    def _stage_copy(self, node, filename, directory):
+        """Unduh filename dari node ke directory; path-nya, atau None bila gagal."""
+        client = self.nodes[node]
+        path = os.path.join(directory, filename)
+        response = client._download_binary(filename, path) if client.protocol == 'binary' else None
+        if response is None:
+            response = client.send_command(f"GET {filename}")
+            if response and response.get('status') == 'OK':
+                with open(path, 'wb') as f:
+                    f.write(base64.b64decode(response.get('data_file', '')))
+        return path if response and response.get('status') == 'OK' else None
+
+    def rebalance(self, dry_run=False):
+        """
+        Salin setiap file ke pemilik barunya menurut ring lalu hapus dari node
+        yang bukan pemiliknya lagi; file yang sudah di tempatnya tidak disentuh.
+        """
+        holders = self._holdings()
+        summary = {'files': len(holders), 'moved': 0, 'copies': 0, 'deleted': 0, 'failed': 0}
+        with tempfile.TemporaryDirectory(prefix='rebalance-') as staging:
+            for name, nodes in sorted(holders.items()):
+                owners = self.ring.owners(name, self.replicas)
+                missing = [node for node in owners if node not in nodes]
+                extra = [node for node in nodes if node not in owners]
+                if not missing and not extra:
+                    continue
+                summary['moved'] += 1
+                if dry_run:
+                    summary['copies'] += len(missing)
+                    summary['deleted'] += len(extra)
+                    continue
+                if missing:
+                    path = self._stage_copy(nodes[0], name, staging)
+                    if path is None:
+                        summary['failed'] += 1
+                        continue
+                    try:
+                        results = [self.nodes[node].upload_file(path) for node in missing]
+                    finally:
+                        os.remove(path)  # one staged file at a time, whatever the library size
+                    if any(result['status'] != 'OK' for result in results):
+                        summary['failed'] += 1
+                        continue  # keep the old copies until every owner has one
+                    summary['copies'] += len(missing)
+                for node in extra:
+                    response = self.nodes[node].delete_file(name)
+                    if response and response.get('status') == 'OK':
+                        summary['deleted'] += 1
+        drained = [node for node in self.nodes if node not in self.ring.nodes]
+        if drained and not dry_run:
+            # node yang sudah dikeluarkan dari ring dan kini kosong
+            held = {node for nodes in self._holdings().values() for node in nodes}
+            for node in drained:
+                if node not in held:
+                    self.nodes.pop(node).close()
+        return summary
+
+
+def serve(nodes, root, worker_type, workers, extra_args=()):
+    """Satu FileServer per node di root/<host>_<port>, hidup sampai Ctrl-C."""
+    with ExitStack() as stack:
+        for node in nodes:
+            host, port = parse_node(node)
+            directory = os.path.join(root, f'{host}_{port}')
+            os.makedirs(directory, exist_ok=True)
+            stack.enter_context(LocalServer(worker_type, workers, host, port,
+                                            log_path=os.path.join(directory, 'server.log'),
+                                            extra_args=extra_args, cwd=directory))
+            print(f"Node {node} berjalan di {directory}")
+        try:
+            while True:
+                time.sleep(1)
+        except KeyboardInterrupt:
+            print("\nMenghentikan cluster...")
+
+
+def stress(client, operation, files, size_mb, workers, worker_type):
+    """Satu putaran operasi lewat cluster, dicatat seperti stress test biasa."""
+    client._reset_stats()
+    client.operation_stats.update({'operation': operation, 'client_pool_size': workers,
+                                   'server_pool_size': len(client.ring.nodes), 'executor_type': worker_type,
+                                   'file_size_mb': size_mb})
+    if operation == 'upload':
+        # nama berbeda agar file tersebar ke semua shard
+        source = client.generate_dummy_file(size_mb)
+        items = []
+        for i in range(files):
+            path = os.path.join('upload_files', f'cluster_{i}_{size_mb}MB.bin')
+            if not os.path.exists(path):
+                os.link(source, path)
+            items.append(path)
+    elif operation == 'download':
+        entries = list(client.iter_files())[:files]
+        client._remote_sizes.update((entry['name'], entry['size']) for entry in entries)
+        items = [entry['name'] for entry in entries]
+    else:
+        items = [None] * files
+    client.run_operation(operation, items, worker_type, workers)
+    client._display_results()
+    client._save_to_csv()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Sharded FileServer cluster with consistent-hash routing')
+    parser.add_argument('command', choices=['serve', 'list', 'rebalance', 'stress'])
+    parser.add_argument('--nodes', required=True,
+                        help='Comma separated host:port of every node, e.g. 127.0.0.1:7001,127.0.0.1:7002')
+    parser.add_argument('--replicas', type=int, default=1,
+                        help='Copies of each file, on consecutive nodes of the ring')
+    parser.add_argument('--vnodes', type=int, default=VNODES,
+                        help='Points per node on the hash ring')
+    parser.add_argument('--root', default=DEFAULT_ROOT,
+                        help='serve: directory holding one working directory per node')
+    parser.add_argument('--worker-type', choices=['thread', 'process', 'asyncio'], default='thread',
+                        help='serve: server worker type; stress: client executor (thread/process)')
+    parser.add_argument('--workers', type=int, default=4,
+                        help='serve: workers per server; stress: client workers')
+    parser.add_argument('--drain', default='',
+                        help='rebalance: comma separated nodes to empty and leave out of the ring')
+    parser.add_argument('--dry-run', action='store_true',
+                        help='rebalance: only count the files that would move')
+    parser.add_argument('--operation', choices=['upload', 'download', 'list'], default='upload',
+                        help='stress: operation to run')
+    parser.add_argument('--files', type=int, default=32,
+                        help='stress: number of files (or LIST requests)')
+    parser.add_argument('--size-mb', type=int, default=1,
+                        help='stress: size of each uploaded file')
+    parser.add_argument('--dedup', action='store_true',
+                        help='stress: allow hash-first deduplicated uploads (measures dedup, not transfer)')
+    parser.add_argument('--delta', action='store_true',
+                        help='stress: allow delta uploads of files the nodes already have')
+    parser.add_argument('--cache-mb', type=int, default=0,
+                        help='stress: client download cache size, 0 = off')
+    parser.add_argument('--csv', default='stress_test_cluster.csv',
+                        help='stress: CSV file for the results')
+    args = parser.parse_args()
+
+    nodes = [node.strip() for node in args.nodes.split(',') if node.strip()]
+    if args.command == 'serve':
+        serve(nodes, args.root, args.worker_type, args.workers)
+        raise SystemExit
+
+    drain = [node.strip() for node in args.drain.split(',') if node.strip()]
+    client = ClusterClient(nodes + [node for node in drain if node not in nodes], replicas=args.replicas,
+                           vnodes=args.vnodes, csv_filename=args.csv, dedup=args.dedup,
+                           delta=args.delta, cache_mb=args.cache_mb)
+    try:
+        if args.command == 'list':
+            client.list_files()
+        elif args.command == 'rebalance':
+            for node in drain:
+                client.remove_node(node)
+            summary = client.rebalance(dry_run=args.dry_run)
+            print(f"{summary['moved']} dari {summary['files']} file {'akan ' if args.dry_run else ''}pindah "
+                  f"({summary['moved'] / max(1, summary['files']):.1%}): {summary['copies']} salinan, "
+                  f"{summary['deleted']} dihapus, {summary['failed']} gagal")
+        else:
+            worker_type = 'process' if args.worker_type == 'process' else 'thread'
+            stress(client, args.operation, args.files, args.size_mb, args.workers, worker_type)
+    finally:
+        client.close()
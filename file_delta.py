@@ -0,0 +1,204 @@
+import hashlib
+import math
+import os
+import zlib
+from typing import Dict, List, Optional, Tuple
+
+import file_wire
+
+"""
+* file_delta berisi algoritma sinkronisasi gaya rsync: server
+mengirim signature (checksum rolling + checksum kuat per blok) dari
+salinan file yang ia punya, client mencari blok yang sama di file
+lokalnya dan hanya mengirim byte literal plus referensi blok
+
+* checksum rolling adalah adler32 yang bisa digeser satu byte dengan
+O(1), checksum kuat adalah blake2b 16 byte; cocok di checksum rolling
+baru dikonfirmasi dengan checksum kuat
+
+* pencarian byte per byte dilakukan di Python, jadi setelah cukup lama
+tidak menemukan blok yang cocok (misalnya ekor file yang baru
+ditambahkan) pencarian turun ke posisi kelipatan blok saja; perubahan
+kecil dan data yang bergeser sedikit tetap terdeteksi
+
+* server membangun file baru dari blok file lama plus literal di file
+sementara, mencocokkan SHA-256 hasilnya, lalu memasangnya secara atomik
+"""
+
+MIN_BLOCK = 4*1024
+MAX_BLOCK = 1024*1024
+# setelah sekian blok tanpa kecocokan, hanya posisi kelipatan blok yang diperiksa
+MAX_ROLL_BLOCKS = 8
+ADLER_MOD = 65521
+COPY_CHUNK = 1024*1024
+
+OP_COPY = file_wire.DELTA_COPY
+OP_LITERAL = file_wire.DELTA_LITERAL
+
+
+class DeltaError(ValueError):
+    pass
+
+
+def block_size_for(size: int) -> int:
+    """About sqrt(size) (like rsync), as a power of two between MIN_BLOCK and MAX_BLOCK."""
+    if size <= MIN_BLOCK:
+        return MIN_BLOCK
+    return max(MIN_BLOCK, min(MAX_BLOCK, 1 << math.ceil(math.log2(math.sqrt(size)))))
+
+
+def weak(data: bytes) -> int:
+    return zlib.adler32(data)
+
+
+def strong(data: bytes) -> bytes:
+    return hashlib.blake2b(data, digest_size=file_wire.BLOCK_SIG.size - 4).digest()
+
+
+def signature(f, size: int, block_size: int = None) -> bytes:
+    """SIGNATURE header plus one BLOCK_SIG per block of f (the last one may be short)."""
+    block_size = block_size or block_size_for(size)
+    parts = [file_wire.SIGNATURE.pack(block_size, size)]
+    for data in iter(lambda: f.read(block_size), b''):
+        parts.append(file_wire.BLOCK_SIG.pack(weak(data), strong(data)))
+    return b''.join(parts)
+
+
+def parse_signature(payload: bytes) -> Tuple[int, int, List[Tuple[int, bytes]]]:
+    block_size, size = file_wire.SIGNATURE.unpack_from(payload)
+    blocks = [file_wire.BLOCK_SIG.unpack_from(payload, offset)
+              for offset in range(file_wire.SIGNATURE.size, len(payload), file_wire.BLOCK_SIG.size)]
+    if len(blocks) != -(-size // block_size):
+        raise DeltaError('Signature does not match file size')
+    return block_size, size, blocks
+
+
+class DeltaPlan:
+    """
+    Ops (OP_COPY, first block, count) and (OP_LITERAL, offset, length) that
+    turn the server's copy into the local file; literals reference the
+    local file, so the plan stays small however much data it covers.
+    """
+
+    def __init__(self):
+        self.ops = []
+        self.literal_bytes = 0
+        self.copied_blocks = 0
+
+    def copy(self, index: int) -> None:
+        last = self.ops[-1] if self.ops else None
+        if last and last[0] == OP_COPY and last[1] + last[2] == index:
+            self.ops[-1] = (OP_COPY, last[1], last[2] + 1)
+        else:
+            self.ops.append((OP_COPY, index, 1))
+        self.copied_blocks += 1
+
+    def literal(self, offset: int, length: int) -> None:
+        if not length:
+            return
+        last = self.ops[-1] if self.ops else None
+        if last and last[0] == OP_LITERAL and last[1] + last[2] == offset:
+            self.ops[-1] = (OP_LITERAL, last[1], last[2] + length)
+        else:
+            self.ops.append((OP_LITERAL, offset, length))
+        self.literal_bytes += length
+
+    def payload_len(self) -> int:
+        return (file_wire.DELTA.size + len(self.ops) * file_wire.DELTA_OP.size
+                + sum(length for kind, _, length in self.ops if kind == OP_LITERAL))
+
+
+def compute_delta(data, block_size: int, blocks: List[Tuple[int, bytes]], base_size: int,
+                  max_literal: Optional[int] = None) -> Optional[DeltaPlan]:
+    """
+    Match data (the local file, bytes or mmap) against the server's block
+    signatures. Returns None once the literal bytes exceed max_literal,
+    when a plain upload is cheaper than finishing the search.
+    """
+    n = block_size
+    full = base_size // n
+    by_weak: Dict[int, List[int]] = {}
+    for index, (checksum, _) in enumerate(blocks[:full]):
+        by_weak.setdefault(checksum, []).append(index)
+
+    def match(pos: int, checksum: int) -> Optional[int]:
+        digest = strong(data[pos:pos + n])
+        for index in by_weak[checksum]:
+            if blocks[index][1] == digest:
+                return index
+        return None
+
+    plan = DeltaPlan()
+    size = len(data)
+    pos = literal_start = 0
+    checksum = None
+    while pos + n <= size:
+        if checksum is None:
+            checksum = weak(data[pos:pos + n])
+        index = match(pos, checksum) if checksum in by_weak else None
+        if index is not None:
+            plan.literal(literal_start, pos - literal_start)
+            plan.copy(index)
+            pos = literal_start = pos + n
+            checksum = None
+            continue
+        if pos - literal_start < MAX_ROLL_BLOCKS * n and pos + n < size:
+            # slide the adler32 window one byte
+            out, new = data[pos], data[pos + n]
+            a = ((checksum & 0xFFFF) - out + new) % ADLER_MOD
+            b = ((checksum >> 16) - n * out + a - 1) % ADLER_MOD
+            checksum = b << 16 | a
+            pos += 1
+        else:
+            pos = literal_start + ((pos - literal_start) // n + 1) * n
+            checksum = None
+        if max_literal is not None and plan.literal_bytes + pos - literal_start > max_literal:
+            return None
+
+    # the server's short last block can only match at the very end
+    tail = base_size - full * n
+    if tail and size - literal_start >= tail:
+        end = data[size - tail:]
+        if (weak(end), strong(end)) == tuple(blocks[full]):
+            plan.literal(literal_start, size - tail - literal_start)
+            plan.copy(full)
+            literal_start = size
+    plan.literal(literal_start, size - literal_start)
+    if max_literal is not None and plan.literal_bytes > max_literal:
+        return None
+    return plan
+
+
+class DeltaPatcher:
+    """Rebuild a file into out from blocks of base and literal writes, hashing it on the way."""
+
+    def __init__(self, base, out, block_size: int):
+        if not MIN_BLOCK <= block_size <= MAX_BLOCK:
+            raise DeltaError(f'Unsupported block size {block_size}')
+        self.base = base
+        self.base_size = os.fstat(base.fileno()).st_size
+        self.out = out
+        self.block_size = block_size
+        self.digest = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data) -> None:
+        self.out.write(data)
+        self.digest.update(data)
+        self.size += len(data)
+
+    def copy(self, first: int, count: int) -> None:
+        start = first * self.block_size
+        end = min(self.base_size, (first + count) * self.block_size)
+        if count <= 0 or start >= end:
+            raise DeltaError('Block reference out of range')
+        while start < end:
+            data = os.pread(self.base.fileno(), min(COPY_CHUNK, end - start), start)
+            if not data:
+                raise DeltaError('Base file changed during delta')
+            self.write(data)
+            start += len(data)
+
+    def check(self, digest: bytes, size: int) -> None:
+        if self.size != size or self.digest.digest() != digest:
+            raise DeltaError('Delta result does not match, base file changed?')
@@ -0,0 +1,181 @@
+import re
+from collections import namedtuple
+from typing import Callable, Dict, Optional, Tuple, Union
+
+"""
+* CommandTable adalah tabel command teks yang dipakai bersama oleh
+FileServer dan FileProtocol: setiap command didaftarkan sekali dengan
+handler, jumlah argumen dan apakah ia membawa body
+
+* hanya header (nama command + argumennya) yang di-parse; body
+(misalnya base64 isi file pada UPLOAD) tidak pernah di-split, di-copy
+atau di-lowercase, melainkan diteruskan apa adanya sebagai buffer
+(memoryview untuk input bytes)
+
+* biaya parse dan log per request tetap, tidak tergantung ukuran body;
+summarize() menghasilkan ringkasan pendek untuk log
+
+* opcode protokol biner didaftarkan di tabel yang sama lewat
+register_opcode: satu handler per opcode, dipakai jalur sinkron dan
+asyncio; handler stream/reply punya pasangan async karena membaca atau
+menulis socket sendiri
+"""
+
+HEADER_LIMIT = 64*1024
+SUMMARY_ARGS = 80
+
+Request = namedtuple('Request', 'name args body')
+Command = namedtuple('Command', 'name handler min_args max_args body stream')
+Opcode = namedtuple('Opcode', 'opcode handler async_handler kind inline')
+
+# handler(name, payload) -> response dict, dikirim sebagai satu frame JSON
+OPCODE_JSON = 'json'
+# handler(sock, name, payload_len, request_flags) -> response dict; body dibaca handler sendiri
+OPCODE_STREAM = 'stream'
+# handler(sock, name, payload, flags, request_flags, codec) -> (ok, bytes sent); handler menulis balasan
+OPCODE_REPLY = 'reply'
+
+# satu token header: "dikutip", 'dikutip', atau kata tanpa spasi
+_TOKEN = {
+    bytes: re.compile(rb'\s*(?:"([^"]*)"|\'([^\']*)\'|(\S+))'),
+    str: re.compile(r'\s*(?:"([^"]*)"|\'([^\']*)\'|(\S+))'),
+}
+# pemisah header dan body: spasi lalu paling tidak satu karakter body
+_BODY_START = {
+    bytes: re.compile(rb'\s+(?=\S)'),
+    str: re.compile(r'\s+(?=\S)'),
+}
+
+
+class CommandError(ValueError):
+    pass
+
+
+def _kind(data) -> type:
+    return str if isinstance(data, str) else bytes
+
+
+class CommandTable:
+    def __init__(self, header_limit: int = HEADER_LIMIT):
+        self.header_limit = header_limit
+        self._commands = {}
+        self._opcodes = {}
+
+    def register(self, name: str, handler: Callable[[Request], Dict], min_args: int = 0,
+                 max_args: Optional[int] = None, body: bool = False, stream: bool = False) -> None:
+        """
+        Register handler(request) for a command (names are case-insensitive).
+        With body=True exactly min_args header arguments are parsed and
+        everything after them is the opaque body; stream=True additionally
+        lets a server hand the body over before the terminator arrives.
+        """
+        if max_args is None and body:
+            max_args = min_args
+        self._commands[name.upper()] = Command(name.upper(), handler, min_args, max_args, body or stream, stream)
+
+    def register_opcode(self, opcode: int, handler: Callable, async_handler: Callable = None,
+                        kind: str = OPCODE_JSON, inline: bool = False) -> None:
+        """
+        Register the handler of a binary opcode. JSON handlers are plain
+        functions an asyncio server runs in its executor, or on the loop
+        itself with inline=True; stream and reply handlers talk to the
+        connection and need an async_handler for the asyncio server.
+        """
+        if kind != OPCODE_JSON and async_handler is None:
+            raise ValueError(f'{kind} opcode {opcode:#x} needs an async handler')
+        self._opcodes[opcode] = Opcode(opcode, handler, async_handler, kind, inline)
+
+    def opcode(self, opcode: int) -> Optional[Opcode]:
+        return self._opcodes.get(opcode)
+
+    def _tokens(self, data, pos: int, count: Optional[int], limit: int):
+        pattern = _TOKEN[_kind(data)]
+        tokens = []
+        while count is None or len(tokens) < count:
+            match = pattern.match(data, pos, limit)
+            if not match:
+                break
+            token = next(g for g in match.groups() if g is not None)
+            tokens.append(token if isinstance(token, str) else bytes(token).decode('utf-8'))
+            pos = match.end()
+        return tokens, pos
+
+    def _command(self, data) -> Tuple[Optional[Command], int]:
+        names, pos = self._tokens(data, 0, 1, min(len(data), self.header_limit))
+        if not names:
+            raise CommandError('Empty command')
+        return self._commands.get(names[0].upper()), pos
+
+    def parse(self, data: Union[str, bytes, bytearray, memoryview]) -> Request:
+        """Split data into command name, header arguments and (for body commands) the raw body."""
+        if not isinstance(data, str):
+            data = memoryview(data).cast('B')
+        command, pos = self._command(data)
+        if command is None:
+            raise CommandError('Invalid command')
+
+        if command.body:
+            args, pos = self._tokens(data, pos, command.min_args, min(len(data), pos + self.header_limit))
+            start = _BODY_START[_kind(data)].match(data, pos)
+            if len(args) < command.min_args or start is None:
+                raise CommandError('Invalid command')
+            return Request(command.name, args, data[start.end():].rstrip() if isinstance(data, str)
+                           else _rstrip(data[start.end():]))
+
+        if len(data) > self.header_limit:
+            raise CommandError('Command too long')
+        args, _ = self._tokens(data, pos, None, len(data))
+        if len(args) < command.min_args or (command.max_args is not None and len(args) > command.max_args):
+            raise CommandError('Invalid command')
+        return Request(command.name, args, None)
+
+    def name_of(self, data) -> Optional[str]:
+        """Registered name of the command data starts with, without parsing the rest."""
+        try:
+            command, _ = self._command(data)
+        except CommandError:
+            return None
+        return command.name if command is not None else None
+
+    def match_stream(self, data) -> Optional[Tuple[Request, int]]:
+        """
+        For a stream command whose header has fully arrived, return the request
+        (body None) and the offset where its body starts; None otherwise.
+        """
+        try:
+            command, pos = self._command(data)
+        except CommandError:
+            return None
+        if command is None or not command.stream:
+            return None
+        limit = min(len(data), self.header_limit)
+        args, pos = self._tokens(data, pos, command.min_args, limit)
+        start = _BODY_START[_kind(data)].match(data, pos, limit)
+        if len(args) < command.min_args or start is None:
+            return None  # header (or its last argument) still incomplete
+        return Request(command.name, args, None), start.end()
+
+    def dispatch(self, data) -> Dict:
+        return self.call(self.parse(data))
+
+    def call(self, request: Request) -> Dict:
+        return self._commands[request.name].handler(request)
+
+
+def _rstrip(view: memoryview) -> memoryview:
+    # trailing whitespace/terminator without copying the body
+    end = len(view)
+    while end and view[end - 1] in b' \t\r\n':
+        end -= 1
+    return view[:end]
+
+
+def summarize(request: Request) -> str:
+    """Short log line for a request: name, clipped arguments and body size."""
+    args = ' '.join(request.args)
+    if len(args) > SUMMARY_ARGS:
+        args = args[:SUMMARY_ARGS] + '...'
+    summary = f"{request.name} {args}".rstrip()
+    if request.body is not None:
+        summary += f" (body {len(request.body)} bytes)"
+    return summary
@@ -0,0 +1,152 @@
+import hashlib
+import json
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+from typing import Dict, Optional
+
+"""
+* DownloadCache adalah cache unduhan di sisi client: salinan setiap
+file yang pernah diunduh disimpan bersama validator (etag) dari server
+
+* download berikutnya mengirim GET bersyarat (if-none-match); bila
+server menjawab NOT_MODIFIED, file disalin dari cache tanpa transfer
+
+* total ukuran cache dibatasi, entry yang paling lama tidak dipakai
+dibuang lebih dulu (LRU); index disimpan sebagai JSON sehingga cache
+tetap berlaku di antara beberapa run benchmark
+
+* cache hit hanya menggeser urutan LRU di memori; index ditulis saat
+entry berubah, setiap SAVE_EVERY hit, dan pada close()
+"""
+
+INDEX_NAME = 'index.json'
+# recency from cache hits reaches the index file every this many hits
+SAVE_EVERY = 64
+
+
+class DownloadCache:
+    def __init__(self, directory: str, max_bytes: int = 256*1024*1024):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.index_path = os.path.join(directory, INDEX_NAME)
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._unsaved = 0
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def __getstate__(self):
+        # ProcessPoolExecutor pickles the client together with its cache
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _load(self) -> None:
+        try:
+            with open(self.index_path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError):
+            return
+        for key, entry in entries:
+            if os.path.exists(self._blob(entry['file'])):
+                self._entries[key] = entry
+                self.current_bytes += entry['size']
+
+    def _save(self) -> None:
+        # Caller holds the lock; temp + rename so a crash never leaves half an index.
+        temp = f'{self.index_path}.{uuid.uuid4().hex}'
+        with open(temp, 'w') as f:
+            json.dump(list(self._entries.items()), f)
+        os.replace(temp, self.index_path)
+        self._unsaved = 0
+
+    def _blob(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def lookup(self, key: str) -> Optional[str]:
+        """Validator of the cached copy of key, None when there is none."""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry['etag'] if entry is not None else None
+
+    def restore(self, key: str, dest: str) -> Optional[int]:
+        """Copy the cached file to dest (a cache hit); None if it has gone missing."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            self._entries.move_to_end(key)
+        try:
+            shutil.copyfile(self._blob(entry['file']), dest)
+        except FileNotFoundError:
+            # evicted by another client process sharing the directory
+            with self._lock:
+                if self._entries.get(key) is entry:
+                    self._drop(key)
+                    self._save()
+            return None
+        with self._lock:
+            self.hits += 1
+            self._unsaved += 1
+            if self._unsaved >= SAVE_EVERY:
+                self._save()  # recency survives the run without a rewrite per hit
+        return entry['size']
+
+    def store(self, key: str, etag: str, src: str) -> None:
+        """Remember a freshly downloaded src under key and etag, evicting LRU entries over the cap."""
+        size = os.path.getsize(src)
+        if size > self.max_bytes:
+            return
+        name = hashlib.sha256(f'{key}\0{etag}'.encode('utf-8')).hexdigest()
+        temp = self._blob(f'{name}.{uuid.uuid4().hex}')
+        # a copy, not a link: src is rewritten in place by the next download
+        shutil.copyfile(src, temp)
+        os.replace(temp, self._blob(name))
+        with self._lock:
+            self.misses += 1
+            if key in self._entries:
+                self._drop(key, keep=name)
+            self._entries[key] = {'etag': etag, 'file': name, 'size': size}
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+            self._save()
+
+    def close(self) -> None:
+        """Write recency the last hits changed in memory only."""
+        with self._lock:
+            if self._unsaved:
+                self._save()
+
+    def _drop(self, key: str, keep: str = None) -> None:
+        # Caller holds the lock.
+        entry = self._entries.pop(key)
+        self.current_bytes -= entry['size']
+        if entry['file'] != keep:
+            try:
+                os.remove(self._blob(entry['file']))
+            except FileNotFoundError:
+                pass
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+            }
@@ -0,0 +1,253 @@
+import base64
+import bisect
+import fcntl
+import json
+import os
+import threading
+from collections import namedtuple
+from typing import Callable, List, Optional, Tuple
+
+"""
+* DirectoryIndex menyimpan metadata (nama, ukuran, mtime, sha256)
+semua file di sebuah direktori di memori; dibangun sekali saat start
+lalu diperbarui per nama setiap ada UPLOAD/DELETE
+
+* untuk tiap urutan (name, size, mtime) ada list kunci yang selalu
+terurut, sehingga satu halaman LIST cukup satu bisect + sepanjang
+halaman itu, bukan listdir seluruh direktori
+
+* prefix dengan urutan size/mtime memakai list kunci tersendiri berisi
+nama yang cocok saja; list itu diingat per (sort, prefix) sampai index
+berubah, jadi halaman berikutnya tidak menyaring seluruh direktori
+
+* cursor adalah kunci item terakhir di halaman sebelumnya (opaque,
+base64), jadi halaman berikutnya tetap benar walau ada file yang
+ditambah/dihapus di antaranya
+
+* dengan journal (mode pre-fork), setiap perubahan juga ditulis ke
+file append-only supaya index di proses worker lain ikut diperbarui;
+lewat JOURNAL_MAX byte journal diganti file kosong, dan worker yang
+melihat journal baru membangun ulang index dari direktori
+"""
+
+FileEntry = namedtuple('FileEntry', 'name size mtime sha256')
+# list kunci per (sort, prefix) yang diingat
+SUBSET_CACHE = 32
+JOURNAL_MAX = 1024*1024
+
+SORT_KEYS = {
+    'name': lambda e: (e.name,),
+    'size': lambda e: (e.size, e.name),
+    'mtime': lambda e: (e.mtime, e.name),
+}
+
+
+class DirectoryIndex:
+    def __init__(self, root: str, digest_of: Callable[[str], Optional[str]] = None, journal: str = None):
+        self.root = root
+        self._digest_of = digest_of
+        self._lock = threading.Lock()
+        self._subsets = {}
+        self._scan()
+
+        self._journal = None
+        self._journal_path = journal
+        self._journal_pos = 0
+        self._lock_fd = None
+        self._lock_pid = None
+        if journal is not None:
+            self._journal = os.open(journal, os.O_RDWR | os.O_APPEND | os.O_CREAT | os.O_TRUNC, 0o644)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _scan(self) -> None:
+        # Caller holds the lock, or is the constructor.
+        self._entries = {}
+        self._keys = {sort: [] for sort in SORT_KEYS}
+        self._subsets.clear()
+        with os.scandir(self.root) as it:
+            for item in it:
+                if not item.name.startswith('.') and item.is_file():
+                    entry = self._stat(item.name)
+                    if entry is not None:
+                        self._put(entry)
+        for keys in self._keys.values():
+            keys.sort()
+
+    def _stat(self, name: str) -> Optional[FileEntry]:
+        path = os.path.join(self.root, name)
+        try:
+            st = os.stat(path)
+            digest = self._digest_of(path) if self._digest_of is not None else None
+        except FileNotFoundError:
+            return None
+        return FileEntry(name, st.st_size, st.st_mtime, digest)
+
+    def _put(self, entry: FileEntry, insort: bool = False) -> None:
+        self._entries[entry.name] = entry
+        self._subsets.clear()
+        for sort, key in SORT_KEYS.items():
+            if insort:
+                bisect.insort(self._keys[sort], key(entry))
+            else:
+                self._keys[sort].append(key(entry))
+
+    def _drop(self, name: str) -> None:
+        entry = self._entries.pop(name, None)
+        if entry is None:
+            return
+        self._subsets.clear()
+        for sort, key in SORT_KEYS.items():
+            keys = self._keys[sort]
+            del keys[bisect.bisect_left(keys, key(entry))]
+
+    def _apply(self, name: str) -> None:
+        with self._lock:
+            entry = self._stat(name)
+            self._drop(name)
+            if entry is not None:
+                self._put(entry, insort=True)
+
+    def refresh(self, name: str) -> None:
+        """Re-read one name after it was written or removed."""
+        self._apply(name)
+        if self._journal is None:
+            return
+        # shared: a compaction cannot swap the journal between the check and the write
+        with self._journal_lock(fcntl.LOCK_SH):
+            self._follow_journal()
+            os.write(self._journal, (json.dumps(name) + '\n').encode('utf-8'))
+            full = os.fstat(self._journal).st_size > JOURNAL_MAX
+        if full:
+            self._compact()
+
+    def _journal_lock(self, mode: int):
+        # flock is per open file description, so each pre-forked worker opens its own
+        if self._lock_pid != os.getpid():
+            self._lock_fd = os.open(self._journal_path + '.lock', os.O_RDWR | os.O_CREAT, 0o644)
+            self._lock_pid = os.getpid()
+        return _Flock(self._lock_fd, mode)
+
+    def _follow_journal(self) -> None:
+        """After another process compacted the journal: reopen it and rebuild from the directory."""
+        try:
+            replaced = os.stat(self._journal_path).st_ino != os.fstat(self._journal).st_ino
+        except FileNotFoundError:
+            return
+        if not replaced:
+            return
+        with self._lock:
+            os.close(self._journal)
+            self._journal = os.open(self._journal_path, os.O_RDWR | os.O_APPEND)
+            self._journal_pos = 0
+            self._scan()
+
+    def _compact(self) -> None:
+        with self._journal_lock(fcntl.LOCK_EX):
+            self._follow_journal()
+            if os.fstat(self._journal).st_size <= JOURNAL_MAX:
+                return  # another worker compacted first
+            self._read_journal()  # nobody writes now; this index is complete
+            temp = f'{self._journal_path}.{os.getpid()}'
+            fd = os.open(temp, os.O_RDWR | os.O_APPEND | os.O_CREAT | os.O_TRUNC, 0o644)
+            os.replace(temp, self._journal_path)
+            with self._lock:
+                os.close(self._journal)
+                self._journal = fd
+                self._journal_pos = 0
+
+    def sync(self) -> None:
+        """Apply changes other processes recorded in the journal."""
+        if self._journal is None:
+            return
+        self._follow_journal()
+        self._read_journal()
+
+    def _read_journal(self) -> None:
+        with self._lock:
+            end = os.fstat(self._journal).st_size
+            data = os.pread(self._journal, end - self._journal_pos, self._journal_pos)
+            data = data[:data.rfind(b'\n') + 1]  # only complete records
+            self._journal_pos += len(data)
+        for line in data.splitlines():
+            self._apply(json.loads(line))
+
+    def names(self) -> List[str]:
+        self.sync()
+        with self._lock:
+            return [key[0] for key in self._keys['name']]
+
+    def page(self, prefix: str = '', cursor: str = None, limit: int = 100,
+             sort: str = 'name', reverse: bool = False) -> Tuple[List[FileEntry], Optional[str]]:
+        """One page of entries plus the cursor for the next page (None at the end)."""
+        if sort not in SORT_KEYS:
+            raise ValueError(f'Unknown sort key: {sort!r}')
+        after = self._decode_cursor(cursor, sort, reverse) if cursor else None
+        self.sync()
+
+        with self._lock:
+            keys, lo, hi = self._range(sort, prefix)
+            if not reverse:
+                if after is not None:
+                    lo = max(lo, bisect.bisect_right(keys, after, lo, hi))
+                found = keys[lo:min(hi, lo + limit + 1)]
+            else:
+                if after is not None:
+                    hi = min(hi, bisect.bisect_left(keys, after, lo, hi))
+                found = keys[max(lo, hi - limit - 1):hi][::-1]
+            page = [self._entries[key[-1]] for key in found]
+
+        if len(page) <= limit:
+            return page, None
+        page = page[:limit]
+        return page, self._encode_cursor(sort, reverse, SORT_KEYS[sort](page[-1]))
+
+    def _range(self, sort: str, prefix: str) -> Tuple[list, int, int]:
+        """Sorted keys and the slice [lo, hi) of them matching prefix; caller holds the lock."""
+        names = self._keys['name']
+        lo, hi = 0, len(names)
+        if prefix:
+            lo = bisect.bisect_left(names, (prefix,))
+            hi = bisect.bisect_left(names, (prefix + '\U0010ffff',), lo)
+        if sort == 'name':
+            return names, lo, hi
+        if not prefix:
+            return self._keys[sort], 0, len(self._keys[sort])
+        keys = self._subsets.get((sort, prefix))
+        if keys is None:
+            # only the matching names, cleared again by the next change
+            keys = sorted(SORT_KEYS[sort](self._entries[key[0]]) for key in names[lo:hi])
+            if len(self._subsets) >= SUBSET_CACHE:
+                del self._subsets[next(iter(self._subsets))]
+            self._subsets[(sort, prefix)] = keys
+        return keys, 0, len(keys)
+
+    def _encode_cursor(self, sort: str, reverse: bool, key: tuple) -> str:
+        raw = json.dumps([sort, reverse, list(key)]).encode('utf-8')
+        return base64.urlsafe_b64encode(raw).decode('ascii')
+
+    def _decode_cursor(self, cursor: str, sort: str, reverse: bool) -> tuple:
+        try:
+            cur_sort, cur_reverse, key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+        except Exception:
+            raise ValueError('Invalid cursor')
+        if cur_sort != sort or cur_reverse != reverse:
+            raise ValueError('Cursor belongs to a different sort order')
+        return tuple(key)
+
+
+class _Flock:
+    __slots__ = ('fd', 'mode')
+
+    def __init__(self, fd: int, mode: int):
+        self.fd = fd
+        self.mode = mode
+
+    def __enter__(self):
+        fcntl.flock(self.fd, self.mode)
+        return self
+
+    def __exit__(self, *exc):
+        fcntl.flock(self.fd, fcntl.LOCK_UN)
+        return False
@@ -1,17 +1,31 @@
 import os
 import json
 import base64
-from glob import glob
+import uuid
+
+from file_cache import ContentCache
+from file_index import DirectoryIndex
 
 
 class FileInterface:
-    def __init__(self):
+    def __init__(self, cache=None):
         os.chdir('files/')
+        self.cache = cache if cache is not None else ContentCache()
+        self.index = DirectoryIndex('.')
 
     def list(self,params=[]):
+        # params: prefix=.. cursor=.. limit=.. sort=name|size|mtime order=asc|desc
         try:
-            filelist = glob('*.*')
-            return dict(status='OK',data=filelist)
+            options = dict(p.partition('=')[::2] for p in params)
+            if not options:
+                # legacy LIST was glob('*.*'): only names with a dot
+                return dict(status='OK',data=[n for n in self.index.names() if '.' in n])
+            entries, cursor = self.index.page(prefix=options.get('prefix',''),
+                                              cursor=options.get('cursor'),
+                                              limit=int(options.get('limit',100)),
+                                              sort=options.get('sort','name'),
+                                              reverse=options.get('order')=='desc')
+            return dict(status='OK',data=[e._asdict() for e in entries],next_cursor=cursor)
         except Exception as e:
             return dict(status='ERROR',data=str(e))
 
@@ -20,8 +34,10 @@ class FileInterface:
             filename = params[0]
             if (filename == ''):
                 return None
-            fp = open(f"{filename}",'rb')
-            isifile = base64.b64encode(fp.read()).decode()
+            def load():
+                with open(filename,'rb') as fp:
+                    return base64.b64encode(fp.read())
+            isifile = self.cache.get(os.path.abspath(filename),'b64',load).decode()
             return dict(status='OK',data_namafile=filename,data_file=isifile)
         except Exception as e:
             return dict(status='ERROR',data=str(e))
@@ -37,9 +53,19 @@ class FileInterface:
             # Decode the base64 content
             file_bytes = base64.b64decode(file_content_b64)
             
-            # Write to file
-            with open(filename, 'wb') as fp:
-                fp.write(file_bytes)
+            # Write to a temp file and rename it over the name, so concurrent
+            # uploads never interleave and readers never see a torn file
+            temp = f'.{uuid.uuid4().hex}.tmp'
+            try:
+                with open(temp, 'wb') as fp:
+                    fp.write(file_bytes)
+                os.replace(temp, filename)
+            except Exception:
+                if os.path.exists(temp):
+                    os.remove(temp)
+                raise
+            self.cache.invalidate(os.path.abspath(filename))
+            self.index.refresh(filename)
                 
             return dict(status='OK',data=f'File {filename} uploaded successfully')
         except Exception as e:
@@ -58,6 +84,8 @@ class FileInterface:
             
             # Delete the file
             os.remove(filename)
+            self.cache.invalidate(os.path.abspath(filename))
+            self.index.refresh(filename)
             return dict(status='OK',data=f'File {filename} deleted successfully')
         except Exception as e:
             return dict(status='ERROR',data=str(e))
@@ -0,0 +1,344 @@
+import argparse
+import asyncio
+import csv
+import math
+import os
+import random
+import resource
+
+import file_wire
+from file_client_cli import FileClient, ServerBusy
+from file_trace import percentile
+
+"""
+* file_loadgen adalah load generator open-loop berbasis asyncio: satu
+proses bisa menjalankan ribuan request bersamaan tanpa satu thread
+per client
+
+* request dijadwalkan pada waktu kedatangan yang ditentukan di depan
+(konstan atau Poisson) dengan profil ramp up, hold dan ramp down;
+request baru tetap diluncurkan sesuai jadwal walaupun respon
+sebelumnya belum kembali
+
+* latensi dihitung dari waktu yang dijadwalkan, bukan dari waktu
+request benar-benar dikirim, sehingga waktu menunggu koneksi atau
+event loop yang tertinggal ikut terukur (bebas coordinated omission);
+waktu layanan (sejak dikirim) dicatat terpisah
+
+* percentil latensi request OK dilaporkan berdampingan dengan percentil
+semua request (BUSY, TIMEOUT dan error dihitung pada waktu berakhirnya),
+supaya request yang ditolak atau macet tidak hilang dari distribusi
+
+* setiap pertukaran dibatasi --timeout; request yang melewatinya
+dicatat sebagai TIMEOUT (gagal) dan koneksinya ditutup, jadi server
+yang macet tidak membuat request menggantung selamanya
+
+* hasil dimasukkan ke operation_stats FileClient, jadi ringkasan dan
+baris CSV-nya sama dengan stress test biasa; timestamp setiap request
+bisa ditulis ke CSV tersendiri
+"""
+
+REQUEST_COLUMNS = ['intended', 'started', 'finished', 'latency', 'service', 'status', 'bytes']
+READ_CHUNK = 1024*1024
+REQUEST_TIMEOUT = 30.0
+
+
+def arrival_times(rate, ramp_up=0.0, hold=0.0, ramp_down=0.0, poisson=False, seed=None):
+    """
+    Offsets (seconds from the start) of the arrivals of a process whose rate
+    climbs linearly from 0 to rate over ramp_up, stays there for hold and
+    falls back to 0 over ramp_down. Constant arrivals are evenly spaced in
+    expected-count; Poisson ones have exponential gaps in it.
+    """
+    up, flat = rate * ramp_up / 2, rate * hold
+    total = up + flat + rate * ramp_down / 2
+    rng = random.Random(seed)
+    count = 0.0
+    while True:
+        count += rng.expovariate(1.0) if poisson else 1.0
+        if count > total:
+            return
+        # invert the cumulative expected count of the piecewise-linear rate
+        if count <= up:
+            yield math.sqrt(2 * ramp_up * count / rate)
+        elif count <= up + flat:
+            yield ramp_up + (count - up) / rate
+        else:
+            rest = count - up - flat
+            yield ramp_up + hold + ramp_down - math.sqrt(max(0.0, ramp_down ** 2 - 2 * ramp_down * rest / rate))
+
+
+class AsyncConnection:
+    """One binary-protocol connection (MAGIC + HELLO done) used by one request at a time."""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.closing = False
+
+    @classmethod
+    async def open(cls, host, port, timeout=None):
+        reader, writer = await asyncio.wait_for(asyncio.open_connection(host, port), timeout)
+        try:
+            writer.write(file_wire.MAGIC + file_wire.encode_json(file_wire.OP_HELLO,
+                                                                 {'version': file_wire.PROTOCOL_VERSION}))
+            opcode, _, _, payload = await asyncio.wait_for(file_wire.read_frame_async(reader), timeout)
+            response = file_wire.decode_json(payload)
+            if response.get('status') == 'BUSY':
+                raise ServerBusy(response)
+            if opcode != file_wire.OP_OK:
+                raise file_wire.ProtocolError(response.get('data', 'HELLO rejected'))
+        except Exception:
+            writer.close()
+            raise
+        return cls(reader, writer)
+
+    async def request(self, opcode, name='', payload=b'', timeout=None):
+        """
+        Send one frame and read the reply; returns (status, bytes received), file
+        bodies are discarded. Raises asyncio.TimeoutError past timeout seconds.
+        """
+        return await asyncio.wait_for(self._exchange(opcode, name, payload), timeout)
+
+    async def _exchange(self, opcode, name, payload):
+        self.writer.write(file_wire.pack_header(opcode, name.encode('utf-8'), len(payload)))
+        if payload:
+            self.writer.write(payload)
+        await self.writer.drain()
+        opcode, flags, _, size = await file_wire.read_header_async(self.reader)
+        if flags & file_wire.FLAG_CLOSE:
+            self.closing = True
+        if flags & file_wire.FLAG_JSON:
+            response = file_wire.decode_json(await self.reader.readexactly(size))
+            return response.get('status', 'ERROR'), size
+        received = 0
+        while received < size:
+            received += len(await self.reader.readexactly(min(READ_CHUNK, size - received)))
+        return 'OK' if opcode == file_wire.OP_OK else 'ERROR', size
+
+    def close(self):
+        self.writer.close()
+
+
+class LoadGenerator:
+    def __init__(self, host, port, operation, name=None, payload=b'', rate=100.0, ramp_up=0.0, hold=10.0,
+                 ramp_down=0.0, poisson=False, connections=1000, seed=None, timeout=REQUEST_TIMEOUT):
+        self.host = host
+        self.port = port
+        self.operation = operation
+        self.name = name
+        self.payload = payload
+        self.rate = rate
+        self.ramp_up = ramp_up
+        self.hold = hold
+        self.ramp_down = ramp_down
+        self.poisson = poisson
+        self.connections = connections
+        self.seed = seed
+        self.timeout = timeout
+        self.records = []
+        self.wall_time = 0.0
+        self.max_inflight = 0
+        self._inflight = 0
+        self._idle = []
+        self._slots = None
+
+    def _frame(self):
+        if self.operation == 'download':
+            return file_wire.OP_GET, self.name, b''
+        if self.operation == 'upload':
+            return file_wire.OP_UPLOAD, self.name, self.payload
+        return file_wire.OP_LIST, '', b'{"limit": 100}'
+
+    async def _acquire(self):
+        await self._slots.acquire()
+        if self._idle:
+            return self._idle.pop()
+        try:
+            return await AsyncConnection.open(self.host, self.port, self.timeout)
+        except BaseException:
+            self._slots.release()
+            raise
+
+    def _release(self, conn, reusable):
+        if reusable and not conn.closing:
+            self._idle.append(conn)
+        else:
+            conn.close()
+        self._slots.release()
+
+    async def _one(self, intended):
+        # Latency runs from the scheduled time; waiting for a connection counts.
+        loop = asyncio.get_running_loop()
+        self._inflight += 1
+        self.max_inflight = max(self.max_inflight, self._inflight)
+        started = None
+        status, size = 'ERROR', 0
+        try:
+            conn = await self._acquire()
+            started = loop.time()
+            try:
+                status, size = await conn.request(*self._frame(), timeout=self.timeout)
+            except BaseException:
+                self._release(conn, False)
+                raise
+            self._release(conn, True)
+        except ServerBusy:
+            status = 'BUSY'  # open loop: shed requests are not retried
+        except asyncio.TimeoutError:
+            status = 'TIMEOUT'  # before OSError: TimeoutError is one of those
+        except (OSError, EOFError, asyncio.IncompleteReadError, file_wire.ProtocolError):
+            pass
+        finally:
+            self._inflight -= 1
+        finished = loop.time()
+        self.records.append((intended, started if started is not None else finished, finished, status, size))
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        self._slots = asyncio.Semaphore(self.connections)
+        tasks = set()
+        start = loop.time() + 0.1
+        for offset in arrival_times(self.rate, self.ramp_up, self.hold, self.ramp_down, self.poisson, self.seed):
+            delay = start + offset - loop.time()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            # behind schedule: fire at once, the lag shows up in the latency
+            task = loop.create_task(self._one(start + offset))
+            tasks.add(task)
+            task.add_done_callback(tasks.discard)
+        if tasks:
+            await asyncio.gather(*tasks)
+        self.wall_time = loop.time() - start
+        for conn in self._idle:
+            conn.close()
+        self._idle = []
+        self.records = [(i - start, s - start, f - start, status, size) for i, s, f, status, size in self.records]
+
+    def apply_to(self, stats):
+        """Add the run to a FileClient operation_stats dict (summary and CSV row)."""
+        for intended, started, finished, status, size in self.records:
+            latency = finished - intended
+            service = finished - started
+            ok = status == 'OK'
+            stats['results'].append({'status': 'OK' if ok else 'ERROR', 'duration': latency, 'file_size': size})
+            if ok:
+                stats['success_count'] += 1
+                stats['durations'].append(latency)
+                stats['throughputs'].append(size / service if service > 0 else 0)
+                stats['bytes'] += size
+            else:
+                stats['fail_count'] += 1
+        stats['wall_time'] += self.wall_time
+        stats['runs'] += 1
+
+    def summary(self):
+        latencies = [f - i for i, _, f, status, _ in self.records if status == 'OK']
+        # shed and timed-out requests waited too: leaving them out hides the queueing
+        everything = [f - i for i, _, f, _, _ in self.records]
+        service = [f - s for _, s, f, status, _ in self.records if status == 'OK']
+        return {
+            'requests': len(self.records),
+            'busy': sum(1 for record in self.records if record[3] == 'BUSY'),
+            'timeouts': sum(1 for record in self.records if record[3] == 'TIMEOUT'),
+            'offered_rate': len(self.records) / self.wall_time if self.wall_time else 0,
+            'completed_rate': len(latencies) / self.wall_time if self.wall_time else 0,
+            'max_inflight': self.max_inflight,
+            'latency': {q: percentile(latencies, q) for q in (50, 95, 99, 99.9)},
+            'latency_all': {q: percentile(everything, q) for q in (50, 95, 99, 99.9)},
+            'service': {q: percentile(service, q) for q in (50, 95, 99, 99.9)},
+        }
+
+    def write_requests(self, path):
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(REQUEST_COLUMNS)
+            for intended, started, finished, status, size in self.records:
+                writer.writerow([f'{intended:.6f}', f'{started:.6f}', f'{finished:.6f}',
+                                 f'{finished - intended:.6f}', f'{finished - started:.6f}', status, size])
+
+
+def _prepare(client, operation, size_mb):
+    if operation == 'list':
+        return None, b''
+    filepath = client.generate_dummy_file(size_mb)
+    if filepath is None:
+        raise RuntimeError(f"Cannot create {size_mb} MB dummy file")
+    name = os.path.basename(filepath)
+    if operation == 'upload':
+        with open(filepath, 'rb') as f:
+            return name, f.read()
+    if client.upload_file(filepath)['status'] != 'OK':
+        raise RuntimeError(f"Cannot seed {name} on the server")
+    return name, b''
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Open-loop asyncio load generator for FileServer')
+    parser.add_argument('--operation', choices=['download', 'upload', 'list'], default='download')
+    parser.add_argument('--size-mb', type=int, default=1, help='Size of the dummy file to download/upload')
+    parser.add_argument('--rate', type=float, default=100.0, help='Target arrival rate (requests/s) while holding')
+    parser.add_argument('--arrival', choices=['constant', 'poisson'], default='constant')
+    parser.add_argument('--ramp-up', type=float, default=0.0, help='Seconds to climb from 0 to --rate')
+    parser.add_argument('--hold', type=float, default=10.0, help='Seconds at --rate')
+    parser.add_argument('--ramp-down', type=float, default=0.0, help='Seconds to fall back to 0')
+    parser.add_argument('--connections', type=int, default=1000,
+                        help='Maximum concurrent connections (requests beyond it wait, and that wait counts)')
+    parser.add_argument('--seed', type=int, default=None, help='Seed for Poisson arrivals')
+    parser.add_argument('--timeout', type=float, default=REQUEST_TIMEOUT,
+                        help='Seconds per exchange (connect, HELLO, request) before it counts as TIMEOUT')
+    parser.add_argument('--host', default='172.16.16.101')
+    parser.add_argument('--port', type=int, default=6677)
+    parser.add_argument('--server-workers', type=int, default=0, help='Recorded in the CSV only')
+    parser.add_argument('--csv', default='stress_test_results.csv', help='Summary CSV (same format as the client)')
+    parser.add_argument('--requests-csv', default=None, help='Also write per-request timestamps here')
+
+    args = parser.parse_args()
+    if args.rate <= 0 or args.connections < 1:
+        parser.error('--rate and --connections must be positive')
+
+    # one descriptor per connection: lift the soft limit as far as allowed
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if soft != resource.RLIM_INFINITY and soft < args.connections + 64:
+        wanted = args.connections + 64
+        resource.setrlimit(resource.RLIMIT_NOFILE,
+                           (wanted if hard == resource.RLIM_INFINITY else min(hard, wanted), hard))
+
+    client = FileClient(args.host, args.port, dedup=False, csv_filename=args.csv)
+    try:
+        name, payload = _prepare(client, args.operation, args.size_mb)
+        generator = LoadGenerator(args.host, args.port, args.operation, name, payload, args.rate, args.ramp_up,
+                                  args.hold, args.ramp_down, args.arrival == 'poisson', args.connections, args.seed,
+                                  args.timeout)
+        client._reset_stats()
+        client.operation_stats.update({
+            'operation': args.operation,
+            'file_size_mb': args.size_mb if args.operation != 'list' else 0,
+            'client_pool_size': args.connections,
+            'server_pool_size': args.server_workers,
+            'executor_type': f'asyncio-{args.arrival}',
+        })
+        before = client._server_totals()
+        asyncio.run(generator.run())
+        after = client._server_totals() if before is not None else None
+        generator.apply_to(client.operation_stats)
+        if after is not None:
+            errors = after['errors'] - before['errors']
+            client.operation_stats['server_success'] = after['requests'] - before['requests'] - errors
+            client.operation_stats['server_fail'] = errors
+        client._display_results()
+        client._save_to_csv()
+
+        summary = generator.summary()
+        print(f"Open loop: {summary['requests']} requests, offered {summary['offered_rate']:.1f}/s, "
+              f"completed {summary['completed_rate']:.1f}/s, BUSY {summary['busy']}, TIMEOUT {summary['timeouts']}, "
+              f"max in flight {summary['max_inflight']}")
+        for label, key in (('Latency OK (dari jadwal)', 'latency'),
+                           ('Latency semua (termasuk BUSY/TIMEOUT)', 'latency_all'),
+                           ('Service time', 'service')):
+            values = ' / '.join(f"{summary[key][q]:.4f}" for q in (50, 95, 99, 99.9))
+            print(f"{label} p50/p95/p99/p99.9: {values} detik")
+        if args.requests_csv:
+            generator.write_requests(args.requests_csv)
+    finally:
+        client.close()
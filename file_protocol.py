@@ -1,7 +1,7 @@
 import json
 import logging
-import shlex
 
+from file_dispatch import CommandTable, summarize
 from file_interface import FileInterface
 
 """
@@ -14,20 +14,26 @@ pada akhirnya akan diproses dalam bentuk string
 
 * class FileProtocol akan memproses data yang masuk dalam bentuk
 string
+
+* command didaftarkan di CommandTable (file_dispatch), tabel yang sama
+dengan yang dipakai FileServer; hanya header yang di-parse, isi file
+pada UPLOAD diteruskan utuh dan yang dicatat di log hanya ringkasannya
 """
 
 class FileProtocol:
     def __init__(self):
         self.file = FileInterface()
-    
+        self.commands = CommandTable()
+        self.commands.register('list', lambda r: self.file.list(r.args))
+        self.commands.register('get', lambda r: self.file.get(r.args), min_args=1)
+        self.commands.register('upload', lambda r: self.file.upload([r.args[0], r.body]), min_args=1, body=True)
+        self.commands.register('delete', lambda r: self.file.delete(r.args), min_args=1)
+
     def proses_string(self, string_datamasuk=''):
-        logging.warning(f"string diproses: {string_datamasuk}")
-        c = shlex.split(string_datamasuk.lower())
         try:
-            c_request = c[0].strip()
-            logging.warning(f"memproses request: {c_request}")
-            params = [x for x in c[1:]]
-            cl = getattr(self.file, c_request)(params)
+            request = self.commands.parse(string_datamasuk)
+            logging.warning(f"memproses request: {summarize(request)}")
+            cl = self.commands.call(request)
             return json.dumps(cl)
         except Exception as e:
             logging.error(f"Error processing string: {e}")
@@ -37,4 +43,4 @@ if __name__ == '__main__':
     # contoh pemakaian
     fp = FileProtocol()
     print(fp.proses_string("LIST"))
-    print(fp.proses_string("GET pokijan.jpg"))
\ No newline at end of file
+    print(fp.proses_string("GET pokijan.jpg"))
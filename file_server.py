@@ -1,30 +1,177 @@
 import socket
 import json
 import base64
+import hashlib
 import logging
 import os
 import time
 import concurrent.futures
+import contextvars
 import statistics
 import csv
 import argparse
-from typing import List, Dict
+import asyncio
+import multiprocessing
+import multiprocessing.connection
+import selectors
+import signal
+import sys
+import threading
+from collections import deque, namedtuple
+from typing import List, Dict, Tuple, Union
+
+import file_delta
+import file_wire
+from file_admission import BUSY, AdmissionControl
+from file_cache import ContentCache
+from file_dispatch import OPCODE_REPLY, OPCODE_STREAM, CommandTable, Request
+from file_index import DirectoryIndex
+from file_stats import ServerStats
+from file_store import BlobStore
+from file_trace import Tracer, phase
 
 
 SERVER_IP = "172.16.16.101"
 SERVER_PORT = 6677  # Changed port number
 
+RECV_SIZE = 1024*1024
+TERMINATOR = b"\r\n\r\n"
+HEADER_SCAN_LIMIT = 64*1024
+ASYNC_BACKLOG = 1024
+PARTIAL_DIR = os.path.join('server_files', '.partial')
+PARTIAL_TTL = 24 * 3600
+INDEX_JOURNAL = os.path.join('server_files', '.index.journal')
+LIST_PAGE = 1000
+# UPLOAD_HASH: a claim on content being uploaded lapses after this long without
+# body progress (its uploader is presumed gone)
+UPLOAD_CLAIM_TTL = 10.0
+COALESCE_RETRY = 0.05
+# MGET: file sampai ukuran ini dibaca ke memori lebih dulu (paralel), yang lebih besar lewat sendfile
+BATCH_READ_MAX = 1024*1024
+BATCH_READ_AHEAD = 16
+BATCH_READERS = 8
+LISTENER = object()
+WAKEUP = object()
+
+class Base64FileWriter:
+    """Decode a TERMINATOR-ended base64 stream into a file as it arrives."""
+
+    def __init__(self, filepath: str):
+        self.filepath = filepath
+        self.file = open(filepath, 'wb')
+        self.digest = hashlib.sha256()
+        self.received = 0
+        self.pending = bytearray()
+        self.done = False
+
+    def _write(self, data: bytes) -> None:
+        with phase('disk'):
+            self.file.write(data)
+        self.digest.update(data)
+
+    @staticmethod
+    def _decode(data) -> bytes:
+        with phase('decode'):
+            return base64.b64decode(bytes(data))
+
+    def feed(self, data: bytes) -> bool:
+        self.received += len(data)
+        self.pending += data
+        idx = self.pending.find(TERMINATOR)
+        if idx != -1:
+            self._write(self._decode(self.pending[:idx]))
+            self.pending.clear()
+            self.done = True
+            return True
+
+        # Decode the largest 4-aligned prefix; a partial terminator
+        # (\r, \r\n, \r\n\r) is never part of the base64 alphabet.
+        body_len = len(self.pending.rstrip(b'\r\n'))
+        aligned = body_len - body_len % 4
+        if aligned:
+            self._write(self._decode(self.pending[:aligned]))
+            del self.pending[:aligned]
+        return False
+
+    def finish(self) -> None:
+        if not self.done:
+            self._write(self._decode(self.pending.rstrip(b'\r\n')))
+        self.file.close()
+
+    def abort(self) -> None:
+        self.file.close()
+        if os.path.exists(self.filepath):
+            os.remove(self.filepath)
+
+
+class ShedConnection:
+    """A connection answered BUSY by the accept loop, read and discarded until the peer closes."""
+
+    __slots__ = ('binary', 'buffer', 'answered')
+
+    def __init__(self, binary: bool):
+        self.binary = binary
+        self.buffer = bytearray()
+        self.answered = False
+
+
+# one MGET entry: open file (None on error), byte count, error message
+BatchEntry = namedtuple('BatchEntry', 'name f size error')
+
+
+class BinarySession:
+    """State of one binary connection that survives parking between requests."""
+
+    __slots__ = ('served', 'codec')
+
+    def __init__(self, codec: str = None):
+        self.served = 0
+        self.codec = codec
+
+
 class FileServer:
-    def __init__(self, worker_type: str = 'thread', workers: int = 1):
+    def __init__(self, worker_type: str = 'thread', workers: int = 1,
+                 idle_timeout: float = 30.0, max_requests: int = 100, cache_mb: int = 256,
+                 host: str = None, port: int = None, stats_file: str = None, stats_interval: float = 5.0,
+                 max_inflight: int = None, max_queued: int = None, max_uploads: int = None,
+                 trace_file: str = None, profile_sample: float = 0.0, profile_dir: str = 'profiles'):
         self._setup_directories()
         self.logger = self._configure_logging()
+        self.host = host or SERVER_IP
+        self.port = port or SERVER_PORT
         self.worker_type = worker_type
         self.workers = workers
-        self.success_count = 0
-        self.fail_count = 0
+        self.idle_timeout = idle_timeout
+        self.max_requests = max_requests
+        self.cache = ContentCache(cache_mb * 1024 * 1024)
+        self.store = BlobStore('server_files')
+        # pre-forked workers each hold a copy; the journal keeps them in step
+        self.index = DirectoryIndex('server_files', self.store.digest_of,
+                                    INDEX_JOURNAL if worker_type == 'process' else None)
+        self.stats = ServerStats()
+        self.stats_file = stats_file
+        self.stats_interval = stats_interval
+        self._executor = None
+        self._batch_executor = None
+        self._batch_lock = threading.Lock()
+        # in flight defaults to the pool size; uploads get half of it
+        self.max_inflight = max_inflight or workers
+        self.max_queued = max_queued if max_queued is not None else 4 * self.max_inflight
+        self.max_uploads = max_uploads if max_uploads is not None else max(1, self.max_inflight // 2)
+        self.admission = AdmissionControl(self.max_inflight, self.max_queued, self.max_uploads)
+        self.commands = self._register_commands()
+        # None when off, so the hot path pays one attribute check per request
+        self.tracer = Tracer(trace_file, profile_sample, profile_dir) if trace_file or profile_sample else None
 
     def _setup_directories(self) -> None:
         os.makedirs('server_files', exist_ok=True)
+        os.makedirs(PARTIAL_DIR, exist_ok=True)
+        # Drop resumable uploads nobody came back for.
+        cutoff = time.time() - PARTIAL_TTL
+        for name in os.listdir(PARTIAL_DIR):
+            path = os.path.join(PARTIAL_DIR, name)
+            if os.path.getmtime(path) < cutoff:
+                os.remove(path)
 
     def _configure_logging(self) -> logging.Logger:
         log_format = '%(asctime)s - %(levelname)s - %(message)s'
@@ -38,103 +185,1704 @@ class FileServer:
         return logging.getLogger(__name__)
 
     def _handle_connection(self, client_socket: socket.socket) -> None:
+        handed_off = False
+        self.stats.connection_opened()
+        command, bytes_in, start, trace = 'OTHER', 0, time.perf_counter(), None
         try:
-            data_received = ""
-            while True:
-                data = client_socket.recv(1024*1024)
-                if data:
-                    data_received += data.decode()
-                    if "\r\n\r\n" in data_received:
-                        break
-                else:
+            prefix = file_wire.recv_exact(client_socket, len(file_wire.MAGIC))
+            if prefix == file_wire.MAGIC:
+                session = self._handle_binary(client_socket)
+                handed_off = True
+                self._serve_binary(client_socket, session)
+                return
+
+            trace = self._begin_trace('text')
+            command, response, bytes_in = self._handle_text(client_socket, bytearray(prefix))
+            encoded = self._encode_text_response(response)
+            self._sendall(client_socket, encoded)
+            self._record(trace, command, start, bytes_in, len(encoded), not self._response_ok(response))
+        except Exception as e:
+            self.logger.error(f"Connection handling error: {str(e)}")
+            self._record(trace, command, start, bytes_in, error=True)
+        finally:
+            if not handed_off:
+                self._close(client_socket)
+
+    def _close(self, client_socket: socket.socket) -> None:
+        client_socket.close()
+        self.stats.connection_closed()
+
+    def _begin_trace(self, proto: str):
+        return self.tracer.begin(proto) if self.tracer else None
+
+    def _record(self, trace, command: str, start: float, bytes_in: int, bytes_out: int = 0,
+                error: bool = False) -> None:
+        self.stats.record(command, time.perf_counter() - start, bytes_in, bytes_out, error)
+        if trace is not None:
+            self.tracer.finish(trace, command, bytes_in, bytes_out, error)
+
+    @staticmethod
+    def _sendall(client_socket: socket.socket, data: bytes) -> None:
+        with phase('send'):
+            client_socket.sendall(data)
+
+    @staticmethod
+    def _sendfile(client_socket: socket.socket, f, offset: int, count: int) -> int:
+        with phase('send'):
+            return client_socket.sendfile(f, offset, count) if count else 0
+
+    def _encode_text_response(self, response) -> bytes:
+        if isinstance(response, bytes):
+            return response  # already encoded (cached GET body)
+        with phase('encode'):
+            return (json.dumps(response) + "\r\n\r\n").encode()
+
+    def _response_ok(self, response) -> bool:
+        return isinstance(response, bytes) or response.get('status') in ('OK', file_wire.NOT_MODIFIED)
+
+    def _text_command_name(self, command: bytes) -> str:
+        return self.commands.name_of(command) or 'OTHER'
+
+    def _scan_text_request(self, buffer: bytearray, scan_from: int) -> Tuple[str, object, int]:
+        # Only newly received bytes are scanned for the terminator; UPLOAD bodies
+        # are handed off as soon as the header is complete.
+        match = self.commands.match_stream(buffer)
+        if match:
+            return 'upload', match, scan_from
+
+        idx = buffer.find(TERMINATOR, scan_from)
+        if idx != -1:
+            return 'command', bytes(buffer[:idx]), scan_from
+        if len(buffer) > HEADER_SCAN_LIMIT:
+            return 'error', {'status': 'ERROR', 'data': 'Command too long'}, scan_from
+        return 'more', None, max(0, len(buffer) - len(TERMINATOR) + 1)
+
+    def _handle_text(self, client_socket: socket.socket, buffer: bytearray) -> Tuple[str, Union[Dict, bytes], int]:
+        """Serve one text request; returns (command name, response, bytes received)."""
+        scan_from = 0
+        while True:
+            with phase('parse'):
+                kind, value, scan_from = self._scan_text_request(buffer, scan_from)
+            if kind == 'upload':
+                request, body_start = value
+                if not self.admission.enter('UPLOAD'):
+                    self._abandon_claims(request.args[0])
+                    received = self._discard_text(client_socket, buffer[body_start:])
+                    return BUSY, self.admission.busy_response('UPLOAD'), body_start + received
+                start = time.perf_counter()
+                try:
+                    response, received = self._receive_upload_b64(client_socket, request.args[0],
+                                                                  buffer[body_start:])
+                finally:
+                    self.admission.leave('UPLOAD', time.perf_counter() - start)
+                if response['status'] != 'OK':
+                    self._abandon_claims(request.args[0])
+                return 'UPLOAD', response, body_start + received
+            if kind == 'command':
+                return self._text_command_name(value), self._process_command(value), len(buffer)
+            if kind == 'error':
+                return 'OTHER', value, len(buffer)
+
+            with phase('recv'):
+                data = client_socket.recv(RECV_SIZE)
+            if not data:
+                command = bytes(buffer)
+                return self._text_command_name(command), self._process_command(command), len(buffer)
+            buffer += data
+
+    def _discard_text(self, client_socket: socket.socket, pending: bytearray) -> int:
+        # Read a rejected text request up to its terminator so the reply is not lost to a reset.
+        received, tail = len(pending), bytes(pending)
+        while TERMINATOR not in tail:
+            data = client_socket.recv(RECV_SIZE)
+            if not data:
+                break
+            received += len(data)
+            tail = tail[-len(TERMINATOR):] + data
+        return received
+
+    def _receive_upload_b64(self, client_socket: socket.socket, filename: str,
+                            pending: bytearray) -> Tuple[Dict, int]:
+        try:
+            filepath = self._filepath(filename)
+            sink = Base64FileWriter(self.store.temp_path())
+            sink.file = self.store.progress(sink.file, filepath)
+        except Exception as e:
+            return {'status': 'ERROR', 'data': str(e)}, len(pending)
+        return self._feed_upload_b64(client_socket, filename, sink, pending), sink.received
+
+    def _feed_upload_b64(self, client_socket: socket.socket, filename: str,
+                         sink: Base64FileWriter, pending: bytearray) -> Dict:
+        try:
+            done = sink.feed(pending)
+            while not done:
+                with phase('recv'):
+                    data = client_socket.recv(RECV_SIZE)
+                if not data:
                     break
+                done = sink.feed(data)
+            sink.finish()
+            self._commit(filename, sink.filepath, sink.digest.hexdigest())
+            return {'status': 'OK', 'data': f'File {filename} uploaded successfully'}
+        except Exception as e:
+            sink.abort()
+            return {'status': 'ERROR', 'data': str(e)}
+
+    def _hello_response(self, session: BinarySession) -> Dict:
+        return {'status': 'OK', 'data': {
+            'version': file_wire.PROTOCOL_VERSION,
+            'max_requests': self.max_requests,
+            'idle_timeout': self.idle_timeout,
+            'codec': session.codec,
+        }}
+
+    def _open_session(self, opcode: int, payload: bytes) -> BinarySession:
+        if opcode != file_wire.OP_HELLO:
+            raise file_wire.ProtocolError('Binary session without HELLO')
+        hello = file_wire.decode_json(payload)
+        return BinarySession(file_wire.negotiate_codec(hello.get('codecs')))
 
-            command = data_received.split("\r\n\r\n")[0]
-            response = self._process_command(command)
-            json_response = json.dumps(response) + "\r\n\r\n"
-            client_socket.sendall(json_response.encode())
-            self.success_count += 1
+    def _handle_binary(self, client_socket: socket.socket) -> BinarySession:
+        client_socket.settimeout(self.idle_timeout)
+        client_socket.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        opcode, _, _, payload = file_wire.recv_frame(client_socket, HEADER_SCAN_LIMIT)
+        try:
+            session = self._open_session(opcode, payload)
+        except Exception as e:
+            file_wire.send_json(client_socket, file_wire.OP_ERROR, {'status': 'ERROR', 'data': str(e)})
+            raise
+        file_wire.send_json(client_socket, file_wire.OP_OK, self._hello_response(session))
+        return session
+
+    def _serve_binary(self, client_socket: socket.socket, session: BinarySession) -> None:
+        # One frame per call. Between requests a keep-alive connection is parked
+        # in the accept loop's selector, so an idle client does not pin a worker;
+        # the last response before max_requests carries FLAG_CLOSE.
+        command, bytes_in, start, trace = 'OTHER', 0, time.perf_counter(), None
+        try:
+            try:
+                opcode, request_flags, name, payload_len = file_wire.recv_header(client_socket)
+            except (file_wire.ConnectionClosed, socket.timeout):
+                self._close(client_socket)
+                return
+            start = time.perf_counter()
+            trace = self._begin_trace('binary')
+            command = file_wire.OPCODE_NAMES.get(opcode, 'OTHER')
+            bytes_in = file_wire.HEADER.size + len(name.encode('utf-8')) + payload_len
+            session.served += 1
+            flags = file_wire.FLAG_CLOSE if session.served >= self.max_requests else 0
+            if self.admission.enter(command):
+                try:
+                    ok, bytes_out = self._process_frame(client_socket, opcode, name, payload_len, flags,
+                                                        request_flags, session.codec)
+                finally:
+                    self.admission.leave(command, time.perf_counter() - start)
+            else:
+                ok, bytes_out = self._reject_frame(client_socket, opcode, name, payload_len, flags, request_flags)
+                command = BUSY
+            self._record(trace, command, start, bytes_in, bytes_out, not ok)
         except Exception as e:
             self.logger.error(f"Connection handling error: {str(e)}")
-            self.fail_count += 1
+            self._record(trace, command, start, bytes_in, error=True)
+            self._close(client_socket)
+            return
+
+        if flags & file_wire.FLAG_CLOSE:
+            self._close(client_socket)
+        else:
+            self._park(client_socket, session)
+
+    def _reject_frame(self, client_socket: socket.socket, opcode: int, name: str, payload_len: int, flags: int,
+                      request_flags: int) -> Tuple[bool, int]:
+        # The body is drained rather than the connection dropped: a reset
+        # could destroy the BUSY reply before the client reads it.
+        if self._is_upload(opcode):
+            self._abandon_claims(name)
+        self._drain_frame(client_socket, opcode, payload_len, request_flags)
+        response = self.admission.busy_response(file_wire.OPCODE_NAMES.get(opcode))
+        frame = file_wire.encode_json(file_wire.OP_ERROR, response, flags=flags)
+        self._sendall(client_socket, frame)
+        return False, len(frame)
+
+    def _drain_frame(self, client_socket: socket.socket, opcode: int, payload_len: int, request_flags: int) -> None:
+        # Only upload bodies are chunked; UPLOAD_AT keeps its fixed prefix raw.
+        if opcode not in (file_wire.OP_UPLOAD, file_wire.OP_UPLOAD_AT):
+            request_flags &= ~file_wire.FLAG_CHUNKED
+        if opcode == file_wire.OP_UPLOAD_AT:
+            prefix = min(payload_len, file_wire.UPLOAD_AT.size)
+            file_wire.drain(client_socket, prefix)
+            payload_len -= prefix
+        self._drain_body(client_socket, payload_len, request_flags)
+
+    def _admitted(self, ready: float, dispatched: float, func, *args) -> None:
+        # ready: the accept loop saw the connection readable; dispatched: handed to the pool
+        start = time.perf_counter()
+        if self.tracer:
+            self.tracer.waited(dispatched - ready, start - dispatched)
+        try:
+            func(*args)
         finally:
-            client_socket.close()
+            self.admission.done(time.perf_counter() - start)
+            if self.tracer:
+                self.tracer.waited(0.0, 0.0)  # a connection that closed without a request
+
+    def _shed(self, selector: selectors.BaseSelector, idle: Dict, client_socket: socket.socket,
+              session: BinarySession = None) -> None:
+        # Over capacity: answer BUSY from the accept loop instead of queueing.
+        # A new connection first has to show which protocol it speaks; a
+        # parked binary one is mid-session and gets the BUSY frame at once.
+        if session is None:
+            self.stats.connection_opened()
+        client_socket.setblocking(False)
+        shed = ShedConnection(binary=session is not None)
+        if shed.binary:
+            self._answer_busy(client_socket, shed)
+        selector.register(client_socket, selectors.EVENT_READ, shed)
+        idle[client_socket] = time.monotonic() + self.idle_timeout
+
+    def _answer_busy(self, client_socket: socket.socket, shed: ShedConnection) -> None:
+        response = self.admission.busy_response()
+        if shed.binary:
+            data = file_wire.encode_json(file_wire.OP_ERROR, response, flags=file_wire.FLAG_CLOSE)
+        else:
+            data = self._encode_text_response(response)
+        try:
+            client_socket.send(data)
+            # EOF tells the client nothing else is coming; its request is drained until it closes
+            client_socket.shutdown(socket.SHUT_WR)
+        except OSError:
+            pass
+        shed.answered = True
+        self.stats.record(BUSY, 0.0, len(shed.buffer), len(data), error=True)
+
+    def _read_shed(self, client_socket: socket.socket, shed: ShedConnection) -> bool:
+        """Consume what a shed connection sent; False once it is finished."""
+        try:
+            data = client_socket.recv(RECV_SIZE)
+        except BlockingIOError:
+            return True
+        except OSError:
+            return False
+        if not data:
+            return False
+        if not shed.answered:
+            shed.buffer += data
+            if len(shed.buffer) >= len(file_wire.MAGIC):
+                shed.binary = shed.buffer.startswith(file_wire.MAGIC)
+                self._answer_busy(client_socket, shed)
+        return True
 
-    def _process_command(self, command: str) -> Dict:
+    def _park(self, client_socket: socket.socket, session: BinarySession) -> None:
+        self._parked.append((client_socket, session))
         try:
-            parts = command.split()
-            if not parts:
-                return {'status': 'ERROR', 'data': 'Empty command'}
+            self._wakeup.send(b'\0')
+        except BlockingIOError:
+            pass
 
-            cmd = parts[0].upper()
-            if cmd == 'LIST':
-                return self._list_files()
-            elif cmd == 'UPLOAD' and len(parts) >= 3:
-                return self._upload_file(parts[1], ' '.join(parts[2:]))
-            elif cmd == 'GET' and len(parts) >= 2:
-                return self._download_file(parts[1])
+    def _accept_loop(self, server_socket: socket.socket, dispatch) -> None:
+        """
+        Accept new connections and watch parked keep-alive connections; whichever
+        becomes readable is handed to dispatch(func, *args).
+        """
+        selector = selectors.DefaultSelector()
+        wake_r, self._wakeup = socket.socketpair()
+        wake_r.setblocking(False)
+        self._wakeup.setblocking(False)
+        self._parked = deque()
+        idle = {}
+
+        server_socket.setblocking(False)
+        selector.register(server_socket, selectors.EVENT_READ, LISTENER)
+        selector.register(wake_r, selectors.EVENT_READ, WAKEUP)
+        while True:
+            events = selector.select(timeout=1.0)
+            ready = time.perf_counter()
+            for key, _ in events:
+                if key.data is LISTENER:
+                    try:
+                        client_socket, addr = server_socket.accept()
+                    except (BlockingIOError, InterruptedError):
+                        continue  # another pre-forked worker won the accept
+                    self.logger.info(f"New connection from {addr}")
+                    if not self.admission.try_admit():
+                        self._shed(selector, idle, client_socket)
+                        continue
+                    client_socket.setblocking(True)
+                    dispatch(self._admitted, ready, time.perf_counter(), self._handle_connection, client_socket)
+                elif key.data is WAKEUP:
+                    try:
+                        while wake_r.recv(4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    while self._parked:
+                        client_socket, session = self._parked.popleft()
+                        selector.register(client_socket, selectors.EVENT_READ, session)
+                        idle[client_socket] = time.monotonic() + self.idle_timeout
+                elif isinstance(key.data, ShedConnection):
+                    if not self._read_shed(key.fileobj, key.data):
+                        selector.unregister(key.fileobj)
+                        del idle[key.fileobj]
+                        self._close(key.fileobj)
+                else:
+                    selector.unregister(key.fileobj)
+                    del idle[key.fileobj]
+                    if not self.admission.try_admit():
+                        self._shed(selector, idle, key.fileobj, key.data)
+                        continue
+                    dispatch(self._admitted, ready, time.perf_counter(), self._serve_binary, key.fileobj, key.data)
+
+            now = time.monotonic()
+            for client_socket, deadline in list(idle.items()):
+                if now >= deadline:
+                    selector.unregister(client_socket)
+                    del idle[client_socket]
+                    self._close(client_socket)
+
+    def _recv_body(self, client_socket: socket.socket, f, size: int, request_flags: int, digest=None) -> None:
+        if request_flags & file_wire.FLAG_CHUNKED:
+            file_wire.recv_chunks_to_file(client_socket, f, size, digest)
+        else:
+            file_wire.recv_to_file(client_socket, f, size, RECV_SIZE, digest)
+
+    def _drain_body(self, client_socket: socket.socket, size: int, request_flags: int) -> None:
+        if request_flags & file_wire.FLAG_CHUNKED:
+            file_wire.drain_chunks(client_socket, size)
+        else:
+            file_wire.drain(client_socket, size)
+
+    def _receive_file(self, client_socket: socket.socket, filename: str, size: int, request_flags: int = 0) -> Dict:
+        # The body lands in a temp file, hashed on the way in, and only then
+        # replaces the name; readers never see a half-written file.
+        try:
+            filepath = self._filepath(filename)
+            temp = self.store.temp_path()
+            f = open(temp, 'wb')
+        except Exception as e:
+            self._drain_body(client_socket, size, request_flags)
+            return {'status': 'ERROR', 'data': str(e)}
+        try:
+            digest = hashlib.sha256()
+            with f:
+                self._recv_body(client_socket, self.store.progress(f, filepath), size, request_flags, digest)
+            self._commit(filename, temp, digest.hexdigest())
+            return {'status': 'OK', 'data': f'File {filename} uploaded successfully'}
+        except Exception:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+
+    def _process_frame(self, client_socket: socket.socket, opcode: int, name: str, payload_len: int, flags: int,
+                       request_flags: int = 0, codec: str = None) -> Tuple[bool, int]:
+        """Serve one frame; returns (ok, bytes sent) for the stats."""
+        entry = self.commands.opcode(opcode)
+        if entry is not None and entry.kind == OPCODE_STREAM:
+            response = None
+            try:
+                response = entry.handler(client_socket, name, payload_len, request_flags)
+            finally:
+                if response is None or response['status'] != 'OK':
+                    self._abandon_claims(name)
+        elif payload_len > HEADER_SCAN_LIMIT:
+            self._drain_body(client_socket, payload_len, request_flags)
+            response = {'status': 'ERROR', 'data': 'Request payload too large'}
+        else:
+            payload = file_wire.recv_exact(client_socket, payload_len) if payload_len else b''
+            if entry is None:
+                response = {'status': 'ERROR', 'data': 'Invalid command'}
+            elif entry.kind == OPCODE_REPLY:
+                return entry.handler(client_socket, name, payload, flags, request_flags, codec)
             else:
-                return {'status': 'ERROR', 'data': 'Invalid command'}
+                response = entry.handler(name, payload)
+        ok = response['status'] == 'OK'
+        frame = file_wire.encode_json(file_wire.OP_OK if ok else file_wire.OP_ERROR, response, flags=flags)
+        self._sendall(client_socket, frame)
+        return ok, len(frame)
+
+    def _get_frame(self, client_socket: socket.socket, name: str, payload: bytes, flags: int,
+                   request_flags: int, codec: str) -> Tuple[bool, int]:
+        # compressed only when the request itself says the client decodes chunks
+        if not request_flags & file_wire.FLAG_CHUNKED:
+            codec = None
+        *span, etag = self._parse_get(payload, request_flags)
+        return self._send_file(client_socket, name, flags, *span, codec=codec, if_none_match=etag)
+
+    def _signature_reply(self, client_socket: socket.socket, name: str, payload: bytes, flags: int,
+                         request_flags: int, codec: str) -> Tuple[bool, int]:
+        ok, frame = self._signature_frame(name, flags)
+        self._sendall(client_socket, frame)
+        return ok, len(frame)
+
+    def _parse_upload_hash(self, payload: bytes) -> Tuple[str, int]:
+        digest, size = file_wire.UPLOAD_HASH.unpack(payload)
+        return digest.hex(), size
+
+    def _parse_range(self, payload: bytes) -> Tuple[int, int, bool]:
+        # A GET payload, when present, is RANGE(offset, length); length 0 = to EOF.
+        if not payload:
+            return 0, 0, False
+        offset, length = file_wire.RANGE.unpack(payload)
+        return offset, length, True
+
+    def _parse_get(self, payload: bytes, request_flags: int) -> Tuple[int, int, bool, Union[str, None]]:
+        # With FLAG_ETAG the RANGE is followed by the if-none-match value ('' = just report it).
+        etag = None
+        if request_flags & file_wire.FLAG_ETAG:
+            payload, etag = payload[:file_wire.RANGE.size], payload[file_wire.RANGE.size:].decode('utf-8')
+        return (*self._parse_range(payload), etag)
+
+    def _not_modified(self, etag: str, flags: int) -> bytes:
+        return file_wire.encode_json(file_wire.OP_OK, {'status': file_wire.NOT_MODIFIED, 'data': 'Not modified',
+                                                       'etag': etag}, flags=flags)
+
+    def _open_range(self, filename: str, offset: int, length: int):
+        with phase('disk'):
+            f = open(self._filepath(filename), 'rb')
+            size = os.fstat(f.fileno()).st_size
+        if offset > size:
+            f.close()
+            raise ValueError(f'Offset {offset} beyond file size {size}')
+        count = size - offset if not length else min(length, size - offset)
+        return f, size, count
+
+    def _range_header(self, filename: str, flags: int, offset: int, size: int, count: int, ranged: bool,
+                      etag: str = None) -> bytes:
+        # With FLAG_CHUNKED in flags, count is still the raw byte count.
+        # Prefixes, when present, come in this order: ETAG, RANGE.
+        prefix = b''
+        if etag is not None:
+            flags |= file_wire.FLAG_ETAG
+            prefix += file_wire.pack_etag(etag)
+        if ranged:
+            flags |= file_wire.FLAG_RANGE
+            prefix += file_wire.RANGE.pack(offset, size)
+        return file_wire.pack_header(file_wire.OP_OK, filename.encode('utf-8'), len(prefix) + count, flags) + prefix
+
+    def _send_file(self, client_socket: socket.socket, filename: str, flags: int = 0,
+                   offset: int = 0, length: int = 0, ranged: bool = False, codec: str = None,
+                   if_none_match: str = None) -> Tuple[bool, int]:
+        # Header first, then the body goes kernel-to-socket via sendfile(2)
+        # without passing through the Python heap, or chunk by chunk through
+        # the negotiated codec when the client asked for compression.
+        try:
+            f, size, count = self._open_range(filename, offset, length)
+        except Exception as e:
+            message = 'File not found' if isinstance(e, FileNotFoundError) else str(e)
+            frame = file_wire.encode_json(file_wire.OP_ERROR, {'status': 'ERROR', 'data': message}, flags=flags)
+            self._sendall(client_socket, frame)
+            return False, len(frame)
+
+        with f:
+            etag = None
+            if if_none_match is not None:
+                etag = self.store.validator(os.fstat(f.fileno()))
+                if if_none_match == etag:
+                    frame = self._not_modified(etag, flags)
+                    self._sendall(client_socket, frame)
+                    return True, len(frame)
+            if codec:
+                header = self._range_header(filename, flags | file_wire.FLAG_CHUNKED, offset, size, count, ranged,
+                                            etag)
+                self._sendall(client_socket, header)
+                f.seek(offset)
+                encoder = file_wire.ChunkEncoder(codec)
+                file_wire.send_chunks(client_socket, f, count, encoder)
+                return True, len(header) + encoder.wire_bytes
+            header = self._range_header(filename, flags, offset, size, count, ranged, etag)
+            self._sendall(client_socket, header)
+            sent = self._sendfile(client_socket, f, offset, count)
+            if sent != count:
+                raise file_wire.ProtocolError(f'File {filename} changed during send')
+            return True, len(header) + sent
+
+    def _batch_pool(self) -> concurrent.futures.ThreadPoolExecutor:
+        # Separate from the connection pool: a handler waiting on read-ahead
+        # queued behind other handlers would deadlock. Created lazily so each
+        # pre-forked worker gets its own after the fork.
+        if self._batch_executor is None:
+            with self._batch_lock:
+                if self._batch_executor is None:
+                    self._batch_executor = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=BATCH_READERS, thread_name_prefix='batch')
+        return self._batch_executor
+
+    def _check_batch(self, names) -> Union[Dict, None]:
+        if not isinstance(names, list) or not all(isinstance(name, str) for name in names):
+            return {'status': 'ERROR', 'data': 'MGET payload must be a JSON list of names'}
+        if len(names) > file_wire.MAX_BATCH:
+            return {'status': 'ERROR', 'data': f'At most {file_wire.MAX_BATCH} files per batch'}
+        return None
+
+    def _open_entry(self, name: str) -> BatchEntry:
+        try:
+            with phase('disk'):
+                f = open(self._filepath(name), 'rb')
+                return BatchEntry(name, f, os.fstat(f.fileno()).st_size, None)
+        except Exception as e:
+            message = ('File not found' if isinstance(e, FileNotFoundError) else str(e)).encode('utf-8')
+            return BatchEntry(name, None, len(message), message)
+
+    def _open_entries(self, names: List[str]) -> List[BatchEntry]:
+        return [self._open_entry(name) for name in names]
+
+    def _batch_header(self, entries: List[BatchEntry], flags: int) -> bytes:
+        # The total is known up front from fstat, so the reply is a single frame.
+        total = sum(file_wire.ENTRY.size + len(e.name.encode('utf-8')) + e.size for e in entries)
+        return file_wire.pack_header(file_wire.OP_OK, b'', total, flags)
+
+    def _entry_header(self, entry: BatchEntry) -> bytes:
+        return file_wire.pack_entry(entry.name, entry.size,
+                                    file_wire.ENTRY_ERROR if entry.f is None else file_wire.ENTRY_OK)
+
+    @staticmethod
+    def _read_entry(entry: BatchEntry) -> bytes:
+        data = os.pread(entry.f.fileno(), entry.size, 0)
+        if len(data) != entry.size:
+            raise file_wire.ProtocolError(f'File {entry.name} changed during send')
+        return data
+
+    @staticmethod
+    def _prefetched(entry: BatchEntry) -> bool:
+        return entry.f is not None and entry.size <= BATCH_READ_MAX
+
+    def _send_batch(self, client_socket: socket.socket, names, flags: int) -> Tuple[bool, int]:
+        # Entries go out in request order. Small files are read ahead on a
+        # pool, at most BATCH_READ_AHEAD at a time, so their disk reads
+        # overlap with sending; big ones go through sendfile(2) in turn.
+        error = self._check_batch(names)
+        if error:
+            frame = file_wire.encode_json(file_wire.OP_ERROR, error, flags=flags)
+            self._sendall(client_socket, frame)
+            return False, len(frame)
+
+        entries = self._open_entries(names)
+        window = deque()
+        try:
+            header = self._batch_header(entries, flags)
+            self._sendall(client_socket, header)
+            sent = len(header)
+            for entry in entries:
+                window.append((entry, self._batch_pool().submit(self._read_entry, entry)
+                               if self._prefetched(entry) else None))
+                if len(window) < BATCH_READ_AHEAD:
+                    continue
+                sent += self._send_entry(client_socket, *window.popleft())
+            while window:
+                sent += self._send_entry(client_socket, *window.popleft())
+            self._record_batch(entries)
+            return True, sent
+        finally:
+            # reads still in flight use the descriptors closed below
+            concurrent.futures.wait([future for _, future in window if future is not None])
+            for entry in entries:
+                if entry.f is not None:
+                    entry.f.close()
+
+    def _record_batch(self, entries: List[BatchEntry]) -> None:
+        self.stats.record_entries('MGET', len(entries), sum(1 for entry in entries if entry.f is None))
+
+    def _send_entry(self, client_socket: socket.socket, entry: BatchEntry, future) -> int:
+        header = self._entry_header(entry)
+        if entry.f is None or future is not None:
+            data = entry.error if entry.f is None else future.result()
+            self._sendall(client_socket, header + data)
+            return len(header) + len(data)
+        self._sendall(client_socket, header)
+        sent = self._sendfile(client_socket, entry.f, 0, entry.size)
+        if sent != entry.size:
+            raise file_wire.ProtocolError(f'File {entry.name} changed during send')
+        return len(header) + sent
+
+    def _commit_entry(self, name: str, temp: str, digest: str) -> Dict:
+        try:
+            self._commit(name, temp, digest)
+            return {'name': name, 'status': 'OK', 'data': f'File {name} uploaded successfully'}
+        except Exception as e:
+            if os.path.exists(temp):
+                os.remove(temp)
+            return {'name': name, 'status': 'ERROR', 'data': str(e)}
+
+    def _batch_response(self, results: List[Dict]) -> Dict:
+        stored = sum(1 for r in results if r['status'] == 'OK')
+        self.stats.record_entries('MUPLOAD', len(results), len(results) - stored)
+        return {'status': 'OK', 'data': results, 'stored': stored, 'failed': len(results) - stored}
+
+    def _receive_batch(self, client_socket: socket.socket, payload_len: int) -> Dict:
+        # Each entry lands in its own temp file; ingest (link + index update)
+        # runs on the batch pool while the next entry is still being read.
+        results = []
+        remaining = payload_len
+        while remaining:
+            if remaining < file_wire.ENTRY.size:
+                raise file_wire.ProtocolError('Truncated MUPLOAD entry')
+            _, name, size = file_wire.recv_entry(client_socket)
+            remaining -= file_wire.ENTRY.size + len(name.encode('utf-8')) + size
+            if remaining < 0 or len(results) >= file_wire.MAX_BATCH:
+                raise file_wire.ProtocolError('MUPLOAD entry exceeds frame')
+            try:
+                self._filepath(name)
+                temp = self.store.temp_path()
+                f = open(temp, 'wb')
+            except Exception as e:
+                file_wire.drain(client_socket, size)
+                results.append({'name': name, 'status': 'ERROR', 'data': str(e)})
+                continue
+            try:
+                digest = hashlib.sha256()
+                with f:
+                    file_wire.recv_to_file(client_socket, f, size, RECV_SIZE, digest)
+            except Exception:
+                os.remove(temp)
+                raise
+            results.append(self._batch_pool().submit(self._commit_entry, name, temp, digest.hexdigest()))
+        return self._batch_response([r if isinstance(r, dict) else r.result() for r in results])
+
+    def _signature_frame(self, filename: str, flags: int) -> Tuple[bool, bytes]:
+        # Block signatures of the current copy, cached like file content and
+        # dropped with it when the name is written.
+        try:
+            filepath = self._filepath(filename)
+
+            def load() -> bytes:
+                with phase('disk'), open(filepath, 'rb') as f:
+                    return file_delta.signature(f, os.fstat(f.fileno()).st_size)
+
+            payload = self.cache.get(filepath, 'signature', load)
         except Exception as e:
+            message = 'File not found' if isinstance(e, FileNotFoundError) else str(e)
+            return False, file_wire.encode_json(file_wire.OP_ERROR, {'status': 'ERROR', 'data': message}, flags=flags)
+        return True, file_wire.pack_header(file_wire.OP_OK, filename.encode('utf-8'), len(payload), flags) + payload
+
+    def _open_delta(self, filename: str):
+        base = open(self._filepath(filename), 'rb')
+        try:
+            temp = self.store.temp_path()
+            return base, temp, open(temp, 'wb')
+        except Exception:
+            base.close()
+            raise
+
+    def _commit_delta(self, filename: str, temp: str, patcher, error: str,
+                      digest: bytes, size: int) -> Dict:
+        if error is None:
+            try:
+                patcher.check(digest, size)
+            except file_delta.DeltaError as e:
+                error = str(e)
+        if error is not None:
+            os.remove(temp)
+            return {'status': 'ERROR', 'data': error}
+        self._commit(filename, temp, digest.hex())
+        return {'status': 'OK', 'data': f'File {filename} uploaded successfully (delta)', 'delta': True}
+
+    def _receive_delta(self, client_socket: socket.socket, filename: str, payload_len: int) -> Dict:
+        # The new file is rebuilt in a temp file from blocks of the current copy
+        # and the literals on the wire, checked against the client's SHA-256 and
+        # only then put in place; readers keep seeing the old file until then.
+        if payload_len < file_wire.DELTA.size:
+            file_wire.drain(client_socket, payload_len)
+            return {'status': 'ERROR', 'data': 'Incomplete DELTA header'}
+        digest, size, block_size = file_wire.DELTA.unpack(file_wire.recv_exact(client_socket, file_wire.DELTA.size))
+        remaining = payload_len - file_wire.DELTA.size
+        try:
+            base, temp, out = self._open_delta(filename)
+        except Exception as e:
+            file_wire.drain(client_socket, remaining)
+            return {'status': 'ERROR', 'data': 'File not found' if isinstance(e, FileNotFoundError) else str(e)}
+        error = patcher = None
+        try:
+            with base, out:
+                try:
+                    patcher = file_delta.DeltaPatcher(base, out, block_size)
+                except file_delta.DeltaError as e:
+                    error = str(e)
+                while remaining:
+                    kind, first, length = file_wire.DELTA_OP.unpack(
+                        file_wire.recv_exact(client_socket, file_wire.DELTA_OP.size))
+                    remaining -= file_wire.DELTA_OP.size
+                    if kind == file_wire.DELTA_LITERAL:
+                        if length > remaining:
+                            raise file_wire.ProtocolError('Literal exceeds frame')
+                        if error is None:
+                            file_wire.recv_to_file(client_socket, patcher, length, RECV_SIZE)
+                        else:
+                            file_wire.drain(client_socket, length)
+                        remaining -= length
+                    elif kind != file_wire.DELTA_COPY:
+                        raise file_wire.ProtocolError(f'Unknown delta op {kind}')
+                    elif error is None:
+                        try:
+                            patcher.copy(first, length)
+                        except file_delta.DeltaError as e:
+                            error = str(e)  # keep reading so the connection stays usable
+            return self._commit_delta(filename, temp, patcher, error, digest, size)
+        except Exception:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+
+    def _partial_path(self, filename: str, upload_id: bytes) -> str:
+        self._filepath(filename)
+        return os.path.join(PARTIAL_DIR, f"{filename}.{upload_id.hex()}")
+
+    def _open_part(self, filename: str, upload_id: bytes, offset: int):
+        # Bytes already on disk count as committed; a resumed upload may rewind
+        # but never skip past them.
+        path = self._partial_path(filename, upload_id)
+        committed = os.path.getsize(path) if os.path.exists(path) else 0
+        if offset > committed:
+            raise ValueError(f'Offset {offset} beyond committed size {committed}')
+        f = open(path, 'r+b' if committed else 'wb')
+        f.seek(offset)
+        f.truncate()
+        return f, path
+
+    def _commit_part(self, filename: str, path: str, committed: int, total: int) -> Dict:
+        if committed > total:
+            os.remove(path)
+            return {'status': 'ERROR', 'data': f'Upload exceeds declared size {total}'}
+        if committed < total:
+            return {'status': 'OK', 'data': f'File {filename} partially uploaded', 'committed': committed}
+        self._commit(filename, path)
+        return {'status': 'OK', 'data': f'File {filename} uploaded successfully', 'committed': committed}
+
+    def _receive_part(self, client_socket: socket.socket, filename: str, payload_len: int,
+                      request_flags: int = 0) -> Dict:
+        # The UPLOAD_AT prefix is always raw; only the body may be chunked.
+        if payload_len < file_wire.UPLOAD_AT.size:
+            file_wire.drain(client_socket, payload_len)
+            return {'status': 'ERROR', 'data': 'Incomplete UPLOAD_AT header'}
+        offset, total, upload_id = file_wire.UPLOAD_AT.unpack(file_wire.recv_exact(client_socket, file_wire.UPLOAD_AT.size))
+        size = payload_len - file_wire.UPLOAD_AT.size
+        try:
+            f, path = self._open_part(filename, upload_id, offset)
+        except Exception as e:
+            self._drain_body(client_socket, size, request_flags)
             return {'status': 'ERROR', 'data': str(e)}
+        # If the connection drops mid-body, what was written stays committed.
+        with f:
+            self._recv_body(client_socket, self.store.progress(f, self._filepath(filename)), size, request_flags)
+        return self._commit_part(filename, path, offset + size, total)
 
-    def _list_files(self) -> Dict:
+    def _upload_status(self, filename: str, upload_id: bytes) -> Dict:
         try:
-            files = os.listdir('server_files')
-            return {'status': 'OK', 'data': files}
+            path = self._partial_path(filename, upload_id)
+            committed = os.path.getsize(path) if os.path.exists(path) else 0
+            return {'status': 'OK', 'data': f'{committed} bytes committed', 'committed': committed}
+        except Exception as e:
+            return {'status': 'ERROR', 'data': str(e)}
+
+    def _register_commands(self) -> CommandTable:
+        # Text commands. UPLOAD is a stream command: its base64 body is
+        # decoded as it arrives and never parsed as part of the header.
+        commands = CommandTable(HEADER_SCAN_LIMIT)
+        commands.register('LIST', lambda r: self._list_files(self._parse_list_options(r.args)))
+        commands.register('UPLOAD', lambda r: self._upload_file(r.args[0], r.body), min_args=1, stream=True)
+        commands.register('GET', self._get_command, min_args=1)
+        commands.register('UPLOAD_STATUS', lambda r: self._upload_status(r.args[0], bytes.fromhex(r.args[1])),
+                          min_args=2)
+        commands.register('CHECKSUM', lambda r: self._checksum(r.args[0]), min_args=1)
+        commands.register('CACHE_STATS', lambda r: self._cache_stats())
+        commands.register('UPLOAD_HASH', lambda r: self._upload_hash(r.args[0], r.args[1].lower(), int(r.args[2])),
+                          min_args=3)
+        commands.register('DELETE', lambda r: self._delete_file(r.args[0]), min_args=1)
+        commands.register('STATS', lambda r: self._server_stats())
+        self._register_opcodes(commands)
+        return commands
+
+    def _register_opcodes(self, commands: CommandTable) -> None:
+        # Binary opcodes, one entry each for the threaded, pre-fork and asyncio paths.
+        # Stream handlers read their own body; reply handlers write their own response.
+        commands.register_opcode(file_wire.OP_UPLOAD, self._receive_file, self._receive_file_async,
+                                 kind=OPCODE_STREAM)
+        commands.register_opcode(file_wire.OP_UPLOAD_AT, self._receive_part, self._receive_part_async,
+                                 kind=OPCODE_STREAM)
+        commands.register_opcode(file_wire.OP_MUPLOAD,
+                                 lambda sock, name, size, request_flags: self._receive_batch(sock, size),
+                                 lambda reader, name, size, request_flags: self._receive_batch_async(reader, size),
+                                 kind=OPCODE_STREAM)
+        commands.register_opcode(file_wire.OP_DELTA,
+                                 lambda sock, name, size, request_flags: self._receive_delta(sock, name, size),
+                                 lambda reader, name, size, request_flags: self._receive_delta_async(reader, name,
+                                                                                                     size),
+                                 kind=OPCODE_STREAM)
+        commands.register_opcode(file_wire.OP_GET, self._get_frame, self._get_frame_async, kind=OPCODE_REPLY)
+        commands.register_opcode(file_wire.OP_MGET,
+                                 lambda sock, name, payload, flags, *_: self._send_batch(
+                                     sock, file_wire.decode_json(payload), flags),
+                                 lambda writer, name, payload, flags, *_: self._send_batch_async(
+                                     writer, file_wire.decode_json(payload), flags),
+                                 kind=OPCODE_REPLY)
+        commands.register_opcode(file_wire.OP_SIGNATURE, self._signature_reply, self._signature_reply_async,
+                                 kind=OPCODE_REPLY)
+        commands.register_opcode(file_wire.OP_LIST,
+                                 lambda name, payload: self._list_files(file_wire.decode_json(payload)))
+        commands.register_opcode(file_wire.OP_UPLOAD_STATUS, self._upload_status)
+        commands.register_opcode(file_wire.OP_CHECKSUM, lambda name, payload: self._checksum(name))
+        commands.register_opcode(file_wire.OP_CACHE_STATS, lambda name, payload: self._cache_stats(), inline=True)
+        commands.register_opcode(file_wire.OP_UPLOAD_HASH,
+                                 lambda name, payload: self._upload_hash(name, *self._parse_upload_hash(payload)))
+        commands.register_opcode(file_wire.OP_DELETE, lambda name, payload: self._delete_file(name))
+        commands.register_opcode(file_wire.OP_STATS, lambda name, payload: self._server_stats(), inline=True)
+
+    def _process_command(self, command: bytes) -> Union[Dict, bytes]:
+        try:
+            with phase('parse'):
+                request = self.commands.parse(command)
+            return self.commands.call(request)
+        except Exception as e:
+            return {'status': 'ERROR', 'data': str(e)}
+
+    def _get_command(self, request: Request) -> Union[Dict, bytes]:
+        # GET name: whole file (cached); GET name offset [length]: one range;
+        # GET name if-none-match <etag>: NOT_MODIFIED while the etag still matches
+        filename, *span = request.args
+        if len(span) == 2 and span[0].lower() == 'if-none-match':
+            try:
+                etag = self.store.validator(os.stat(self._filepath(filename)))
+            except FileNotFoundError:
+                return {'status': 'ERROR', 'data': 'File not found'}
+            except Exception as e:
+                return {'status': 'ERROR', 'data': str(e)}
+            if etag == span[1]:
+                return {'status': file_wire.NOT_MODIFIED, 'data': 'Not modified', 'etag': etag}
+            span = []
+        if not span:
+            return self._download_encoded(filename)
+        offset = int(span[0])
+        length = int(span[1]) if len(span) >= 2 else 0
+        return self._download_file(filename, offset, length)
+
+    def _filepath(self, filename: str) -> str:
+        # Dot-names are reserved for server bookkeeping (.partial, .blobs, .tmp).
+        if not filename or filename.startswith('.') or '/' in filename or os.sep in filename:
+            raise ValueError(f'Invalid filename: {filename!r}')
+        return os.path.join('server_files', filename)
+
+    def _parse_list_options(self, tokens: List[str]) -> Dict:
+        # text form: LIST [prefix=..] [cursor=..] [limit=..] [sort=name|size|mtime] [order=asc|desc] [detail=1]
+        options = {}
+        for token in tokens:
+            key, _, value = token.partition('=')
+            options[key.lower()] = value
+        if 'limit' in options:
+            options['limit'] = int(options['limit'])
+        if 'detail' in options:
+            options['detail'] = options['detail'].lower() in ('1', 'true', 'yes')
+        return options
+
+    def _list_files(self, options: Dict = None) -> Dict:
+        # A bare LIST still returns every name; any option switches to pages.
+        try:
+            if not options:
+                return {'status': 'OK', 'data': self.index.names()}
+            limit = max(1, min(int(options.get('limit') or LIST_PAGE), LIST_PAGE))
+            entries, cursor = self.index.page(prefix=options.get('prefix') or '', cursor=options.get('cursor'),
+                                              limit=limit, sort=options.get('sort') or 'name',
+                                              reverse=options.get('order') == 'desc')
+            if options.get('detail'):
+                data = [entry._asdict() for entry in entries]
+            else:
+                data = [entry.name for entry in entries]
+            return {'status': 'OK', 'data': data, 'next_cursor': cursor, 'total': len(self.index)}
         except Exception as e:
             return {'status': 'ERROR', 'data': str(e)}
 
     def _upload_file(self, filename: str, content_b64: str) -> Dict:
         try:
-            filepath = os.path.join('server_files', filename)
-            with open(filepath, 'wb') as f:
-                f.write(base64.b64decode(content_b64))
+            with phase('decode'):
+                content = base64.b64decode(content_b64)
+            return self._store_file(filename, content)
+        except Exception as e:
+            return {'status': 'ERROR', 'data': str(e)}
+
+    def _store_file(self, filename: str, content: bytes) -> Dict:
+        try:
+            filepath = self._filepath(filename)
+            temp = self.store.temp_path()
+            with phase('disk'), open(temp, 'wb') as f:
+                f.write(content)
+            self._commit(filename, temp, hashlib.sha256(content).hexdigest())
             return {'status': 'OK', 'data': f'File {filename} uploaded successfully'}
         except Exception as e:
             return {'status': 'ERROR', 'data': str(e)}
 
-    def _download_file(self, filename: str) -> Dict:
+    def _upload_hash(self, filename: str, digest: str, size: int) -> Dict:
+        # Hash-first upload: when the content is already stored, the name is
+        # linked to it and the client skips sending the body. The first client
+        # told to send a body claims the digest; concurrent uploads of the same
+        # content are asked to poll until its blob exists instead of writing it
+        # a second time. The claim stays fresh while the claimer's body arrives
+        # and is dropped if that upload fails (_abandon_claims).
         try:
-            filepath = os.path.join('server_files', filename)
-            if not os.path.exists(filepath):
-                return {'status': 'ERROR', 'data': 'File not found'}
+            filepath = self._filepath(filename)
+            with self.store.writing(filepath):
+                linked = self.store.link(digest, filepath, size)
+                if linked:
+                    self._invalidate(filename)
+            if linked:
+                return {'status': 'OK', 'data': f'File {filename} uploaded successfully (deduplicated)',
+                        'dedup': True}
+            if not self.store.claim(digest, UPLOAD_CLAIM_TTL, filepath):
+                # idle: how long the claimer has gone without progress, so a
+                # waiter can tell a slow upload from a stalled one
+                return {'status': 'OK', 'data': 'Same content is being uploaded, retry', 'dedup': False,
+                        'pending': True, 'retry_after': COALESCE_RETRY,
+                        'idle': round(self.store.claim_idle(digest) or 0.0, 3)}
+            return {'status': 'OK', 'data': 'Content not stored yet, send the file', 'dedup': False}
+        except Exception as e:
+            return {'status': 'ERROR', 'data': str(e)}
+
+    def _is_upload(self, opcode: int) -> bool:
+        entry = self.commands.opcode(opcode)
+        return entry is not None and entry.kind == OPCODE_STREAM
+
+    def _abandon_claims(self, filename: str) -> None:
+        # An upload of filename failed or was refused: give up the claims it
+        # holds so coalesced waiters send the body themselves right away.
+        if not filename:
+            return  # MUPLOAD frames carry their names per entry
+        try:
+            self.store.release_claims(self._filepath(filename))
+        except ValueError:
+            pass
+
+    def _commit(self, filename: str, temp: str, digest: str = None) -> None:
+        # Every write of a name ends here. The name's lock spans the swap and
+        # the cache/index update, so writers of one name commit one at a time
+        # and the last to commit wins; readers see the old file or the new one.
+        filepath = self._filepath(filename)
+        with self.store.writing(filepath):
+            self.store.ingest(temp, filepath, digest)
+            self._invalidate(filename)
+
+    def _delete_file(self, filename: str) -> Dict:
+        try:
+            filepath = self._filepath(filename)
+            with self.store.writing(filepath):
+                self.store.release(filepath)
+                self._invalidate(filename)
+            return {'status': 'OK', 'data': f'File {filename} deleted successfully'}
+        except FileNotFoundError:
+            return {'status': 'ERROR', 'data': 'File not found'}
+        except Exception as e:
+            return {'status': 'ERROR', 'data': str(e)}
 
+    def _checksum(self, filename: str) -> Dict:
+        try:
+            filepath = self._filepath(filename)
+            known = self.store.digest_of(filepath)
+            if known is not None:
+                # content-addressed: the blob name is the checksum
+                return {'status': 'OK', 'data': f'Checksum of {filename}', 'sha256': known,
+                        'file_size': os.path.getsize(filepath)}
+            digest = hashlib.sha256()
             with open(filepath, 'rb') as f:
-                content = base64.b64encode(f.read()).decode()
-            return {'status': 'OK', 'data_file': content, 'data': f'File {filename} downloaded successfully'}
+                size = os.fstat(f.fileno()).st_size
+                for chunk in iter(lambda: f.read(RECV_SIZE), b''):
+                    digest.update(chunk)
+            return {'status': 'OK', 'data': f'Checksum of {filename}', 'sha256': digest.hexdigest(), 'file_size': size}
+        except FileNotFoundError:
+            return {'status': 'ERROR', 'data': 'File not found'}
+        except Exception as e:
+            return {'status': 'ERROR', 'data': str(e)}
+
+    def _invalidate(self, filename: str) -> None:
+        # Called after every write or delete of a name.
+        self.cache.invalidate(self._filepath(filename))
+        self.index.refresh(filename)
+
+    def _read_content(self, filepath: str) -> bytes:
+        def load() -> bytes:
+            with phase('disk'), open(filepath, 'rb') as f:
+                return f.read()
+        return self.cache.get(filepath, 'content', load)
+
+    def _download_file(self, filename: str, offset: int = 0, length: int = 0) -> Dict:
+        try:
+            filepath = self._filepath(filename)
+            size = os.path.getsize(filepath)
+            if offset > size:
+                raise ValueError(f'Offset {offset} beyond file size {size}')
+            end = size if not length else min(offset + length, size)
+            if size <= self.cache.max_entry_bytes:
+                content = self._read_content(filepath)[offset:end]
+            else:
+                with phase('disk'), open(filepath, 'rb') as f:
+                    f.seek(offset)
+                    content = f.read(end - offset)
+            with phase('encode'):
+                data_file = base64.b64encode(content).decode()
+            response = {'status': 'OK', 'data_file': data_file,
+                        'data': f'File {filename} downloaded successfully',
+                        'etag': self.store.validator(os.stat(filepath))}
+            if offset or length:
+                response.update(offset=offset, file_size=size)
+            return response
+        except FileNotFoundError:
+            return {'status': 'ERROR', 'data': 'File not found'}
+        except Exception as e:
+            return {'status': 'ERROR', 'data': str(e)}
+
+    def _download_encoded(self, filename: str):
+        # Full-file text GET: the finished JSON body (base64 + framing) is cached
+        # so repeated GETs skip both the disk read and the encode.
+        try:
+            filepath = self._filepath(filename)
+            if os.path.getsize(filepath) * 4 // 3 > self.cache.max_entry_bytes:
+                return self._download_file(filename)
+
+            def load() -> bytes:
+                content = self._read_content(filepath)
+                with phase('encode'):
+                    response = {'status': 'OK', 'data_file': base64.b64encode(content).decode(),
+                                'data': f'File {filename} downloaded successfully',
+                                'etag': self.store.validator(os.stat(filepath))}
+                    return (json.dumps(response) + "\r\n\r\n").encode()
+            return self.cache.get(filepath, 'legacy', load)
+        except FileNotFoundError:
+            return {'status': 'ERROR', 'data': 'File not found'}
+        except Exception as e:
+            return {'status': 'ERROR', 'data': str(e)}
+
+    def _cache_stats(self) -> Dict:
+        return {'status': 'OK', 'data': self.cache.stats()}
+
+    def _stats_extra(self) -> Dict:
+        # Requests waiting for a free worker thread; the pre-fork workers
+        # accept only when idle, so their backlog sits in the kernel.
+        executor = self._io_executor if self.worker_type == 'asyncio' else self._executor
+        queue = getattr(executor, '_work_queue', None)
+        return {
+            'worker_type': self.worker_type,
+            'workers': self.workers,
+            'queue_depth': queue.qsize() if queue is not None else None,
+            'admission': self.admission.stats(),
+        }
+
+    def _server_stats(self) -> Dict:
+        return {'status': 'OK', 'data': self.stats.snapshot(self._stats_extra())}
+
+    async def _handle_connection_async(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        self.logger.info(f"New connection from {writer.get_extra_info('peername')}")
+        self.stats.connection_opened()
+        command, bytes_in, start, trace = 'OTHER', 0, time.perf_counter(), None
+        try:
+            prefix = await reader.readexactly(len(file_wire.MAGIC))
+            if prefix == file_wire.MAGIC:
+                await self._handle_binary_async(reader, writer)
+                return
+            trace = self._begin_trace('text')
+            if self.admission.try_admit():
+                try:
+                    command, response, bytes_in = await self._handle_text_async(reader, bytearray(prefix))
+                finally:
+                    self.admission.done(time.perf_counter() - start)
+            else:
+                command, response = BUSY, self.admission.busy_response()
+                bytes_in = await self._discard_text_async(reader, bytearray(prefix))
+            encoded = self._encode_text_response(response)
+            await self._write_async(writer, encoded)
+            self._record(trace, command, start, bytes_in, len(encoded), not self._response_ok(response))
+        except Exception as e:
+            self.logger.error(f"Connection handling error: {str(e)}")
+            self._record(trace, command, start, bytes_in, error=True)
+        finally:
+            self.stats.connection_closed()
+            writer.close()
+            try:
+                await writer.wait_closed()
+            except Exception:
+                pass
+
+    async def _offload(self, func, *args):
+        if self.tracer:
+            # run_in_executor does not carry contextvars over; the copy lets
+            # phases timed inside func land on the request's trace
+            return await asyncio.get_running_loop().run_in_executor(
+                self._io_executor, contextvars.copy_context().run, func, *args)
+        return await asyncio.get_running_loop().run_in_executor(self._io_executor, func, *args)
+
+    @staticmethod
+    async def _write_async(writer: asyncio.StreamWriter, data: bytes) -> None:
+        with phase('send'):
+            writer.write(data)
+            await writer.drain()
+
+    async def _handle_text_async(self, reader: asyncio.StreamReader,
+                                 buffer: bytearray) -> Tuple[str, Union[Dict, bytes], int]:
+        scan_from = 0
+        while True:
+            with phase('parse'):
+                kind, value, scan_from = self._scan_text_request(buffer, scan_from)
+            if kind == 'upload':
+                request, body_start = value
+                if not self.admission.enter('UPLOAD'):
+                    await self._offload(self._abandon_claims, request.args[0])
+                    received = await self._discard_text_async(reader, buffer[body_start:])
+                    return BUSY, self.admission.busy_response('UPLOAD'), body_start + received
+                start = time.perf_counter()
+                try:
+                    response, received = await self._receive_upload_b64_async(reader, request.args[0],
+                                                                              buffer[body_start:])
+                finally:
+                    self.admission.leave('UPLOAD', time.perf_counter() - start)
+                if response['status'] != 'OK':
+                    await self._offload(self._abandon_claims, request.args[0])
+                return 'UPLOAD', response, body_start + received
+            if kind == 'command':
+                return self._text_command_name(value), await self._offload(self._process_command, value), len(buffer)
+            if kind == 'error':
+                return 'OTHER', value, len(buffer)
+
+            with phase('recv'):
+                data = await reader.read(RECV_SIZE)
+            if not data:
+                command = bytes(buffer)
+                return (self._text_command_name(command), await self._offload(self._process_command, command),
+                        len(buffer))
+            buffer += data
+
+    async def _discard_text_async(self, reader: asyncio.StreamReader, pending: bytearray) -> int:
+        received, tail = len(pending), bytes(pending)
+        while TERMINATOR not in tail:
+            data = await reader.read(RECV_SIZE)
+            if not data:
+                break
+            received += len(data)
+            tail = tail[-len(TERMINATOR):] + data
+        return received
+
+    async def _receive_upload_b64_async(self, reader: asyncio.StreamReader, filename: str,
+                                        pending: bytearray) -> Tuple[Dict, int]:
+        try:
+            filepath = self._filepath(filename)
+            sink = await self._offload(Base64FileWriter, self.store.temp_path())
+            sink.file = self.store.progress(sink.file, filepath)
+        except Exception as e:
+            return {'status': 'ERROR', 'data': str(e)}, len(pending)
+        return await self._feed_upload_b64_async(reader, filename, sink, pending), sink.received
+
+    async def _feed_upload_b64_async(self, reader: asyncio.StreamReader, filename: str,
+                                     sink: Base64FileWriter, pending: bytearray) -> Dict:
+        try:
+            done = await self._offload(sink.feed, pending)
+            while not done:
+                with phase('recv'):
+                    data = await reader.read(RECV_SIZE)
+                if not data:
+                    break
+                done = await self._offload(sink.feed, data)
+            await self._offload(sink.finish)
+            await self._offload(self._commit, filename, sink.filepath, sink.digest.hexdigest())
+            return {'status': 'OK', 'data': f'File {filename} uploaded successfully'}
         except Exception as e:
+            await self._offload(sink.abort)
             return {'status': 'ERROR', 'data': str(e)}
 
+    async def _handle_binary_async(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter) -> None:
+        opcode, _, _, payload = await asyncio.wait_for(file_wire.read_frame_async(reader, HEADER_SCAN_LIMIT),
+                                                        self.idle_timeout)
+        try:
+            session = self._open_session(opcode, payload)
+        except Exception as e:
+            await self._write_async(writer, file_wire.encode_json(file_wire.OP_ERROR, {'status': 'ERROR', 'data': str(e)}))
+            raise
+        writer.write(file_wire.encode_json(file_wire.OP_OK, self._hello_response(session)))
+
+        while session.served < self.max_requests:
+            try:
+                opcode, request_flags, name, payload_len = await asyncio.wait_for(
+                    file_wire.read_header_async(reader), self.idle_timeout)
+            except (file_wire.ConnectionClosed, asyncio.TimeoutError):
+                return
+            start = time.perf_counter()
+            trace = self._begin_trace('binary')
+            command = file_wire.OPCODE_NAMES.get(opcode, 'OTHER')
+            bytes_in = file_wire.HEADER.size + len(name.encode('utf-8')) + payload_len
+            session.served += 1
+            flags = file_wire.FLAG_CLOSE if session.served == self.max_requests else 0
+            # no accept loop here: in flight + queued is every frame being served
+            admitted = self.admission.try_admit()
+            if admitted and not self.admission.enter(command):
+                self.admission.done()
+                admitted = False
+            try:
+                if admitted:
+                    try:
+                        ok, bytes_out = await self._process_frame_async(reader, writer, opcode, name, payload_len,
+                                                                        flags, request_flags, session.codec)
+                    finally:
+                        duration = time.perf_counter() - start
+                        self.admission.leave(command, duration)
+                        self.admission.done(duration)
+                else:
+                    command = BUSY
+                    ok, bytes_out = await self._reject_frame_async(reader, writer, opcode, name, payload_len,
+                                                                   flags, request_flags)
+            except Exception:
+                self._record(trace, command, start, bytes_in, error=True)
+                raise
+            self._record(trace, command, start, bytes_in, bytes_out, not ok)
+
+    async def _reject_frame_async(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, opcode: int,
+                                  name: str, payload_len: int, flags: int, request_flags: int) -> Tuple[bool, int]:
+        if self._is_upload(opcode):
+            await self._offload(self._abandon_claims, name)
+        await self._drain_frame_async(reader, opcode, payload_len, request_flags)
+        response = self.admission.busy_response(file_wire.OPCODE_NAMES.get(opcode))
+        frame = file_wire.encode_json(file_wire.OP_ERROR, response, flags=flags)
+        await self._write_async(writer, frame)
+        return False, len(frame)
+
+    async def _process_frame_async(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                                   opcode: int, name: str, payload_len: int, flags: int,
+                                   request_flags: int = 0, codec: str = None) -> Tuple[bool, int]:
+        entry = self.commands.opcode(opcode)
+        if entry is not None and entry.kind == OPCODE_STREAM:
+            response = None
+            try:
+                response = await entry.async_handler(reader, name, payload_len, request_flags)
+            finally:
+                if response is None or response['status'] != 'OK':
+                    await self._offload(self._abandon_claims, name)
+        elif payload_len > HEADER_SCAN_LIMIT:
+            await self._drain_body_async(reader, payload_len, request_flags)
+            response = {'status': 'ERROR', 'data': 'Request payload too large'}
+        else:
+            with phase('recv'):
+                payload = await reader.readexactly(payload_len) if payload_len else b''
+            if entry is None:
+                response = {'status': 'ERROR', 'data': 'Invalid command'}
+            elif entry.kind == OPCODE_REPLY:
+                return await entry.async_handler(writer, name, payload, flags, request_flags, codec)
+            elif entry.inline:
+                response = entry.handler(name, payload)
+            else:
+                response = await self._offload(entry.handler, name, payload)
+        ok = response['status'] == 'OK'
+        frame = file_wire.encode_json(file_wire.OP_OK if ok else file_wire.OP_ERROR, response, flags=flags)
+        await self._write_async(writer, frame)
+        return ok, len(frame)
+
+    async def _get_frame_async(self, writer: asyncio.StreamWriter, name: str, payload: bytes, flags: int,
+                               request_flags: int, codec: str) -> Tuple[bool, int]:
+        if not request_flags & file_wire.FLAG_CHUNKED:
+            codec = None
+        *span, etag = self._parse_get(payload, request_flags)
+        return await self._send_file_async(writer, name, flags, *span, codec=codec, if_none_match=etag)
+
+    async def _signature_reply_async(self, writer: asyncio.StreamWriter, name: str, payload: bytes, flags: int,
+                                     request_flags: int, codec: str) -> Tuple[bool, int]:
+        ok, frame = await self._offload(self._signature_frame, name, flags)
+        await self._write_async(writer, frame)
+        return ok, len(frame)
+
+    async def _drain_async(self, reader: asyncio.StreamReader, size: int) -> None:
+        while size:
+            size -= len(await reader.readexactly(min(size, RECV_SIZE)))
+
+    async def _drain_frame_async(self, reader: asyncio.StreamReader, opcode: int, payload_len: int,
+                                 request_flags: int) -> None:
+        if opcode not in (file_wire.OP_UPLOAD, file_wire.OP_UPLOAD_AT):
+            request_flags &= ~file_wire.FLAG_CHUNKED
+        if opcode == file_wire.OP_UPLOAD_AT:
+            prefix = min(payload_len, file_wire.UPLOAD_AT.size)
+            await self._drain_async(reader, prefix)
+            payload_len -= prefix
+        await self._drain_body_async(reader, payload_len, request_flags)
+
+    async def _drain_body_async(self, reader: asyncio.StreamReader, size: int, request_flags: int) -> None:
+        if not request_flags & file_wire.FLAG_CHUNKED:
+            await self._drain_async(reader, size)
+            return
+        while size:
+            _, raw_len, _ = await file_wire.read_chunk_async(reader, size)
+            size -= raw_len
+
+    async def _pump_to_file_async(self, reader: asyncio.StreamReader, f, size: int, digest=None,
+                                  request_flags: int = 0) -> None:
+        def write(data: bytes) -> None:
+            with phase('disk'):
+                f.write(data)
+            if digest is not None:
+                digest.update(data)
+
+        def decode_and_write(kind: int, raw_len: int, body: bytes) -> None:
+            with phase('decode'):
+                data = file_wire.decode_chunk(kind, raw_len, body)
+            write(data)
+
+        if request_flags & file_wire.FLAG_CHUNKED:
+            while size:
+                with phase('recv'):
+                    kind, raw_len, body = await file_wire.read_chunk_async(reader, size)
+                await self._offload(decode_and_write, kind, raw_len, body)
+                size -= raw_len
+            return
+
+        while size:
+            with phase('recv'):
+                data = await reader.read(min(size, RECV_SIZE))
+            if not data:
+                raise file_wire.ProtocolError('Connection closed mid-upload')
+            await self._offload(write, data)
+            size -= len(data)
+
+    async def _receive_part_async(self, reader: asyncio.StreamReader, filename: str, payload_len: int,
+                                  request_flags: int = 0) -> Dict:
+        if payload_len < file_wire.UPLOAD_AT.size:
+            await self._drain_async(reader, payload_len)
+            return {'status': 'ERROR', 'data': 'Incomplete UPLOAD_AT header'}
+        offset, total, upload_id = file_wire.UPLOAD_AT.unpack(await reader.readexactly(file_wire.UPLOAD_AT.size))
+        size = payload_len - file_wire.UPLOAD_AT.size
+        try:
+            f, path = await self._offload(self._open_part, filename, upload_id, offset)
+        except Exception as e:
+            await self._drain_body_async(reader, size, request_flags)
+            return {'status': 'ERROR', 'data': str(e)}
+        try:
+            await self._pump_to_file_async(reader, self.store.progress(f, self._filepath(filename)), size,
+                                           request_flags=request_flags)
+        finally:
+            await self._offload(f.close)
+        return await self._offload(self._commit_part, filename, path, offset + size, total)
+
+    async def _receive_file_async(self, reader: asyncio.StreamReader, filename: str, size: int,
+                                  request_flags: int = 0) -> Dict:
+        try:
+            filepath = self._filepath(filename)
+            temp = self.store.temp_path()
+            f = await self._offload(open, temp, 'wb')
+        except Exception as e:
+            await self._drain_body_async(reader, size, request_flags)
+            return {'status': 'ERROR', 'data': str(e)}
+        try:
+            digest = hashlib.sha256()
+            await self._pump_to_file_async(reader, self.store.progress(f, filepath), size, digest, request_flags)
+            await self._offload(f.close)
+            await self._offload(self._commit, filename, temp, digest.hexdigest())
+            return {'status': 'OK', 'data': f'File {filename} uploaded successfully'}
+        except Exception:
+            f.close()
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+
+    async def _send_file_async(self, writer: asyncio.StreamWriter, filename: str, flags: int = 0,
+                               offset: int = 0, length: int = 0, ranged: bool = False,
+                               codec: str = None, if_none_match: str = None) -> Tuple[bool, int]:
+        try:
+            f, size, count = await self._offload(self._open_range, filename, offset, length)
+        except Exception as e:
+            message = 'File not found' if isinstance(e, FileNotFoundError) else str(e)
+            frame = file_wire.encode_json(file_wire.OP_ERROR, {'status': 'ERROR', 'data': message}, flags=flags)
+            await self._write_async(writer, frame)
+            return False, len(frame)
+
+        with f:
+            etag = None
+            if if_none_match is not None:
+                etag = self.store.validator(os.fstat(f.fileno()))
+                if if_none_match == etag:
+                    frame = self._not_modified(etag, flags)
+                    await self._write_async(writer, frame)
+                    return True, len(frame)
+            if codec:
+                header = self._range_header(filename, flags | file_wire.FLAG_CHUNKED, offset, size, count, ranged,
+                                            etag)
+                writer.write(header)
+                sent = len(header)
+                encoder = file_wire.ChunkEncoder(codec)
+
+                def next_chunk(remaining: int) -> bytes:
+                    with phase('disk'):
+                        data = f.read(min(remaining, file_wire.CHUNK_SIZE))
+                    if not data:
+                        raise file_wire.ProtocolError('File shrank during send')
+                    with phase('encode'):
+                        return encoder.encode(data)
+
+                await self._offload(f.seek, offset)
+                while count:
+                    chunk = await self._offload(next_chunk, count)
+                    count -= file_wire.CHUNK.unpack_from(chunk)[1]
+                    sent += len(chunk)
+                    await self._write_async(writer, chunk)
+                return True, sent
+            header = self._range_header(filename, flags, offset, size, count, ranged, etag)
+            await self._write_async(writer, header)
+            if count:
+                with phase('send'):
+                    await asyncio.get_running_loop().sendfile(writer.transport, f, offset, count)
+            return True, len(header) + count
+
+    async def _send_batch_async(self, writer: asyncio.StreamWriter, names, flags: int) -> Tuple[bool, int]:
+        error = self._check_batch(names)
+        if error:
+            frame = file_wire.encode_json(file_wire.OP_ERROR, error, flags=flags)
+            await self._write_async(writer, frame)
+            return False, len(frame)
+
+        loop = asyncio.get_running_loop()
+        entries = await self._offload(self._open_entries, names)
+        window = deque()
+        try:
+            header = self._batch_header(entries, flags)
+            writer.write(header)
+            sent = len(header)
+            for entry in entries:
+                window.append((entry, loop.run_in_executor(self._io_executor, self._read_entry, entry)
+                               if self._prefetched(entry) else None))
+                if len(window) < BATCH_READ_AHEAD:
+                    continue
+                sent += await self._send_entry_async(writer, *window.popleft())
+            while window:
+                sent += await self._send_entry_async(writer, *window.popleft())
+            self._record_batch(entries)
+            return True, sent
+        finally:
+            await asyncio.gather(*(future for _, future in window if future is not None), return_exceptions=True)
+            for entry in entries:
+                if entry.f is not None:
+                    entry.f.close()
+
+    async def _send_entry_async(self, writer: asyncio.StreamWriter, entry: BatchEntry, future) -> int:
+        header = self._entry_header(entry)
+        if entry.f is None or future is not None:
+            data = entry.error if entry.f is None else await future
+            await self._write_async(writer, header + data)
+            return len(header) + len(data)
+        await self._write_async(writer, header)
+        if entry.size:
+            with phase('send'):
+                await asyncio.get_running_loop().sendfile(writer.transport, entry.f, 0, entry.size)
+        return len(header) + entry.size
+
+    async def _receive_batch_async(self, reader: asyncio.StreamReader, payload_len: int) -> Dict:
+        results = []
+        remaining = payload_len
+        while remaining:
+            if remaining < file_wire.ENTRY.size:
+                raise file_wire.ProtocolError('Truncated MUPLOAD entry')
+            _, name, size = await file_wire.read_entry_async(reader)
+            remaining -= file_wire.ENTRY.size + len(name.encode('utf-8')) + size
+            if remaining < 0 or len(results) >= file_wire.MAX_BATCH:
+                raise file_wire.ProtocolError('MUPLOAD entry exceeds frame')
+            try:
+                self._filepath(name)
+                temp = self.store.temp_path()
+                f = await self._offload(open, temp, 'wb')
+            except Exception as e:
+                await self._drain_async(reader, size)
+                results.append({'name': name, 'status': 'ERROR', 'data': str(e)})
+                continue
+            try:
+                digest = hashlib.sha256()
+                await self._pump_to_file_async(reader, f, size, digest)
+                await self._offload(f.close)
+            except Exception:
+                f.close()
+                os.remove(temp)
+                raise
+            results.append(asyncio.ensure_future(
+                self._offload(self._commit_entry, name, temp, digest.hexdigest())))
+        return self._batch_response([r if isinstance(r, dict) else await r for r in results])
+
+    async def _receive_delta_async(self, reader: asyncio.StreamReader, filename: str, payload_len: int) -> Dict:
+        if payload_len < file_wire.DELTA.size:
+            await self._drain_async(reader, payload_len)
+            return {'status': 'ERROR', 'data': 'Incomplete DELTA header'}
+        digest, size, block_size = file_wire.DELTA.unpack(await reader.readexactly(file_wire.DELTA.size))
+        remaining = payload_len - file_wire.DELTA.size
+        try:
+            base, temp, out = await self._offload(self._open_delta, filename)
+        except Exception as e:
+            await self._drain_async(reader, remaining)
+            return {'status': 'ERROR', 'data': 'File not found' if isinstance(e, FileNotFoundError) else str(e)}
+        error = patcher = None
+        try:
+            with base, out:
+                try:
+                    patcher = file_delta.DeltaPatcher(base, out, block_size)
+                except file_delta.DeltaError as e:
+                    error = str(e)
+                while remaining:
+                    kind, first, length = file_wire.DELTA_OP.unpack(await reader.readexactly(file_wire.DELTA_OP.size))
+                    remaining -= file_wire.DELTA_OP.size
+                    if kind == file_wire.DELTA_LITERAL:
+                        if length > remaining:
+                            raise file_wire.ProtocolError('Literal exceeds frame')
+                        if error is None:
+                            await self._pump_to_file_async(reader, patcher, length)
+                        else:
+                            await self._drain_async(reader, length)
+                        remaining -= length
+                    elif kind != file_wire.DELTA_COPY:
+                        raise file_wire.ProtocolError(f'Unknown delta op {kind}')
+                    elif error is None:
+                        try:
+                            await self._offload(patcher.copy, first, length)
+                        except file_delta.DeltaError as e:
+                            error = str(e)
+            return await self._offload(self._commit_delta, filename, temp, patcher, error, digest, size)
+        except Exception:
+            if os.path.exists(temp):
+                os.remove(temp)
+            raise
+
+    async def _serve_async(self) -> None:
+        self._io_executor = concurrent.futures.ThreadPoolExecutor(max_workers=self.workers)
+        server = await asyncio.start_server(self._handle_connection_async, self.host, self.port,
+                                            reuse_address=True, backlog=ASYNC_BACKLOG)
+        self.logger.info(f"Server active on {self.host}:{self.port}")
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            self._io_executor.shutdown(wait=False)
+
+    def _log_final_stats(self) -> None:
+        totals = self.stats.snapshot()['totals']
+        self.logger.info(f"Final stats - Successful operations: {totals['requests'] - totals['errors']}, "
+                         f"Failed: {totals['errors']}")
+        if self.worker_type != 'process':
+            self.logger.info(f"Cache stats - {self.cache.stats()}")
+            self.logger.info(f"Store stats - {self.store.stats()}")
+
+    def _close_trace(self) -> None:
+        if self.tracer:
+            self.tracer.close()
+
+    def _start_stats_dump(self) -> None:
+        if self.stats_file:
+            self.stats.start_dump(self.stats_file, self.stats_interval, self._stats_extra)
+
     def run(self) -> None:
         self.logger.info(f"Initializing server with {self.workers} {self.worker_type} workers")
-        
-        executor_class = concurrent.futures.ThreadPoolExecutor if self.worker_type == 'thread' else concurrent.futures.ProcessPoolExecutor
+
+        if self.worker_type == 'asyncio':
+            self._start_stats_dump()
+            try:
+                asyncio.run(self._serve_async())
+            except KeyboardInterrupt:
+                self.logger.info("Shutting down server...")
+                self._log_final_stats()
+                self._close_trace()
+            return
         
         with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
             server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-            server_socket.bind((SERVER_IP, SERVER_PORT))
+            server_socket.bind((self.host, self.port))
             server_socket.listen(50)
-            self.logger.info(f"Server active on {SERVER_IP}:{SERVER_PORT}")
+            self.logger.info(f"Server active on {self.host}:{self.port}")
 
-            with executor_class(max_workers=self.workers) as executor:
+            if self.worker_type == 'process':
+                self._run_prefork(server_socket)
+                return
+
+            with concurrent.futures.ThreadPoolExecutor(max_workers=self.workers) as executor:
+                self._executor = executor
+                self._start_stats_dump()
                 try:
-                    while True:
-                        client_socket, addr = server_socket.accept()
-                        self.logger.info(f"New connection from {addr}")
-                        executor.submit(self._handle_connection, client_socket)
+                    self._accept_loop(server_socket, executor.submit)
                 except KeyboardInterrupt:
                     self.logger.info("Shutting down server...")
-                    self.logger.info(f"Final stats - Successful operations: {self.success_count}, Failed: {self.fail_count}")
+                    self._log_final_stats()
+                    self._close_trace()
+
+    def _prefork_worker(self, server_socket: socket.socket, slot: int) -> None:
+        # Ctrl-C reaches the whole process group; only the parent reacts to it.
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        # Each worker owns its shard of the shared stats, so no lock is needed.
+        self.stats.bind_slot(slot)
+        if self.tracer:
+            # terminate() sends SIGTERM; leave through the finally so buffered records are written
+            signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+        try:
+            self._accept_loop(server_socket, lambda func, *args: func(*args))
+        finally:
+            self._close_trace()
+
+    def _run_prefork(self, server_socket: socket.socket) -> None:
+        # Workers are forked after bind/listen and all accept on the inherited
+        # socket; stats come back through a shared-memory array.
+        ctx = multiprocessing.get_context('fork')
+        self.stats = ServerStats(ctx.Array('q', ServerStats.shared_size(self.workers), lock=False))
+        # Each worker serves one request at a time and only accepts when idle,
+        # so the listen backlog is the queue; the upload limit spans all workers.
+        self.admission = AdmissionControl(self.max_inflight, self.max_queued, self.max_uploads,
+                                          semaphore=ctx.BoundedSemaphore)
+        procs = {}
+
+        def spawn(slot: int) -> None:
+            # connections of a dead worker are gone with it
+            self.stats.reset_active(slot)
+            proc = ctx.Process(target=self._prefork_worker, args=(server_socket, slot), daemon=True)
+            proc.start()
+            procs[slot] = proc
+
+        for slot in range(self.workers):
+            spawn(slot)
+        self._start_stats_dump()
+
+        try:
+            while True:
+                multiprocessing.connection.wait([proc.sentinel for proc in procs.values()])
+                for slot, proc in list(procs.items()):
+                    if not proc.is_alive():
+                        self.logger.warning(f"Worker {slot} exited with code {proc.exitcode}, restarting")
+                        spawn(slot)
+        except KeyboardInterrupt:
+            self.logger.info("Shutting down server...")
+        finally:
+            for proc in procs.values():
+                proc.terminate()
+            for proc in procs.values():
+                proc.join()
+            self._log_final_stats()
 
 if __name__ == "__main__":
     parser = argparse.ArgumentParser(description='File Server with configurable workers')
-    parser.add_argument('--worker-type', choices=['thread', 'process'], default='thread',
-                       help='Worker type (thread or process)')
+    parser.add_argument('--worker-type', choices=['thread', 'process', 'asyncio'], default='thread',
+                       help='Worker type (thread, process or asyncio event loop)')
     parser.add_argument('--workers', type=int, default=1,
-                       help='Number of worker threads/processes')
+                       help='Number of worker threads, pre-forked processes, or asyncio executor threads')
+    parser.add_argument('--idle-timeout', type=float, default=30.0,
+                       help='Seconds a keep-alive connection may stay idle before it is closed')
+    parser.add_argument('--max-requests', type=int, default=100,
+                       help='Maximum requests served on one keep-alive connection')
+    parser.add_argument('--cache-mb', type=int, default=256,
+                       help='Size of the in-memory LRU cache for hot file contents (0 disables it)')
+    parser.add_argument('--host', default=SERVER_IP,
+                       help='Address to listen on')
+    parser.add_argument('--port', type=int, default=SERVER_PORT,
+                       help='Port to listen on')
+    parser.add_argument('--stats-file', default=None,
+                       help='Append a STATS snapshot as one JSON line to this file periodically')
+    parser.add_argument('--stats-interval', type=float, default=5.0,
+                       help='Seconds between --stats-file snapshots')
+    parser.add_argument('--max-inflight', type=int, default=None,
+                       help='Requests served at once before new ones queue (default: --workers)')
+    parser.add_argument('--max-queued', type=int, default=None,
+                       help='Requests allowed to wait for a worker; beyond that the server answers BUSY '
+                            '(default: 4 x --max-inflight)')
+    parser.add_argument('--max-uploads', type=int, default=None,
+                       help='Concurrent uploads allowed (default: half of --max-inflight, 0 = no separate limit)')
+    parser.add_argument('--trace-file', default=None,
+                       help='Append per-request phase timings as JSON lines to this file '
+                            '(summarize with: python file_trace.py FILE)')
+    parser.add_argument('--profile-sample', type=float, default=0.0,
+                       help='Fraction of requests (0-1) to run under cProfile, one .prof per request')
+    parser.add_argument('--profile-dir', default='profiles',
+                       help='Directory for --profile-sample output')
     
     args = parser.parse_args()
     
-    server = FileServer(worker_type=args.worker_type, workers=args.workers)
+    server = FileServer(worker_type=args.worker_type, workers=args.workers,
+                        idle_timeout=args.idle_timeout, max_requests=args.max_requests,
+                        cache_mb=args.cache_mb, host=args.host, port=args.port,
+                        stats_file=args.stats_file, stats_interval=args.stats_interval,
+                        max_inflight=args.max_inflight, max_queued=args.max_queued, max_uploads=args.max_uploads,
+                        trace_file=args.trace_file, profile_sample=args.profile_sample, profile_dir=args.profile_dir)
     server.run()
\ No newline at end of file
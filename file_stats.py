@@ -0,0 +1,182 @@
+import json
+import threading
+import time
+from typing import Callable, Dict, List, Optional
+
+import file_wire
+
+"""
+* ServerStats mencatat jumlah request, error, byte masuk/keluar dan
+histogram latensi per command, plus jumlah koneksi aktif; MGET/MUPLOAD
+dihitung per entry file (latensinya tetap satu sampel per batch)
+
+* pencatatan tidak memakai lock: setiap thread menulis ke shard-nya
+sendiri (list int), dan snapshot menjumlahkan semua shard
+
+* pada mode pre-fork, shard setiap worker berada di shared memory
+(multiprocessing.Array) sehingga STATS dari worker mana pun, juga
+proses induk, melihat angka gabungan semua worker
+"""
+
+# BUSY: request ditolak admission control sebelum dilayani
+COMMANDS = list(file_wire.OPCODES) + ['BUSY', 'OTHER']
+COMMAND_INDEX = {name: i for i, name in enumerate(COMMANDS)}
+
+# requests, errors, bytes_in, bytes_out, lalu histogram latensi
+FIELDS = 4
+# bucket i: latensi < 2**i mikrodetik (bucket terakhir menampung sisanya, >= ~67 detik)
+HIST_BUCKETS = 27
+SLOT = FIELDS + HIST_BUCKETS
+ACTIVE = len(COMMANDS) * SLOT
+SHARD_LEN = ACTIVE + 1
+
+# observasi STATS sendiri dan request yang ditolak tidak ikut dihitung di total
+UNCOUNTED = ('STATS', 'BUSY')
+
+
+def _bucket(latency: float) -> int:
+    micros = int(latency * 1e6)
+    return min(micros.bit_length(), HIST_BUCKETS - 1)
+
+
+class ServerStats:
+    def __init__(self, shared=None):
+        self.started = time.time()
+        self._shared = shared
+        self._local = threading.local()
+        self._shards = []
+        self._shards_lock = threading.Lock()
+        self._slot = None
+
+    @staticmethod
+    def shared_size(workers: int) -> int:
+        return workers * SHARD_LEN
+
+    def bind_slot(self, slot: int) -> None:
+        """Pre-fork worker: write into its own slot of the shared array."""
+        self._slot = slot
+
+    def _shard(self):
+        if self._shared is not None and self._slot is not None:
+            return self._shared, self._slot * SHARD_LEN
+        shard = getattr(self._local, 'shard', None)
+        if shard is None:
+            shard = self._local.shard = [0] * SHARD_LEN
+            with self._shards_lock:  # once per thread
+                self._shards.append(shard)
+        return shard, 0
+
+    def record(self, command: str, latency: float, bytes_in: int = 0, bytes_out: int = 0,
+               error: bool = False) -> None:
+        shard, base = self._shard()
+        base += COMMAND_INDEX.get(command, COMMAND_INDEX['OTHER']) * SLOT
+        shard[base] += 1
+        if error:
+            shard[base + 1] += 1
+        shard[base + 2] += bytes_in
+        shard[base + 3] += bytes_out
+        shard[base + FIELDS + _bucket(latency)] += 1
+
+    def record_entries(self, command: str, entries: int, failed: int = 0) -> None:
+        """
+        A batch request (MGET/MUPLOAD) already passed to record(): count each
+        further file entry as a request and each failed entry as an error, so
+        the totals match per-file counts on the client.
+        """
+        shard, base = self._shard()
+        base += COMMAND_INDEX.get(command, COMMAND_INDEX['OTHER']) * SLOT
+        shard[base] += max(entries, 1) - 1
+        shard[base + 1] += failed
+
+    def connection_opened(self) -> None:
+        shard, base = self._shard()
+        shard[base + ACTIVE] += 1
+
+    def connection_closed(self) -> None:
+        # may run on a different thread than the open; only the sum matters
+        shard, base = self._shard()
+        shard[base + ACTIVE] -= 1
+
+    def reset_active(self, slot: int) -> None:
+        """Pre-fork parent: zero the connection gauge of a worker being (re)spawned."""
+        if self._shared is not None:
+            self._shared[slot * SHARD_LEN + ACTIVE] = 0
+
+    def _totals(self) -> List[int]:
+        totals = [0] * SHARD_LEN
+        if self._shared is not None:
+            raw = self._shared[:]
+            for base in range(0, len(raw), SHARD_LEN):
+                for i in range(SHARD_LEN):
+                    totals[i] += raw[base + i]
+        with self._shards_lock:
+            shards = list(self._shards)
+        for shard in shards:
+            for i, value in enumerate(shard):
+                totals[i] += value
+        return totals
+
+    def snapshot(self, extra: Dict = None) -> Dict:
+        totals = self._totals()
+        commands = {}
+        summary = {'requests': 0, 'errors': 0, 'bytes_in': 0, 'bytes_out': 0}
+        for name in COMMANDS:
+            base = COMMAND_INDEX[name] * SLOT
+            requests, errors, bytes_in, bytes_out = totals[base:base + FIELDS]
+            if not requests:
+                continue
+            hist = totals[base + FIELDS:base + SLOT]
+            commands[name] = {
+                'requests': requests,
+                'errors': errors,
+                'bytes_in': bytes_in,
+                'bytes_out': bytes_out,
+                'latency': {
+                    'p50': self._quantile(hist, 0.50),
+                    'p95': self._quantile(hist, 0.95),
+                    'p99': self._quantile(hist, 0.99),
+                    # [batas atas bucket dalam detik, jumlah]
+                    'histogram': [[2 ** i / 1e6, count] for i, count in enumerate(hist) if count],
+                },
+            }
+            if name not in UNCOUNTED:
+                summary['requests'] += requests
+                summary['errors'] += errors
+                summary['bytes_in'] += bytes_in
+                summary['bytes_out'] += bytes_out
+        data = {
+            'time': time.time(),
+            'uptime': time.time() - self.started,
+            'active_connections': totals[ACTIVE],
+            'totals': summary,
+            'commands': commands,
+        }
+        if extra:
+            data.update(extra)
+        return data
+
+    @staticmethod
+    def _quantile(hist: List[int], q: float) -> Optional[float]:
+        # upper bound of the bucket holding the q-th request
+        total = sum(hist)
+        if not total:
+            return None
+        rank = q * total
+        seen = 0
+        for i, count in enumerate(hist):
+            seen += count
+            if seen >= rank:
+                return 2 ** i / 1e6
+        return 2 ** (len(hist) - 1) / 1e6
+
+    def start_dump(self, path: str, interval: float, extra: Callable[[], Dict] = None) -> threading.Thread:
+        """Append a snapshot as one JSON line to path every interval seconds."""
+        def dump() -> None:
+            while True:
+                time.sleep(interval)
+                with open(path, 'a') as f:
+                    f.write(json.dumps(self.snapshot(extra() if extra else None)) + '\n')
+
+        thread = threading.Thread(target=dump, name='stats-dump', daemon=True)
+        thread.start()
+        return thread
@@ -0,0 +1,295 @@
+import hashlib
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from typing import Dict, List, Optional
+
+from file_trace import phase
+
+"""
+* BlobStore menyimpan isi file sekali saja sebagai blob bernama
+SHA-256 dari isinya (server_files/.blobs/<sha256>)
+
+* nama file di server_files adalah hardlink ke blob tersebut,
+sehingga GET/sendfile/LIST tetap bekerja seperti file biasa dan
+jumlah referensi sebuah blob = st_nlink - 1
+
+* semua penulisan masuk ke file sementara di .tmp lalu dipasang
+ke namanya dengan os.replace (atomik); blob yang tidak lagi
+direferensikan nama mana pun dihapus
+
+* penulisan ke satu nama berjalan satu per satu di bawah lock per nama
+(writing), jadi urutan commit adalah urutan tulis: yang terakhir commit
+yang menang
+
+* claim menandai isi (digest) yang sedang diunggah sebagai file di
+.claims, dibuat dengan O_EXCL sehingga berlaku juga antar worker
+pre-fork; upload lain dengan isi yang sama cukup menunggu blob-nya ada
+lalu di-link, tanpa menulis isinya lagi ke disk
+
+* file claim berisi nama yang sedang diunggah pemiliknya; selama body
+nama itu mengalir mtime claim disegarkan (progress), jadi claim hanya
+kedaluwarsa bila uploadnya macet, dan dilepas bila uploadnya gagal
+"""
+
+HASH_CHUNK = 1024*1024
+# a claim's mtime is refreshed at most this often while its body arrives
+CLAIM_REFRESH = 1.0
+DIGEST = re.compile(r'[0-9a-f]{64}')
+
+
+def sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class BlobStore:
+    def __init__(self, root: str):
+        self.root = root
+        self.blob_dir = os.path.join(root, '.blobs')
+        self.tmp_dir = os.path.join(root, '.tmp')
+        self.claim_dir = os.path.join(root, '.claims')
+        for directory in (self.blob_dir, self.tmp_dir, self.claim_dir):
+            os.makedirs(directory, exist_ok=True)
+        for directory in (self.tmp_dir, self.claim_dir):
+            for name in os.listdir(directory):
+                os.remove(os.path.join(directory, name))
+
+        self._lock = threading.Lock()
+        self._by_inode = {}
+        self._rescan()
+        self._writers = {}
+        self.dedup_hits = 0
+        self.bytes_saved = 0
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.blob_dir, digest)
+
+    def temp_path(self) -> str:
+        return os.path.join(self.tmp_dir, uuid.uuid4().hex)
+
+    @contextmanager
+    def writing(self, filepath: str):
+        """Hold the write lock of one name (within this process) for a commit."""
+        with self._lock:
+            entry = self._writers.setdefault(filepath, [threading.Lock(), 0])
+            entry[1] += 1
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self._lock:
+                entry[1] -= 1
+                if not entry[1]:
+                    del self._writers[filepath]
+
+    def claim(self, digest: str, ttl: float, owner: str = '') -> bool:
+        """
+        Mark digest as being uploaded to owner (a file path). False while
+        another upload holds a claim that made progress within ttl seconds;
+        a stalled one is taken over (its uploader is presumed gone).
+        """
+        if not DIGEST.fullmatch(digest):
+            raise ValueError(f'Invalid sha256 digest: {digest!r}')
+        path = os.path.join(self.claim_dir, digest)
+        try:
+            fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o644)
+        except FileExistsError:
+            idle = self.claim_idle(digest)
+            if idle is None or idle < ttl:
+                return False  # None: ingested meanwhile, the next link() finds the blob
+            try:
+                fd = os.open(path, os.O_WRONLY | os.O_TRUNC)
+            except FileNotFoundError:
+                return False
+        with os.fdopen(fd, 'w') as f:
+            f.write(owner)
+        return True
+
+    def claim_idle(self, digest: str) -> Optional[float]:
+        """Seconds since the claim on digest last made progress; None without a claim."""
+        try:
+            return max(0.0, time.time() - os.stat(os.path.join(self.claim_dir, digest)).st_mtime)
+        except FileNotFoundError:
+            return None
+
+    def _claims_of(self, owner: str) -> List[str]:
+        # few claims exist at a time (one per content being uploaded), so a scan is cheap
+        paths = []
+        for entry in os.scandir(self.claim_dir):
+            try:
+                with open(entry.path) as f:
+                    if f.read() == owner:
+                        paths.append(entry.path)
+            except FileNotFoundError:
+                pass
+        return paths
+
+    def progress(self, f, owner: str):
+        """f, or a wrapper that keeps owner's claims fresh while its body is written."""
+        claims = self._claims_of(owner)
+        return ClaimProgress(f, claims) if claims else f
+
+    def release_claims(self, owner: str) -> None:
+        """Drop owner's claims after its upload failed, so waiters send the body themselves."""
+        for path in self._claims_of(owner):
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    def _release_claim(self, digest: str) -> None:
+        try:
+            os.remove(os.path.join(self.claim_dir, digest))
+        except FileNotFoundError:
+            pass
+
+    def _rescan(self) -> None:
+        by_inode = {}
+        for digest in os.listdir(self.blob_dir):
+            try:
+                by_inode[os.stat(self.blob_path(digest)).st_ino] = digest
+            except FileNotFoundError:
+                pass  # collected by another worker meanwhile
+        self._by_inode = by_inode
+
+    def _digest_for(self, st: os.stat_result) -> Optional[str]:
+        digest = self._by_inode.get(st.st_ino)
+        if digest is None and st.st_nlink > 1:
+            # linked to a blob another pre-forked worker created
+            self._rescan()
+            digest = self._by_inode.get(st.st_ino)
+        return digest
+
+    def digest_of(self, filepath: str) -> Optional[str]:
+        """Digest of the blob behind filepath, without reading it (None if unknown)."""
+        with self._lock:
+            return self._digest_for(os.stat(filepath))
+
+    def validator(self, st: os.stat_result) -> str:
+        """Cache validator for a file's content: its blob digest, else size and mtime."""
+        with self._lock:
+            digest = self._digest_for(st)
+        return digest or f'{st.st_size:x}-{st.st_mtime_ns:x}'
+
+    def _point(self, blob: str, filepath: str) -> None:
+        # Caller holds the lock. Swap filepath to a new link of blob, then
+        # collect the blob it used to reference.
+        try:
+            old = os.stat(filepath)
+            old_digest = self._digest_for(old)
+        except FileNotFoundError:
+            old = old_digest = None
+        if old is not None and old.st_ino == os.stat(blob).st_ino:
+            return  # already this content; rename() between links of one inode would be a no-op
+        tmp = self.temp_path()
+        try:
+            os.link(blob, tmp)
+        except FileNotFoundError:
+            raise
+        except OSError:
+            shutil.copyfile(blob, tmp)  # filesystem without hardlinks: no dedup
+        os.replace(tmp, filepath)
+        if old is not None and old.st_ino != os.stat(filepath).st_ino:
+            self._collect(old.st_ino, old_digest)
+
+    def _collect(self, ino: int, digest: Optional[str]) -> None:
+        if digest is None:
+            return
+        blob = self.blob_path(digest)
+        try:
+            st = os.stat(blob)
+        except FileNotFoundError:
+            self._by_inode.pop(ino, None)
+            return
+        if st.st_ino == ino and st.st_nlink <= 1:
+            os.remove(blob)
+            self._by_inode.pop(ino, None)
+
+    def link(self, digest: str, filepath: str, size: int) -> bool:
+        """Point filepath at an existing blob; False if there is no such blob."""
+        if not DIGEST.fullmatch(digest):
+            raise ValueError(f'Invalid sha256 digest: {digest!r}')
+        blob = self.blob_path(digest)
+        with self._lock:
+            try:
+                if os.path.getsize(blob) != size:
+                    return False
+                self._point(blob, filepath)
+            except FileNotFoundError:
+                return False
+            self.dedup_hits += 1
+            self.bytes_saved += size
+        return True
+
+    def ingest(self, temp: str, filepath: str, digest: str = None) -> str:
+        """Move a finished temp file into the store and point filepath at it."""
+        with phase('disk'):
+            if digest is None:
+                digest = sha256_file(temp)
+            blob = self.blob_path(digest)
+            with self._lock:
+                os.chmod(temp, 0o444)
+                try:
+                    # link() fails if another worker created the blob first, where
+                    # rename() would replace the inode its names already share
+                    os.link(temp, blob)
+                except FileExistsError:
+                    self.bytes_saved += os.path.getsize(temp)
+                    self.dedup_hits += 1
+                except OSError:
+                    shutil.copyfile(temp, blob)  # filesystem without hardlinks: no dedup
+                    self._by_inode[os.stat(blob).st_ino] = digest
+                else:
+                    self._by_inode[os.stat(blob).st_ino] = digest
+                os.remove(temp)
+                self._point(blob, filepath)
+            self._release_claim(digest)
+        return digest
+
+    def release(self, filepath: str) -> None:
+        """Remove a name; its blob goes away with the last reference."""
+        with self._lock:
+            st = os.stat(filepath)
+            digest = self._digest_for(st)
+            os.remove(filepath)
+            self._collect(st.st_ino, digest)
+
+    def stats(self) -> Dict:
+        with self._lock:
+            return {
+                'blobs': len(self._by_inode),
+                'dedup_hits': self.dedup_hits,
+                'bytes_saved': self.bytes_saved,
+            }
+
+
+class ClaimProgress:
+    """File wrapper for an upload body that refreshes its uploader's claims as data is written."""
+
+    def __init__(self, f, claims: List[str]):
+        self.f = f
+        self.claims = claims
+        self.refreshed = time.monotonic()
+
+    def write(self, data) -> int:
+        n = self.f.write(data)
+        now = time.monotonic()
+        if now - self.refreshed >= CLAIM_REFRESH:
+            self.refreshed = now
+            for path in self.claims:
+                try:
+                    os.utime(path)
+                except FileNotFoundError:
+                    pass
+        return n
+
+    def __getattr__(self, name):
+        return getattr(self.f, name)
@@ -0,0 +1,303 @@
+import argparse
+import contextvars
+import cProfile
+import itertools
+import json
+import os
+import pstats
+import random
+import threading
+import time
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+"""
+* file_trace mengukur ke mana waktu satu request habis: setiap request
+dipecah menjadi fase accept_wait (koneksi siap sampai diserahkan ke
+worker), queue_wait (menunggu worker kosong), recv, parse, decode,
+disk, encode dan send; sisa waktu handler dicatat sebagai other
+
+* waktu fase bersifat eksklusif: fase yang dibuka di dalam fase lain
+menghentikan sementara jam fase luarnya, jadi jumlah semua fase sama
+dengan waktu layanan request
+
+* request yang sedang dilayani disimpan di contextvar, sehingga helper
+yang dalam (file_wire, Base64FileWriter) cukup memanggil phase(); saat
+tracing mati phase() hanya satu lookup contextvar dan mengembalikan
+context manager kosong
+
+* setiap request ditulis sebagai satu baris JSON; baris dikumpulkan di
+buffer lalu ditulis dengan satu write O_APPEND, jadi worker pre-fork
+boleh menulis ke file yang sama tanpa baris yang bercampur
+
+* sebagian kecil request (--profile-sample) dijalankan di bawah cProfile
+dan hasilnya disimpan per request untuk dibuka dengan pstats
+
+* dijalankan langsung, modul ini merangkum file trace per command dan
+per ukuran payload, atau menggabungkan file profil
+"""
+
+PHASES = ('accept_wait', 'queue_wait', 'recv', 'parse', 'decode', 'disk', 'encode', 'send', 'other')
+# fase yang terjadi sebelum handler berjalan, di luar waktu layanan
+WAIT_PHASES = PHASES[:2]
+FLUSH_RECORDS = 256
+FLUSH_INTERVAL = 1.0
+# bucket ukuran payload untuk ringkasan: < 1 KB, < 4 KB, ... (kelipatan 4)
+SIZE_BUCKET_BASE = 1024
+
+_current = contextvars.ContextVar('file_trace', default=None)
+
+
+class _NullPhase:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_PHASE = _NullPhase()
+
+
+class _Phase:
+    __slots__ = ('trace', 'name', 'outer')
+
+    def __init__(self, trace: 'RequestTrace', name: str):
+        self.trace = trace
+        self.name = name
+
+    def __enter__(self):
+        self.outer = self.trace.switch(self.name)
+        return self
+
+    def __exit__(self, *exc):
+        self.trace.switch(self.outer)
+        return False
+
+
+def phase(name: str):
+    """Context manager timing name for the request being served, if it is traced."""
+    trace = _current.get()
+    return NULL_PHASE if trace is None else _Phase(trace, name)
+
+
+class RequestTrace:
+    __slots__ = ('proto', 'started', 'times', 'current', 'mark', 'profile')
+
+    def __init__(self, proto: str, accept_wait: float = 0.0, queue_wait: float = 0.0):
+        self.proto = proto
+        self.times = dict.fromkeys(PHASES, 0.0)
+        self.times['accept_wait'] = accept_wait
+        self.times['queue_wait'] = queue_wait
+        self.current = 'other'
+        self.started = self.mark = time.perf_counter()
+        self.profile = None
+
+    def switch(self, name: str) -> str:
+        """Charge the time since the last switch to the current phase; returns that phase."""
+        now = time.perf_counter()
+        self.times[self.current] += now - self.mark
+        self.mark = now
+        outer, self.current = self.current, name
+        return outer
+
+
+class Tracer:
+    """
+    Per-request phase timer of one server process. begin() makes a trace
+    current for the calling thread or task, finish() writes its record.
+    """
+
+    def __init__(self, path: str = None, profile_sample: float = 0.0, profile_dir: str = 'profiles'):
+        self.path = path
+        self.profile_sample = profile_sample
+        self.profile_dir = profile_dir
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self._buffer = []
+        self._flushed = time.monotonic()
+        self._fd = None
+        self._pid = None
+        self._profiles = itertools.count()
+        if profile_sample:
+            os.makedirs(profile_dir, exist_ok=True)
+
+    def waited(self, accept_wait: float, queue_wait: float) -> None:
+        """Queueing ahead of the handler on this thread; charged to the next begin()."""
+        self._local.waits = (accept_wait, queue_wait)
+
+    def begin(self, proto: str) -> RequestTrace:
+        waits = getattr(self._local, 'waits', None)
+        if waits is not None:
+            self._local.waits = None
+        trace = RequestTrace(proto, *(waits or ()))
+        if self.profile_sample and random.random() < self.profile_sample:
+            trace.profile = self._start_profile()
+        _current.set(trace)
+        return trace
+
+    def _start_profile(self) -> Optional[cProfile.Profile]:
+        # one profile per thread at a time; on the asyncio loop it also sees
+        # the other coroutines that run while the sampled request waits
+        if getattr(self._local, 'profiling', False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            return None  # another profiler is active (3.12+ profiles process-wide)
+        self._local.profiling = True
+        return profile
+
+    def finish(self, trace: RequestTrace, command: str, bytes_in: int = 0, bytes_out: int = 0,
+               error: bool = False) -> None:
+        trace.switch('other')
+        _current.set(None)
+        if trace.profile is not None:
+            trace.profile.disable()
+            self._local.profiling = False
+            name = f'{command.lower()}-{os.getpid()}-{next(self._profiles)}.prof'
+            trace.profile.dump_stats(os.path.join(self.profile_dir, name))
+        if self.path is None:
+            return
+        record = {
+            'ts': round(time.time(), 6),
+            'pid': os.getpid(),
+            'cmd': command,
+            'proto': trace.proto,
+            'in': bytes_in,
+            'out': bytes_out,
+            'err': int(error),
+            'total': round((trace.mark - trace.started) * 1e6),
+            # microseconds, zero phases left out
+            'phases': {name: round(spent * 1e6) for name, spent in trace.times.items() if spent},
+        }
+        line = json.dumps(record, separators=(',', ':')) + '\n'
+        with self._lock:
+            self._buffer.append(line)
+            if len(self._buffer) >= FLUSH_RECORDS or time.monotonic() - self._flushed >= FLUSH_INTERVAL:
+                self._flush()
+
+    def _flush(self) -> None:
+        # Caller holds the lock. Opened lazily in each process, so pre-forked
+        # workers get their own descriptor on the shared file.
+        if self._pid != os.getpid():
+            self._fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+            self._pid = os.getpid()
+        if self._buffer:
+            os.write(self._fd, ''.join(self._buffer).encode('utf-8'))
+            self._buffer.clear()
+        self._flushed = time.monotonic()
+
+    def close(self) -> None:
+        if self.path is None:
+            return
+        with self._lock:
+            self._flush()
+
+
+def percentile(values, q):
+    """Nearest-rank percentile (q dalam 0-100); 0 untuk data kosong."""
+    if not values:
+        return 0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))
+    return ordered[int(rank) - 1]
+
+
+def size_bucket(size: int) -> int:
+    """Upper bound of the size bucket holding size."""
+    limit = SIZE_BUCKET_BASE
+    while size >= limit:
+        limit *= 4
+    return limit
+
+
+def size_label(limit: int) -> str:
+    if limit >= 1024*1024*1024:
+        return f'<{limit // (1024*1024*1024)}GB'
+    if limit >= 1024*1024:
+        return f'<{limit // (1024*1024)}MB'
+    return f'<{limit // 1024}KB'
+
+
+def load(path: str) -> List[Dict]:
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def summarize(records: List[Dict], key, order=None) -> List[Dict]:
+    """
+    One row per key(record): count, error count, latency percentiles and
+    mean time per phase; busiest group first unless order is given.
+    """
+    groups = defaultdict(list)
+    for record in records:
+        groups[key(record)].append(record)
+    rows = []
+    for group, items in groups.items():
+        totals = [r['total'] for r in items]
+        row = {'group': group, 'count': len(items), 'errors': sum(r['err'] for r in items),
+               'p50': percentile(totals, 50), 'p95': percentile(totals, 95), 'p99': percentile(totals, 99),
+               'mean': sum(totals) / len(items)}
+        for name in PHASES:
+            row[name] = sum(r['phases'].get(name, 0) for r in items) / len(items)
+        rows.append(row)
+    rows.sort(key=order or (lambda row: -row['count']))
+    return rows
+
+
+def _print_table(title: str, rows: List[Dict], label=str) -> None:
+    print(f"\n=== {title} (mikrodetik) ===")
+    columns = ['count', 'errors', 'p50', 'p95', 'p99', 'mean'] + list(PHASES)
+    print(f"{'':<14}" + ''.join(f'{c:>12}' for c in columns))
+    for row in rows:
+        print(f"{label(row['group']):<14}" + ''.join(f'{row[c]:>12.0f}' for c in columns))
+    # share of service time per phase, the waits are outside it
+    for row in rows:
+        service = sum(row[name] for name in PHASES if name not in WAIT_PHASES) or 1
+        shares = ', '.join(f'{name} {row[name] / service:.0%}' for name in PHASES
+                           if name not in WAIT_PHASES and row[name])
+        print(f"  {label(row['group'])}: {shares}")
+
+
+def print_profiles(directory: str, top: int, command: str = None) -> None:
+    paths = sorted(os.path.join(directory, name) for name in os.listdir(directory)
+                   if name.endswith('.prof') and (command is None or name.startswith(command.lower() + '-')))
+    if not paths:
+        print(f"Tidak ada file profil di {directory}")
+        return
+    print(f"\n=== Profil gabungan dari {len(paths)} request ===")
+    pstats.Stats(*paths).sort_stats('cumulative').print_stats(top)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Summarize a FileServer --trace-file or merge --profile-sample output')
+    parser.add_argument('trace', nargs='?', help='JSONL trace written by the server')
+    parser.add_argument('--by', choices=['command', 'size', 'both'], default='both',
+                        help='Group by command, by payload size bucket, or print both tables')
+    parser.add_argument('--command', default=None,
+                        help='Only requests (and profiles) of this command, e.g. GET')
+    parser.add_argument('--profiles', default=None,
+                        help='Directory of .prof files to merge and print')
+    parser.add_argument('--top', type=int, default=25,
+                        help='Functions to show from the merged profile')
+    args = parser.parse_args()
+
+    if args.trace:
+        records = load(args.trace)
+        if args.command:
+            records = [r for r in records if r['cmd'] == args.command.upper()]
+        print(f"{len(records)} request di {args.trace}")
+        if args.by in ('command', 'both'):
+            _print_table('Per command', summarize(records, lambda r: r['cmd']))
+        if args.by in ('size', 'both'):
+            # the payload is whichever direction carried the file
+            rows = summarize(records, lambda r: size_bucket(max(r['in'], r['out'])), order=lambda row: row['group'])
+            _print_table('Per ukuran payload', rows, size_label)
+    if args.profiles:
+        print_profiles(args.profiles, args.top, args.command)
+    if not args.trace and not args.profiles:
+        parser.error('give a trace file, --profiles, or both')
@@ -0,0 +1,405 @@
+import asyncio
+import json
+import socket
+import struct
+import zlib
+from collections import namedtuple
+from typing import Dict, Iterable, Optional, Tuple
+
+from file_trace import phase
+
+"""
+* file_wire berisi framing biner (protokol versi 2) yang dipakai
+bersama oleh FileServer dan FileClient
+
+* client membuka koneksi dengan MAGIC lalu frame HELLO; koneksi yang
+tidak diawali MAGIC diperlakukan sebagai protokol teks lama
+(perintah diakhiri \r\n\r\n, respon JSON)
+
+* setiap frame = header (opcode, flags, panjang nama, panjang payload)
+diikuti nama (utf-8) dan payload berupa bytes mentah
+
+* codec kompresi dinegosiasikan di HELLO; payload ber-FLAG_CHUNKED
+dikirim sebagai rangkaian chunk yang masing-masing menyebut codec-nya
+sendiri (0 = apa adanya), jadi chunk yang tidak bisa dimampatkan
+tidak membuang CPU di sisi penerima
+
+* MGET/MUPLOAD memindahkan banyak file dalam satu frame: payload-nya
+rangkaian ENTRY (status, nama, ukuran) diikuti isi file, dengan status
+per entry sehingga satu file yang gagal tidak menggagalkan batch
+
+* SIGNATURE/DELTA adalah upload delta gaya rsync (lihat file_delta)
+"""
+
+MAGIC = b'FPB2'
+PROTOCOL_VERSION = 2
+
+HEADER = struct.Struct('!BBHQ')
+SMALL_PAYLOAD = 64*1024
+MAX_NAME_LEN = 0xFFFF
+
+# request opcodes
+OP_HELLO = 0x01
+OP_LIST = 0x02
+OP_GET = 0x03
+OP_UPLOAD = 0x04
+OP_UPLOAD_AT = 0x05
+OP_UPLOAD_STATUS = 0x06
+OP_CHECKSUM = 0x07
+OP_CACHE_STATS = 0x08
+OP_UPLOAD_HASH = 0x09
+OP_DELETE = 0x0A
+OP_STATS = 0x0B
+OP_MGET = 0x0C
+OP_MUPLOAD = 0x0D
+OP_SIGNATURE = 0x0E
+OP_DELTA = 0x0F
+
+# response opcodes
+OP_OK = 0x80
+OP_ERROR = 0x81
+
+# payload berisi JSON, bukan bytes file
+FLAG_JSON = 0x01
+# server menutup koneksi setelah respon ini (batas keep-alive tercapai)
+FLAG_CLOSE = 0x02
+# payload respon GET diawali RANGE(offset, ukuran total file)
+FLAG_RANGE = 0x04
+# body berupa rangkaian chunk (CHUNK + data); payload_len tetap ukuran asli.
+# Di request GET: minta body dikirim terkompresi dengan codec hasil HELLO.
+FLAG_CHUNKED = 0x08
+# Di request GET: minta validator isi file; sisa payload setelah RANGE adalah
+# nilai if-none-match (boleh kosong). Di respon: payload diawali ETAG + validator.
+FLAG_ETAG = 0x10
+
+# status respon GET bersyarat bila validator masih cocok (tanpa body)
+NOT_MODIFIED = 'NOT_MODIFIED'
+
+# payload GET: offset, panjang (0 = sampai akhir file)
+RANGE = struct.Struct('!QQ')
+# panjang validator (utf-8) yang mengikutinya
+ETAG = struct.Struct('!B')
+# awalan payload UPLOAD_AT: offset, ukuran total, id upload
+UPLOAD_AT = struct.Struct('!QQ16s')
+# payload UPLOAD_HASH: sha256 isi file (32 byte mentah), ukuran file
+UPLOAD_HASH = struct.Struct('!32sQ')
+# awalan tiap chunk: id codec (0 = tidak dimampatkan), ukuran asli, ukuran di wire
+CHUNK = struct.Struct('!BII')
+CHUNK_SIZE = 256*1024
+# awalan tiap entry MGET/MUPLOAD: status, panjang nama, ukuran; lalu nama dan isi
+# (isi entry berstatus ENTRY_ERROR adalah pesan error utf-8)
+ENTRY = struct.Struct('!BHQ')
+ENTRY_OK = 0
+ENTRY_ERROR = 1
+MAX_BATCH = 1024
+# respon SIGNATURE: ukuran blok, ukuran file; lalu per blok adler32 + blake2b 16 byte
+SIGNATURE = struct.Struct('!IQ')
+BLOCK_SIG = struct.Struct('!I16s')
+# awalan payload DELTA: sha256 file hasil, ukuran file hasil, ukuran blok signature
+DELTA = struct.Struct('!32sQI')
+# instruksi DELTA: jenis, blok pertama (COPY), jumlah blok (COPY) atau panjang literal
+# (LITERAL, diikuti byte literalnya)
+DELTA_OP = struct.Struct('!BQQ')
+DELTA_COPY = 0
+DELTA_LITERAL = 1
+MAX_CHUNK_SIZE = 4*1024*1024
+# chunk yang menyusut kurang dari 5% dikirim apa adanya
+MIN_SAVING = 0.05
+# setelah chunk yang tidak termampatkan, lewati sampai sekian chunk sebelum mencoba lagi
+MAX_SKIP = 16
+
+OPCODES = {
+    'HELLO': OP_HELLO,
+    'LIST': OP_LIST,
+    'GET': OP_GET,
+    'UPLOAD': OP_UPLOAD,
+    'UPLOAD_AT': OP_UPLOAD_AT,
+    'UPLOAD_STATUS': OP_UPLOAD_STATUS,
+    'CHECKSUM': OP_CHECKSUM,
+    'CACHE_STATS': OP_CACHE_STATS,
+    'UPLOAD_HASH': OP_UPLOAD_HASH,
+    'DELETE': OP_DELETE,
+    'STATS': OP_STATS,
+    'MGET': OP_MGET,
+    'MUPLOAD': OP_MUPLOAD,
+    'SIGNATURE': OP_SIGNATURE,
+    'DELTA': OP_DELTA,
+}
+OPCODE_NAMES = {opcode: name for name, opcode in OPCODES.items()}
+
+
+class ProtocolError(Exception):
+    pass
+
+
+class ConnectionClosed(ProtocolError):
+    """Peer menutup koneksi tepat di batas frame."""
+
+
+Codec = namedtuple('Codec', 'id compress decompress')
+
+
+def _zlib_decompress(data: bytes, size: int) -> bytes:
+    d = zlib.decompressobj()
+    out = d.decompress(data, size)
+    if not d.eof or d.unconsumed_tail:
+        raise ProtocolError('Corrupt zlib chunk')
+    return out
+
+
+# urutan = preferensi; codec lain cukup didaftarkan dengan register_codec
+CODECS = {
+    'zlib': Codec(1, lambda data: zlib.compress(data, 1), _zlib_decompress),
+}
+
+
+def register_codec(name: str, codec_id: int, compress, decompress) -> None:
+    """decompress(data, size) must refuse to produce more than size bytes."""
+    if not 0 < codec_id < 256 or any(c.id == codec_id for c in CODECS.values()):
+        raise ValueError(f'Codec id {codec_id} unavailable')
+    CODECS[name] = Codec(codec_id, compress, decompress)
+
+
+def negotiate_codec(offered: Iterable[str]) -> Optional[str]:
+    """First codec in the peer's preference order that we also speak."""
+    for name in offered or ():
+        if name in CODECS:
+            return name
+    return None
+
+
+class ChunkEncoder:
+    """Compress a stream chunk by chunk; chunks that do not shrink go out stored."""
+
+    def __init__(self, codec: str):
+        self.codec = CODECS[codec]
+        self.skip = 0
+        self.backoff = 0
+        self.raw_bytes = 0
+        self.wire_bytes = 0
+
+    def encode(self, data: bytes) -> bytes:
+        kind, body = 0, data
+        if self.skip:
+            self.skip -= 1
+        else:
+            packed = self.codec.compress(data)
+            if len(packed) <= len(data) * (1 - MIN_SAVING):
+                kind, body = self.codec.id, packed
+                self.backoff = 0
+            else:
+                # incompressible (e.g. random data): probe less and less often
+                self.backoff = min(self.backoff * 2 or 1, MAX_SKIP)
+                self.skip = self.backoff
+        self.raw_bytes += len(data)
+        self.wire_bytes += CHUNK.size + len(body)
+        return CHUNK.pack(kind, len(data), len(body)) + body
+
+
+def decode_chunk(kind: int, size: int, body: bytes) -> bytes:
+    if kind == 0:
+        data = body
+    else:
+        codec = next((c for c in CODECS.values() if c.id == kind), None)
+        if codec is None:
+            raise ProtocolError(f'Unknown codec id {kind}')
+        data = codec.decompress(body, size)
+    if len(data) != size:
+        raise ProtocolError('Chunk size mismatch')
+    return data
+
+
+def _check_chunk(size: int, wire_len: int, remaining: int) -> None:
+    if size > remaining or size > MAX_CHUNK_SIZE or wire_len > MAX_CHUNK_SIZE + 1024:
+        raise ProtocolError('Chunk exceeds frame')
+
+
+def recv_exact(sock: socket.socket, size: int) -> bytes:
+    buf = bytearray(size)
+    view = memoryview(buf)
+    received = 0
+    with phase('recv'):
+        while received < size:
+            n = sock.recv_into(view[received:], size - received)
+            if n == 0:
+                raise ProtocolError('Connection closed mid-frame')
+            received += n
+    return bytes(buf)
+
+
+def drain(sock: socket.socket, size: int) -> None:
+    if not size:
+        return
+    buf = bytearray(min(size, 1024*1024))
+    with phase('recv'):
+        while size:
+            n = sock.recv_into(buf, min(size, len(buf)))
+            if n == 0:
+                raise ProtocolError('Connection closed mid-frame')
+            size -= n
+
+
+def recv_to_file(sock: socket.socket, f, size: int, chunk_size: int = 1024*1024, digest=None) -> None:
+    buf = bytearray(min(size, chunk_size))
+    view = memoryview(buf)
+    while size:
+        with phase('recv'):
+            n = sock.recv_into(view, min(size, len(buf)))
+        if n == 0:
+            raise ProtocolError('Connection closed mid-frame')
+        with phase('disk'):
+            f.write(view[:n])
+        if digest is not None:
+            digest.update(view[:n])
+        size -= n
+
+
+def recv_chunks_to_file(sock: socket.socket, f, size: int, digest=None) -> int:
+    """Decode a FLAG_CHUNKED body of size raw bytes into f; returns bytes read off the wire."""
+    wire = 0
+    while size:
+        kind, raw_len, wire_len = CHUNK.unpack(recv_exact(sock, CHUNK.size))
+        _check_chunk(raw_len, wire_len, size)
+        body = recv_exact(sock, wire_len)
+        with phase('decode'):
+            data = decode_chunk(kind, raw_len, body)
+        with phase('disk'):
+            f.write(data)
+        if digest is not None:
+            digest.update(data)
+        size -= raw_len
+        wire += CHUNK.size + wire_len
+    return wire
+
+
+def drain_chunks(sock: socket.socket, size: int) -> None:
+    while size:
+        _, raw_len, wire_len = CHUNK.unpack(recv_exact(sock, CHUNK.size))
+        _check_chunk(raw_len, wire_len, size)
+        drain(sock, wire_len)
+        size -= raw_len
+
+
+def send_chunks(sock: socket.socket, f, count: int, encoder: ChunkEncoder) -> None:
+    while count:
+        with phase('disk'):
+            data = f.read(min(count, CHUNK_SIZE))
+        if not data:
+            raise ProtocolError('File shrank during send')
+        with phase('encode'):
+            chunk = encoder.encode(data)
+        with phase('send'):
+            sock.sendall(chunk)
+        count -= len(data)
+
+
+def pack_entry(name: str, size: int, status: int = ENTRY_OK) -> bytes:
+    raw = name.encode('utf-8')
+    if len(raw) > MAX_NAME_LEN:
+        raise ProtocolError('Name too long')
+    return ENTRY.pack(status, len(raw), size) + raw
+
+
+def recv_entry(sock: socket.socket) -> Tuple[int, str, int]:
+    status, name_len, size = ENTRY.unpack(recv_exact(sock, ENTRY.size))
+    return status, recv_exact(sock, name_len).decode('utf-8'), size
+
+
+async def read_entry_async(reader) -> Tuple[int, str, int]:
+    status, name_len, size = ENTRY.unpack(await reader.readexactly(ENTRY.size))
+    return status, (await reader.readexactly(name_len)).decode('utf-8'), size
+
+
+def pack_etag(etag: str) -> bytes:
+    raw = etag.encode('utf-8')
+    return ETAG.pack(len(raw)) + raw
+
+
+def recv_etag(sock: socket.socket) -> Tuple[str, int]:
+    """Validator prefix of a FLAG_ETAG response and the bytes it took."""
+    length, = ETAG.unpack(recv_exact(sock, ETAG.size))
+    return recv_exact(sock, length).decode('utf-8'), ETAG.size + length
+
+
+def pack_header(opcode: int, name: bytes = b'', payload_len: int = 0, flags: int = 0) -> bytes:
+    if len(name) > MAX_NAME_LEN:
+        raise ProtocolError('Name too long')
+    return HEADER.pack(opcode, flags, len(name), payload_len) + name
+
+
+def send_frame(sock: socket.socket, opcode: int, name: str = '', payload: bytes = b'', flags: int = 0) -> None:
+    header = pack_header(opcode, name.encode('utf-8'), len(payload), flags)
+    with phase('send'):
+        if len(payload) <= SMALL_PAYLOAD:
+            # one segment for small frames, so Nagle/delayed-ACK never splits them
+            sock.sendall(header + payload)
+            return
+        sock.sendall(header)
+        sock.sendall(payload)
+
+
+def encode_json(opcode: int, data: Dict, name: str = '', flags: int = 0) -> bytes:
+    with phase('encode'):
+        payload = json.dumps(data).encode('utf-8')
+    return pack_header(opcode, name.encode('utf-8'), len(payload), FLAG_JSON | flags) + payload
+
+
+def send_json(sock: socket.socket, opcode: int, data: Dict, name: str = '', flags: int = 0) -> None:
+    frame = encode_json(opcode, data, name, flags)
+    with phase('send'):
+        sock.sendall(frame)
+
+
+def recv_header(sock: socket.socket) -> Tuple[int, int, str, int]:
+    first = sock.recv(1)
+    if not first:
+        raise ConnectionClosed('Connection closed')
+    raw = first + recv_exact(sock, HEADER.size - 1)
+    opcode, flags, name_len, payload_len = HEADER.unpack(raw)
+    name = recv_exact(sock, name_len).decode('utf-8') if name_len else ''
+    return opcode, flags, name, payload_len
+
+
+def _check_payload(payload_len: int, limit: Optional[int]) -> None:
+    # reject before allocating: the length is a u64 straight from the peer
+    if limit is not None and payload_len > limit:
+        raise ProtocolError(f'Frame payload of {payload_len} bytes exceeds {limit}')
+
+
+def recv_frame(sock: socket.socket, limit: Optional[int] = None) -> Tuple[int, int, str, bytes]:
+    opcode, flags, name, payload_len = recv_header(sock)
+    _check_payload(payload_len, limit)
+    payload = recv_exact(sock, payload_len) if payload_len else b''
+    return opcode, flags, name, payload
+
+
+async def read_header_async(reader) -> Tuple[int, int, str, int]:
+    try:
+        raw = await reader.readexactly(HEADER.size)
+    except asyncio.IncompleteReadError as e:
+        if not e.partial:
+            raise ConnectionClosed('Connection closed')
+        raise
+    opcode, flags, name_len, payload_len = HEADER.unpack(raw)
+    name = (await reader.readexactly(name_len)).decode('utf-8') if name_len else ''
+    return opcode, flags, name, payload_len
+
+
+async def read_chunk_async(reader, remaining: int) -> Tuple[int, int, bytes]:
+    kind, raw_len, wire_len = CHUNK.unpack(await reader.readexactly(CHUNK.size))
+    _check_chunk(raw_len, wire_len, remaining)
+    return kind, raw_len, await reader.readexactly(wire_len)
+
+
+async def read_frame_async(reader, limit: Optional[int] = None) -> Tuple[int, int, str, bytes]:
+    opcode, flags, name, payload_len = await read_header_async(reader)
+    _check_payload(payload_len, limit)
+    payload = await reader.readexactly(payload_len) if payload_len else b''
+    return opcode, flags, name, payload
+
+
+def decode_json(payload: bytes) -> Dict:
+    if not payload:
+        return {}
+    with phase('parse'):
+        return json.loads(payload.decode('utf-8'))